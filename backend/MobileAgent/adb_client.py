@@ -0,0 +1,477 @@
+import functools
+import os
+import re
+import select
+import shlex
+import socket
+import struct
+import subprocess
+import threading
+import time
+import uuid
+
+from MobileAgent import device_backend, tracing
+
+
+class AdbError(Exception):
+    pass
+
+
+class CommandSentError(AdbError):
+    """命令已经写入设备端 shell 之后连接出错: 命令可能已经执行 (如 input tap)，不能重试"""
+
+
+def _send_request(sock, request):
+    # adb 服务端协议: 4 位十六进制长度 + 请求内容
+    payload = request.encode("utf-8")
+    sock.sendall(b"%04x" % len(payload) + payload)
+
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise AdbError(f"connection closed after {len(buf)}/{n} bytes")
+        buf += chunk
+    return bytes(buf)
+
+
+def _recv_all(sock):
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _read_status(sock):
+    status = _recv_exact(sock, 4)
+    if status == b"OKAY":
+        return
+    if status == b"FAIL":
+        length = int(_recv_exact(sock, 4), 16)
+        raise AdbError(_recv_exact(sock, length).decode("utf-8", "replace"))
+    raise AdbError(f"unexpected adb server status: {status!r}")
+
+
+class ShellChannel:
+    """
+    常驻的 `shell:sh` 通道。命令逐条写入 sh 的 stdin，输出以随机标记结尾，
+    因此一个 socket 可以连续执行多条命令，省去每次建立 transport 的开销。
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.marker = "__ADB_END_%s__" % uuid.uuid4().hex[:12]
+        self._buf = b""
+
+    def alive(self):
+        """对端已关闭的 socket 可读且读到 EOF；写命令之前检查，避免把命令写进已断开的通道"""
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+            return not readable or self.sock.recv(1, socket.MSG_PEEK) != b""
+        except (OSError, ValueError):
+            return False
+
+    def run(self, command):
+        line = f'( {command} ) </dev/null 2>&1; echo "{self.marker}$?"\n'
+        # 写入失败 (OSError) 时命令没有完整送达，调用方可以重建通道再执行
+        self.sock.sendall(line.encode("utf-8"))
+        marker = self.marker.encode("utf-8")
+        try:
+            while True:
+                idx = self._buf.find(marker)
+                if idx >= 0:
+                    end = self._buf.find(b"\n", idx)
+                    if end >= 0:
+                        break
+                chunk = self.sock.recv(65536)
+                if not chunk:
+                    raise AdbError("shell channel closed")
+                self._buf += chunk
+        except (OSError, AdbError) as e:
+            raise CommandSentError(f"shell channel failed after sending {command!r}: {e}") from e
+        output = self._buf[:idx]
+        self._buf = self._buf[end + 1:]
+        return output.decode("utf-8", "replace")
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class AdbClient:
+    """
+    直接连接 adb server (默认 127.0.0.1:5037) 的客户端，不再为每条命令
+    启动 shell 和 adb 进程。每个设备保持一条常驻 shell 通道。
+    """
+
+    def __init__(self, serial=None, host="127.0.0.1", port=5037, timeout=10):
+        self.serial = serial
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._shell = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _host_request(self, request):
+        sock = self._connect()
+        try:
+            _send_request(sock, request)
+            _read_status(sock)
+            length = int(_recv_exact(sock, 4), 16)
+            return _recv_exact(sock, length).decode("utf-8", "replace")
+        finally:
+            sock.close()
+
+    def _open(self, service):
+        sock = self._connect()
+        try:
+            if self.serial:
+                _send_request(sock, f"host:transport:{self.serial}")
+            else:
+                _send_request(sock, "host:transport-any")
+            _read_status(sock)
+            _send_request(sock, service)
+            _read_status(sock)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def version(self):
+        return int(self._host_request("host:version"), 16)
+
+    def devices(self):
+        text = self._host_request("host:devices")
+        result = []
+        for line in text.splitlines():
+            parts = line.split("\t")
+            if len(parts) == 2:
+                result.append((parts[0], parts[1]))
+        return result
+
+    def shell(self, command):
+        with self._lock:
+            if self._shell is not None and not self._shell.alive():
+                self._shell.close()
+                self._shell = None
+            if self._shell is None:
+                self._shell = ShellChannel(self._open("shell:sh"))
+            try:
+                return self._shell.run(command)
+            except CommandSentError:
+                # 命令可能已经执行，不重试；下一条命令使用新通道
+                self._shell.close()
+                self._shell = None
+                raise
+            except (OSError, AdbError):
+                # 写入时通道已断开，命令没有送达: 重建一次
+                self._shell.close()
+                self._shell = ShellChannel(self._open("shell:sh"))
+                return self._shell.run(command)
+
+    def shell_oneshot(self, command):
+        sock = self._open(f"shell:{command}")
+        try:
+            return _recv_all(sock).decode("utf-8", "replace")
+        finally:
+            sock.close()
+
+    def exec_out(self, command):
+        sock = self._open(f"exec:{command}")
+        try:
+            return _recv_all(sock)
+        finally:
+            sock.close()
+
+    def open_exec(self, command):
+        """返回已连接到 exec: 服务的 socket，用于读取持续输出的数据流 (如 screenrecord)"""
+        return self._open(f"exec:{command}")
+
+    def pull(self, remote_path):
+        sock = self._open("sync:")
+        try:
+            path = remote_path.encode("utf-8")
+            sock.sendall(b"RECV" + struct.pack("<I", len(path)) + path)
+            chunks = []
+            while True:
+                header = _recv_exact(sock, 8)
+                tag, length = header[:4], struct.unpack("<I", header[4:])[0]
+                if tag == b"DATA":
+                    chunks.append(_recv_exact(sock, length))
+                elif tag == b"DONE":
+                    break
+                elif tag == b"FAIL":
+                    raise AdbError(_recv_exact(sock, length).decode("utf-8", "replace"))
+                else:
+                    raise AdbError(f"unexpected sync response: {tag!r}")
+            sock.sendall(b"QUIT" + struct.pack("<I", 0))
+            return b"".join(chunks)
+        finally:
+            sock.close()
+
+    def close(self):
+        with self._lock:
+            if self._shell is not None:
+                self._shell.close()
+                self._shell = None
+
+
+##################################### 连接池与 CLI 回退 #####################################
+
+_clients = {}
+_clients_lock = threading.Lock()
+_unavailable_until = {}
+RETRY_AFTER = 5.0
+
+
+def native_enabled():
+    return os.getenv("ADB_NATIVE", "1") != "0"
+
+
+def parse_adb_path(adb_path):
+    """从 adb_path (如 'adb -s emulator-5554 -P 5038') 中解析 serial / server 地址"""
+    serial = os.getenv("ANDROID_SERIAL")
+    host = os.getenv("ANDROID_ADB_SERVER_ADDRESS", "127.0.0.1")
+    port = int(os.getenv("ANDROID_ADB_SERVER_PORT", "5037"))
+    match = re.search(r"(?:^|\s)-s\s+(\S+)", adb_path)
+    if match:
+        serial = match.group(1)
+    match = re.search(r"(?:^|\s)-H\s+(\S+)", adb_path)
+    if match:
+        host = match.group(1)
+    match = re.search(r"(?:^|\s)-P\s+(\d+)", adb_path)
+    if match:
+        port = int(match.group(1))
+    return serial, host, port
+
+
+def get_client(adb_path):
+    if not native_enabled():
+        return None
+    key = parse_adb_path(adb_path)
+    with _clients_lock:
+        if _unavailable_until.get(key, 0) > time.monotonic():
+            return None
+        client = _clients.get(key)
+        if client is None:
+            serial, host, port = key
+            client = AdbClient(serial=serial, host=host, port=port)
+            _clients[key] = client
+    return client
+
+
+def _mark_unavailable(adb_path, error):
+    key = parse_adb_path(adb_path)
+    with _clients_lock:
+        _unavailable_until[key] = time.monotonic() + RETRY_AFTER
+        client = _clients.pop(key, None)
+    if client is not None:
+        client.close()
+    print(f"adb native client unavailable ({error}), falling back to adb CLI")
+
+
+def close_all():
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+def quote_adb_path(adb_path):
+    """
+    含空格的 adb 可执行文件路径加引号 (如 C:\\Program Files\\platform-tools\\adb，带不带 .exe 都一样)；
+    'adb -P 5038' 这样带参数的命令不加引号，除非它本身就是一个存在的文件。
+    """
+    if " " not in adb_path or adb_path.startswith('"'):
+        return adb_path
+    if os.path.exists(adb_path) or not re.search(r"\s-\w", adb_path):
+        return f'"{adb_path}"'
+    return adb_path
+
+
+def adb_argv(adb_path, *args):
+    """
+    CLI 回退时的参数列表。命令作为单个参数交给 adb，不经过本机 shell 再解析一次，
+    因此与原生通道一样，命令字符串只按设备端 sh 的规则转义。
+    """
+    if os.name == "nt":
+        argv = [part.strip('"') for part in shlex.split(adb_path, posix=False)]
+    else:
+        argv = shlex.split(adb_path)
+    return argv + list(args)
+
+
+##################################### 命令记录 #####################################
+
+_recorder = threading.local()
+
+
+class record_commands:
+    """
+    记录当前线程内执行的 adb 命令 (轨迹记录用)，其他 runner 的线程不受影响:
+        with adb_client.record_commands() as commands:
+            execute_action(...)
+    """
+
+    def __enter__(self):
+        self._previous = getattr(_recorder, "commands", None)
+        self.commands = _recorder.commands = []
+        return self.commands
+
+    def __exit__(self, *exc):
+        _recorder.commands = self._previous
+
+
+def _recorded(kind):
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(adb_path, command, *args):
+            commands = getattr(_recorder, "commands", None)
+            trace = tracing.current()
+            if commands is None and trace is None:
+                return fn(adb_path, command, *args)
+            start = time.perf_counter()
+            try:
+                return fn(adb_path, command, *args)
+            finally:
+                end = time.perf_counter()
+                if commands is not None:
+                    commands.append({"kind": kind, "command": command, "ms": round((end - start) * 1000, 2)})
+                if trace is not None:
+                    trace.add(f"adb {kind}", start, end, cat="adb", command=command)
+        return wrapper
+    return decorate
+
+
+@_recorded("shell")
+def shell(adb_path, command):
+    backend, serial = device_backend.resolve(adb_path)
+    if backend is not None:
+        return backend.shell(command, serial)
+    client = get_client(adb_path)
+    if client is not None:
+        try:
+            return client.shell(command)
+        except CommandSentError:
+            # 不能再用 CLI 执行一遍 (input tap / swipe / text 会在设备上重复)
+            raise
+        except (OSError, AdbError) as e:
+            _mark_unavailable(adb_path, e)
+    result = subprocess.run(adb_argv(adb_path, "shell", command), capture_output=True,
+                            text=True, encoding="utf-8", errors="replace")
+    return result.stdout
+
+
+def devices(adb_path):
+    """返回 [(serial, state), ...]，等价于 `adb devices`"""
+    backend, _ = device_backend.resolve(adb_path)
+    if backend is not None:
+        return backend.devices()
+    client = get_client(adb_path)
+    if client is not None:
+        try:
+            return client.devices()
+        except (OSError, AdbError) as e:
+            _mark_unavailable(adb_path, e)
+    result = subprocess.run(adb_argv(adb_path, "devices"), capture_output=True,
+                            text=True, encoding="utf-8", errors="replace")
+    found = []
+    for line in result.stdout.splitlines()[1:]:
+        parts = line.split()
+        if len(parts) >= 2:
+            found.append((parts[0], parts[1]))
+    return found
+
+
+@_recorded("exec-out")
+def exec_out(adb_path, command):
+    backend, serial = device_backend.resolve(adb_path)
+    if backend is not None:
+        return backend.exec_out(command, serial)
+    client = get_client(adb_path)
+    if client is not None:
+        try:
+            return client.exec_out(command)
+        except (OSError, AdbError) as e:
+            _mark_unavailable(adb_path, e)
+    result = subprocess.run(adb_argv(adb_path, "exec-out", command), capture_output=True)
+    return result.stdout
+
+
+class ExecStream:
+    """exec-out 数据流: read(n) 返回最多 n 字节，流结束时返回空字节串"""
+
+    def __init__(self, sock=None, process=None):
+        self.sock = sock
+        self.process = process
+        if sock is not None:
+            # 画面静止时 screenrecord 可能长时间没有输出，不能沿用命令超时
+            sock.settimeout(None)
+
+    def read(self, n=65536):
+        if self.sock is not None:
+            return self.sock.recv(n)
+        return self.process.stdout.read1(n)
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+
+
+def exec_stream(adb_path, command):
+    if device_backend.resolve(adb_path)[0] is not None:
+        raise AdbError("exec-out streams are not supported by simulated devices")
+    client = get_client(adb_path)
+    if client is not None:
+        try:
+            return ExecStream(sock=client.open_exec(command))
+        except (OSError, AdbError) as e:
+            _mark_unavailable(adb_path, e)
+    process = subprocess.Popen(adb_argv(adb_path, "exec-out", command), stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL)
+    return ExecStream(process=process)
+
+
+@_recorded("pull")
+def pull(adb_path, remote_path, local_path):
+    """与 `adb pull` 一致: local_path 为目录时保存为同名文件"""
+    backend, serial = device_backend.resolve(adb_path)
+    if backend is not None:
+        data = backend.pull(remote_path, serial)
+        if os.path.isdir(local_path):
+            local_path = os.path.join(local_path, os.path.basename(remote_path))
+        with open(local_path, "wb") as f:
+            f.write(data)
+        return
+    client = get_client(adb_path)
+    if client is not None:
+        try:
+            data = client.pull(remote_path)
+        except (OSError, AdbError) as e:
+            _mark_unavailable(adb_path, e)
+        else:
+            if os.path.isdir(local_path):
+                local_path = os.path.join(local_path, os.path.basename(remote_path))
+            with open(local_path, "wb") as f:
+                f.write(data)
+            return
+    subprocess.run(adb_argv(adb_path, "pull", remote_path, local_path), capture_output=True)
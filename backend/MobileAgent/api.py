@@ -1,12 +1,19 @@
 import base64
-import requests
+from MobileAgent.http_client import get_inference_client
+from MobileAgent.retry import post_with_retry
+from MobileAgent.streaming import stream_chat
 
-def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
+def encode_image(image):
+    # 支持文件路径、内存中的图片字节或 screen.Frame
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return base64.b64encode(image).decode('utf-8')
+    if hasattr(image, "data"):
+        return base64.b64encode(image.data).decode('utf-8')
+    with open(image, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode('utf-8')
 
 
-def inference_chat_uitars(chat, model, api_url, token):
+def inference_chat_uitars(chat, model, api_url, token, stream=False, on_update=None):
     headers = {
         "Content-Type": "application/json",
         'Accept': 'application/json',
@@ -30,24 +37,15 @@ def inference_chat_uitars(chat, model, api_url, token):
             "content": message["content"]
         })
 
-    while True:
-        try:
-            res = requests.post(api_url, headers=headers, json=data)
-            res_json = res.json()
-            res_content = res_json['choices'][0]['message']['content']
-        except:
-            print("Network Error:")
-            try:
-                print(res.json())
-            except:
-                print("Request Failed")
-        else:
-            break
-    
-    return res_content
+    if stream:
+        # 流式: Action 行一完整就返回 (后端开启 cancel_on_disconnect 时同时取消剩余生成)
+        return stream_chat(get_inference_client(api_url), api_url, data, headers=headers, on_update=on_update).output()
 
+    res_json = post_with_retry(get_inference_client(api_url), api_url, headers=headers, json=data)
+    return res_json['choices'][0]['message']['content']
 
-def inference_chat(chat, model, api_url, token):
+
+def inference_chat(chat, model, api_url, token, stream=False, on_update=None):
     headers = {
         "Content-Type": "application/json",
         'Accept': 'application/json',
@@ -71,18 +69,9 @@ def inference_chat(chat, model, api_url, token):
     #         "content": message["content"]
     #     })
 
-    while True:
-        try:
-            res = requests.post(api_url, headers=headers, json=data)
-            res_json = res.json()
-            res_content = res_json['choices'][0]['message']['content']
-        except:
-            print("Network Error:")
-            try:
-                print(res.json())
-            except:
-                print("Request Failed")
-        else:
-            break
+    if stream:
+        # 流式: Action 行一完整就返回 (后端开启 cancel_on_disconnect 时同时取消剩余生成)
+        return stream_chat(get_inference_client(api_url), api_url, data, headers=headers, on_update=on_update).output()
 
-    return res_content
\ No newline at end of file
+    res_json = post_with_retry(get_inference_client(api_url), api_url, headers=headers, json=data)
+    return res_json['choices'][0]['message']['content']
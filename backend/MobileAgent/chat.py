@@ -1,5 +1,5 @@
-import copy
 from MobileAgent.api import encode_image
+from MobileAgent.codec import guess_mime
 from fontTools.ttLib.tables.ttProgram import instructions
 import re
 
@@ -35,6 +35,70 @@ If you want to exit an app, use the action \"press_home()\"
 
 # messages = []
 
+
+class ChatHistory:
+    """
+    不可变的对话历史 (持久化链表): 追加一轮得到新的历史，旧版本保持不变，
+    两个版本共享之前的所有轮次，追加的开销与历史长度无关，不再每次 deepcopy 整个历史。
+    可以像 list 一样遍历、取下标、求长度；各轮的内容在版本之间共享，不要原地修改。
+    """
+
+    __slots__ = ("_turn", "_parent", "_len")
+
+    def __init__(self, turns=()):
+        self._turn, self._parent, self._len = None, None, 0
+        turns = list(turns)
+        if turns:
+            # 在新的空历史上建链，再把链头的字段复制到 self
+            head = ChatHistory().extend(turns)
+            self._turn, self._parent, self._len = head._turn, head._parent, head._len
+
+    @classmethod
+    def of(cls, chat_history):
+        return chat_history if isinstance(chat_history, ChatHistory) else cls(chat_history)
+
+    def append(self, turn):
+        node = ChatHistory.__new__(ChatHistory)
+        node._turn, node._parent, node._len = turn, self, self._len + 1
+        return node
+
+    def extend(self, turns):
+        node = self
+        for turn in turns:
+            node = node.append(turn)
+        return node
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.to_list()[index]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("chat history index out of range")
+        node = self
+        for _ in range(self._len - 1 - index):
+            node = node._parent
+        return node._turn
+
+    def to_list(self):
+        """按顺序返回各轮 (浅拷贝列表，元素与历史共享)"""
+        turns = [None] * self._len
+        node = self
+        while node is not None and node._len:
+            turns[node._len - 1] = node._turn
+            node = node._parent
+        return turns
+
+    def __repr__(self):
+        return f"ChatHistory({self._len} turns)"
+
+
 def init_action_chat_uitars(instruction):
     prompt = MOBILE_USE.format(instruction=instruction,language='Chinese')
     messages = [
@@ -70,7 +134,6 @@ def init_memory_chat():
 
 
 def add_response(role, prompt, chat_history, image=None):
-    new_chat_history = copy.deepcopy(chat_history)
     if image:
         base64_image = encode_image(image)
         content = [
@@ -81,7 +144,7 @@ def add_response(role, prompt, chat_history, image=None):
             {
                 "type": "image_url", 
                 "image_url": {
-                    "url": f"data:image/jpeg;base64,{base64_image}"
+                    "url": f"data:{guess_mime(image)};base64,{base64_image}"
                 }
             },
         ]
@@ -92,17 +155,12 @@ def add_response(role, prompt, chat_history, image=None):
             "text": prompt
             },
         ]
-    new_chat_history.append([role, content])
-    return new_chat_history
+    return ChatHistory.of(chat_history).append([role, content])
 
 def add_response_uitars(chat_history,messages):
-    new_chat_history = copy.deepcopy(chat_history)
-    for prompt in messages:
-        new_chat_history.append(prompt)
-    return new_chat_history
+    return ChatHistory.of(chat_history).extend(messages)
 
 def add_response_two_image(role, prompt, chat_history, image):
-    new_chat_history = copy.deepcopy(chat_history)
 
     base64_image1 = encode_image(image[0])
     base64_image2 = encode_image(image[1])
@@ -114,19 +172,18 @@ def add_response_two_image(role, prompt, chat_history, image):
         {
             "type": "image_url", 
             "image_url": {
-                "url": f"data:image/jpeg;base64,{base64_image1}"
+                "url": f"data:{guess_mime(image[0])};base64,{base64_image1}"
             }
         },
         {
             "type": "image_url", 
             "image_url": {
-                "url": f"data:image/jpeg;base64,{base64_image2}"
+                "url": f"data:{guess_mime(image[1])};base64,{base64_image2}"
             }
         },
     ]
 
-    new_chat_history.append([role, content])
-    return new_chat_history
+    return ChatHistory.of(chat_history).append([role, content])
 
 
 def print_status(chat_history):
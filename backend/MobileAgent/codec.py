@@ -0,0 +1,104 @@
+import base64
+import os
+import time
+
+MIME_TYPES = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+_MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"RIFF", "image/webp"),
+)
+
+_EXTENSIONS = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp"}
+
+
+def sniff_mime(data):
+    """按文件头判断图片类型，未知时按 PNG 处理"""
+    for magic, mime in _MAGIC:
+        if bytes(data[:len(magic)]) == magic:
+            return mime
+    return "image/png"
+
+
+def guess_mime(image):
+    """encode_image 可接受的输入 (路径 / 字节 / screen.Frame) 对应的 MIME 类型"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return sniff_mime(image)
+    if hasattr(image, "data"):
+        return "image/png"
+    return _EXTENSIONS.get(os.path.splitext(str(image))[1].lower(), "image/png")
+
+
+class ImageCodec:
+    """
+    截图编码格式: PNG / JPEG / WEBP，可选质量。
+    同一帧同一编码只编码一次 (结果缓存在 Frame 内)。
+    """
+
+    def __init__(self, format="PNG", quality=None):
+        format = format.upper()
+        if format == "JPG":
+            format = "JPEG"
+        if format not in MIME_TYPES:
+            raise ValueError(f"unsupported image codec: {format}")
+        self.format = format
+        # PNG 为无损，忽略 quality
+        self.quality = quality if format != "PNG" else None
+
+    @classmethod
+    def parse(cls, spec):
+        """解析 "png" / "jpeg:85" / "webp:80" 这样的配置"""
+        format, _, quality = spec.strip().partition(":")
+        return cls(format or "PNG", int(quality) if quality else None)
+
+    @property
+    def mime(self):
+        return MIME_TYPES[self.format]
+
+    def encode(self, frame):
+        return frame.encode(self.format, self.quality)
+
+    def b64(self, frame):
+        return base64.b64encode(self.encode(frame)).decode("utf-8")
+
+    def data_url(self, frame):
+        return frame.data_url(self.mime, self.format, self.quality)
+
+    def __repr__(self):
+        return f"{self.format.lower()}:{self.quality}" if self.quality else self.format.lower()
+
+
+class CodecConfig:
+    """
+    按图片角色选择编码: current 为本步的截图，history 为历史截图。
+    默认取环境变量 IMAGE_CODEC (如 png、jpeg:85、webp:80)，IMAGE_CODEC_HISTORY 未设置时与 current 相同。
+    """
+
+    def __init__(self, current=None, history=None):
+        current = current or os.getenv("IMAGE_CODEC", "png")
+        history = history or os.getenv("IMAGE_CODEC_HISTORY") or current
+        self.current = current if isinstance(current, ImageCodec) else ImageCodec.parse(current)
+        self.history = history if isinstance(history, ImageCodec) else ImageCodec.parse(history)
+        if repr(self.history) == repr(self.current):
+            # 同一编码共用一个对象，调用方可以用 `is` 判断截图进入历史时是否需要重新编码
+            self.history = self.current
+        self.encode_ms = 0.0
+        self.payload_bytes = 0
+
+    def codec(self, role):
+        return self.history if role == "history" else self.current
+
+    def data_url(self, frame, role="current"):
+        start = time.perf_counter()
+        url = self.codec(role).data_url(frame)
+        self.encode_ms += (time.perf_counter() - start) * 1000
+        self.payload_bytes += len(url)
+        return url
+
+    def __repr__(self):
+        return f"CodecConfig(current={self.current}, history={self.history})"
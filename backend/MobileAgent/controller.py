@@ -1,63 +1,85 @@
 import os
 import time
-import subprocess
+import base64
 from PIL import Image
 import ast,re
+from MobileAgent import adb_client
+from MobileAgent.screen import capture_screenshot
+from MobileAgent.settle import Settler, FIXED_SLEEP
+from MobileAgent.ui_state import UiStateProbe, TRANSITION_ACTIONS
 
 
-def get_screenshot(adb_path):
-    # 截图（PNG）
-    command = adb_path + " shell screencap -p /sdcard/screenshot.png"
-    subprocess.run(command, capture_output=True, text=True, shell=True)
-    # 拉取
-    command = adb_path + " pull /sdcard/screenshot.png ./screenshot"
-    subprocess.run(command, capture_output=True, text=True, shell=True)
-    # 直接使用 PNG，不要转 JPG
-    image_path = "./screenshot/screenshot.png"
-    # 确保是 PNG 格式
-    # img = Image.open(image_path)
-    # img.save("./screenshot/screenshot.png", "PNG")
-
+def get_screenshot(adb_path, save_to=None):
+    # 截图直接读入内存，返回 Frame，不再写入 /sdcard 后 pull
+    frame = capture_screenshot(adb_path)
+    # 仍需要截图文件的脚本传入 save_to；raw 模式下 frame.data 要做一次 PNG 编码，不需要文件时不写
+    if save_to is not None:
+        with open(save_to, "wb") as f:
+            f.write(frame.data)
+    return frame
 
 
 def tap(adb_path, x, y):
-    command = adb_path + f" shell input tap {x} {y}"
-    subprocess.run(command, capture_output=True, text=True, shell=True)
+    adb_client.shell(adb_path, f"input tap {x} {y}")
 
 
-def type(adb_path, text):
-    text = text.replace("\\n", "_").replace("\n", "_")
+# 每次 `input text` 最多输入的字符数，过长的参数在部分机型上会被截断
+INPUT_TEXT_CHUNK = 100
+
+
+def _quote_input_text(text):
+    # `input text` 用 %s 表示空格；整体用单引号交给设备端 sh，单引号写成 '\''
+    return "'" + text.replace(" ", "%s").replace("'", "'\\''") + "'"
+
+
+def _split_runs(text):
+    # 按可打印 ASCII / 其他字符切分成连续片段，保持原有顺序
+    runs = []
     for char in text:
-        if char == ' ':
-            command = adb_path + f" shell input text %s"
-            subprocess.run(command, capture_output=True, text=True, shell=True)
-        elif char == '_':
-            command = adb_path + f" shell input keyevent 66"
-            subprocess.run(command, capture_output=True, text=True, shell=True)
-        elif 'a' <= char <= 'z' or 'A' <= char <= 'Z' or char.isdigit():
-            command = adb_path + f" shell input text {char}"
-            subprocess.run(command, capture_output=True, text=True, shell=True)
-        elif char in '-.,!?@\'°/:;()':
-            command = adb_path + f" shell input text \"{char}\""
-            subprocess.run(command, capture_output=True, text=True, shell=True)
+        is_ascii = " " <= char <= "~"
+        if runs and runs[-1][0] == is_ascii:
+            runs[-1][1].append(char)
         else:
-            command = adb_path + f" shell am broadcast -a ADB_INPUT_TEXT --es msg \"{char}\""
-            subprocess.run(command, capture_output=True, text=True, shell=True)
+            runs.append((is_ascii, [char]))
+    return [(is_ascii, "".join(chars)) for is_ascii, chars in runs]
+
+
+def type(adb_path, text):
+    """
+    批量输入文本: ASCII 片段按 INPUT_TEXT_CHUNK 分块走 `input text`，
+    中文等其他字符整段 base64 后通过 ADBKeyboard 一次广播；换行 (含字面量 "\\n") 转为回车。
+    """
+    lines = text.replace("\\n", "\n").split("\n")
+    for line_idx, line in enumerate(lines):
+        if line_idx > 0:
+            adb_client.shell(adb_path, "input keyevent 66")
+        for is_ascii, run in _split_runs(line):
+            if is_ascii:
+                for i in range(0, len(run), INPUT_TEXT_CHUNK):
+                    adb_client.shell(adb_path, "input text " + _quote_input_text(run[i:i + INPUT_TEXT_CHUNK]))
+            else:
+                msg = base64.b64encode(run.encode("utf-8")).decode("ascii")
+                adb_client.shell(adb_path, f"am broadcast -a ADB_INPUT_B64 --es msg {msg}")
 
 
 def slide(adb_path, x1, y1, x2, y2):
-    command = adb_path + f" shell input swipe {x1} {y1} {x2} {y2} 500"
-    subprocess.run(command, capture_output=True, text=True, shell=True)
+    adb_client.shell(adb_path, f"input swipe {x1} {y1} {x2} {y2} 500")
 
 
 def back(adb_path):
-    command = adb_path + f" shell input keyevent 4"
-    subprocess.run(command, capture_output=True, text=True, shell=True)
+    adb_client.shell(adb_path, "input keyevent 4")
     
     
 def home(adb_path):
-    command = adb_path + f" shell am start -a android.intent.action.MAIN -c android.intent.category.HOME"
-    subprocess.run(command, capture_output=True, text=True, shell=True)
+    adb_client.shell(adb_path, "am start -a android.intent.action.MAIN -c android.intent.category.HOME")
+
+
+def open_app(adb_path, app_name):
+    # 只支持包名 (如 com.netease.cloudmusic)，通过 monkey 启动其 LAUNCHER Activity
+    if not re.fullmatch(r"[A-Za-z_]\w*(\.[A-Za-z_]\w*)+", app_name):
+        print(f"open_app only supports package names, got: {app_name}")
+        return
+    adb_client.shell(adb_path, f"monkey -p {app_name} -c android.intent.category.LAUNCHER 1")
 
 
 def long_press(adb_path, x, y, duration=1000):
@@ -68,24 +90,23 @@ def long_press(adb_path, x, y, duration=1000):
         x, y: 屏幕坐标
         duration: 持续时间（毫秒）
     """
-    command = f"{adb_path} shell input swipe {x} {y} {x} {y} {duration}"
-    subprocess.run(command, capture_output=True, text=True, shell=True)
+    adb_client.shell(adb_path, f"input swipe {x} {y} {x} {y} {duration}")
 
 
 def scroll(adb_path, x, y, direction="down", distance=500, duration=300):
 
     if direction == "down":
-        command = f"{adb_path} shell input swipe {x} {y} {x} {y - distance} {duration}"
+        command = f"input swipe {x} {y} {x} {y - distance} {duration}"
     elif direction == "up":
-        command = f"{adb_path} shell input swipe {x} {y} {x} {y + distance} {duration}"
+        command = f"input swipe {x} {y} {x} {y + distance} {duration}"
     elif direction == "right":
-        command = f"{adb_path} shell input swipe {x} {y} {x - distance} {y} {duration}"
+        command = f"input swipe {x} {y} {x - distance} {y} {duration}"
     elif direction == "left":
-        command = f"{adb_path} shell input swipe {x} {y} {x + distance} {y} {duration}"
+        command = f"input swipe {x} {y} {x + distance} {y} {duration}"
     else:
         print(f"Invalid scroll direction: {direction}")
         return
-    subprocess.run(command, capture_output=True, text=True, shell=True)
+    adb_client.shell(adb_path, command)
 
 
 
@@ -98,11 +119,16 @@ def drag(adb_path, x1, y1, x2, y2, duration=300):
         x2, y2: 结束坐标
         duration: 拖拽持续时间（毫秒）
     """
-    command = f"{adb_path} shell input swipe {x1} {y1} {x2} {y2} {duration}"
-    subprocess.run(command, capture_output=True, text=True, shell=True)
+    adb_client.shell(adb_path, f"input swipe {x1} {y1} {x2} {y2} {duration}")
 
 
-def execute_action(action, adb_path):
+def execute_action(action, adb_path, settler=None, probe=None):
+    """
+    执行一个动作并等待界面稳定。settler 为 settle.Settler，未传入时按 adb_path 新建一个；
+    环境变量 SETTLE_MODE=fixed 时恢复原来的固定 sleep(2)。
+    open_app / press_home / press_back 优先用 ui_state.UiStateProbe 查询系统状态判断切换结束，
+    查询失败或没有发生 Activity / 窗口切换时再退回画面比对。
+    """
     try:
         if not action or not str(action).strip():
             print("Empty action, skip")
@@ -126,6 +152,15 @@ def execute_action(action, adb_path):
                 print(f"Invalid box format: {box_str}")
                 return (0.0, 0.0)
 
+        before = None
+        if action_type in TRANSITION_ACTIONS and os.getenv("SETTLE_MODE", "adaptive") != "fixed":
+            if probe is None:
+                probe = UiStateProbe(adb_path)
+            try:
+                before = probe.snapshot()
+            except Exception as e:
+                print(f"UI state probe failed: {e}")
+
         # 后续执行动作...
         if action_type == "click":
             box = parse_box(kwargs.get("start_box", [0, 0]))
@@ -155,6 +190,9 @@ def execute_action(action, adb_path):
         elif action_type == "press_back":
             back(adb_path)
 
+        elif action_type == "open_app":
+            open_app(adb_path, kwargs.get("app_name", ""))
+
         elif action_type == "finished":
             print("任务已完成:", kwargs.get("content", ""))
             return "STOP"
@@ -166,7 +204,22 @@ def execute_action(action, adb_path):
         else:
             print(f"Unknown action type: {action_type}")
 
-        time.sleep(2)
+        if before is not None:
+            try:
+                result = probe.wait_for_transition(before, action_type)
+                print(f"Transition {result}")
+                # 焦点没有变化 (如应用内的返回) 时界面内容可能仍在变化，继续用画面比对等待
+                if result.idle and result.changed:
+                    return None
+            except Exception as e:
+                print(f"UI state probe failed: {e}")
+
+        if os.getenv("SETTLE_MODE", "adaptive") == "fixed":
+            time.sleep(FIXED_SLEEP)
+        else:
+            if settler is None:
+                settler = Settler(adb_path)
+            print(f"Settle {settler.wait(action_type)}")
         return None
 
     except Exception as e:
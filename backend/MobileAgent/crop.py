@@ -1,4 +1,5 @@
 import math
+import os
 import cv2
 import numpy as np
 from PIL import Image, ImageDraw
@@ -70,8 +71,17 @@ def calculate_iou(box1, box2):
     return iou
 
 
-def crop(image, box, i, text_data=None):
-    image = Image.open(image)
+def _open_image(image):
+    # 支持文件路径、PIL Image 或 screen.Frame，后两者不经过磁盘
+    if isinstance(image, Image.Image):
+        return image.copy()
+    if hasattr(image, "image"):
+        return image.image()
+    return Image.open(image)
+
+
+def crop(image, box, i, text_data=None, out_dir="./temp"):
+    image = _open_image(image)
 
     if text_data:
         draw = ImageDraw.Draw(image)
@@ -81,7 +91,9 @@ def crop(image, box, i, text_data=None):
         # draw.text((text_data[0]+5, text_data[1]+5), str(i), font=font, fill="red")
 
     cropped_image = image.crop(box)
-    cropped_image.save(f"./temp/{i}.jpg")
+    if cropped_image.mode != "RGB":
+        cropped_image = cropped_image.convert("RGB")
+    cropped_image.save(os.path.join(out_dir, f"{i}.jpg"))
     
 
 def in_box(box, target):
@@ -91,8 +103,8 @@ def in_box(box, target):
         return False
 
     
-def crop_for_clip(image, box, i, position):
-    image = Image.open(image)
+def crop_for_clip(image, box, i, position, out_dir="./temp"):
+    image = _open_image(image)
     w, h = image.size
     if position == "left":
         bound = [0, 0, w/2, h]
@@ -115,7 +127,9 @@ def crop_for_clip(image, box, i, position):
     
     if in_box(box, bound):
         cropped_image = image.crop(box)
-        cropped_image.save(f"./temp/{i}.jpg")
+        if cropped_image.mode != "RGB":
+            cropped_image = cropped_image.convert("RGB")
+        cropped_image.save(os.path.join(out_dir, f"{i}.jpg"))
         return True
     else:
         return False
@@ -0,0 +1,69 @@
+import os
+import re
+import threading
+
+
+class DeviceBackend:
+    """
+    不经过 adb 的设备实现。adb_path 以 "sim://名字" 开头时 (可带 -s serial)，
+    adb_client 的 shell / exec_out / pull / devices 交给注册在该名字下的 backend 处理，
+    截图、execute_action、界面稳定检测、UI 状态探测等上层代码不需要任何改动。
+    """
+
+    def devices(self):
+        """[(serial, state)]"""
+        raise NotImplementedError
+
+    def shell(self, command, serial=None):
+        """返回命令输出 (str)"""
+        raise NotImplementedError
+
+    def exec_out(self, command, serial=None):
+        """返回命令输出 (bytes)"""
+        raise NotImplementedError
+
+    def pull(self, remote_path, serial=None):
+        raise NotImplementedError
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+_SCHEME = re.compile(r"^\s*\"?(sim://[^\s\"]+)")
+
+
+def register_backend(name, backend):
+    """name 形如 "sim://bench"，runner 的 adb_path 设为同一个名字即可使用"""
+    if not name.startswith("sim://"):
+        name = f"sim://{name}"
+    with _backends_lock:
+        _backends[name] = backend
+    return name
+
+
+def unregister_backend(name):
+    with _backends_lock:
+        _backends.pop(name, None)
+
+
+def resolve(adb_path):
+    """返回 (backend, serial)；adb_path 不是 sim:// 时返回 (None, None)"""
+    match = _SCHEME.match(adb_path or "")
+    if not match:
+        return None, None
+    name = match.group(1)
+    serial = re.search(r"(?:^|\s)-s\s+(\S+)", adb_path)
+    with _backends_lock:
+        backend = _backends.get(name)
+    if backend is None:
+        # sim:///path/graph.json: 第一次使用时按屏幕图文件创建模拟设备 (SIM_DEVICES=N 时为 N 台)
+        from MobileAgent.simulator import SimulatedDevice, SimulatedFleet, ScreenGraph
+        path = name[len("sim://"):]
+        try:
+            graph = ScreenGraph.load(path)
+        except OSError:
+            raise KeyError(f"no device backend registered as {name}")
+        count = int(os.getenv("SIM_DEVICES", "1"))
+        backend = SimulatedFleet.from_graph(graph, count) if count > 1 else SimulatedDevice(graph)
+        with _backends_lock:
+            backend = _backends.setdefault(name, backend)
+    return backend, serial.group(1) if serial else None
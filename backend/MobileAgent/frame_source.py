@@ -0,0 +1,219 @@
+import collections
+import os
+import re
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from MobileAgent import adb_client
+from MobileAgent.screen import Frame, capture_screenshot
+
+try:
+    import av  # PyAV, 用于解码 H.264 屏幕流
+except ImportError:
+    av = None
+
+
+class FrameSource:
+    """
+    后台帧源: 工作线程不断产生帧，放入只保留最近 capacity 帧的环形缓冲区。
+    读取方通过 latest() 立即拿到最新一帧，无需再同步截图。
+    changes_only: 只在画面变化时才产出新帧 (没有新帧即画面没变)。
+    """
+
+    changes_only = False
+
+    def __init__(self, capacity=8):
+        self.capacity = capacity
+        self._frames = collections.deque(maxlen=capacity)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stop = threading.Event()
+        self.error = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_safe, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._close()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run_safe(self):
+        try:
+            self._run()
+        except Exception as e:
+            if not self._stop.is_set():
+                self.error = e
+                print(f"Frame source stopped: {e}")
+
+    def _run(self):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+    def _push(self, frame):
+        with self._cond:
+            self._frames.append(frame)
+            self._cond.notify_all()
+
+    def latest(self):
+        with self._cond:
+            return self._frames[-1] if self._frames else None
+
+    def recent(self):
+        with self._cond:
+            return list(self._frames)
+
+    def wait_for_frame(self, newer_than=0, timeout=None):
+        """等待 frame_id 大于 newer_than 的帧，超时返回 None"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._frames or self._frames[-1].frame_id <= newer_than:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                if not self.running:
+                    return None
+                self._cond.wait(0.5 if remaining is None else min(remaining, 0.5))
+            return self._frames[-1]
+
+
+class H264Decoder:
+    """把 H.264 Annex-B 字节流增量解码成 RGB 数组"""
+
+    def __init__(self):
+        if av is None:
+            raise RuntimeError("PyAV is required to decode screen streams: pip install av")
+        self.codec = av.CodecContext.create("h264", "r")
+
+    def feed(self, chunk):
+        for packet in self.codec.parse(chunk):
+            for frame in self.codec.decode(packet):
+                yield frame.to_ndarray(format="rgb24")
+
+
+class ScreenRecordSource(FrameSource):
+    """
+    通过 `exec-out screenrecord --output-format=h264 -` 读取设备的连续屏幕流并解码。
+    screenrecord 只在画面变化时产出新帧，单次最长 3 分钟，结束后自动重启。
+    默认按设备物理分辨率录制，保证帧尺寸与点击坐标一致。
+    """
+
+    changes_only = True
+
+    def __init__(self, adb_path, capacity=8, bit_rate=8000000, size=None):
+        super().__init__(capacity)
+        self.adb_path = adb_path
+        self.bit_rate = bit_rate
+        self.size = size
+        self._stream = None
+
+    def _device_size(self):
+        output = adb_client.shell(self.adb_path, "wm size")
+        sizes = re.findall(r"(\d+)x(\d+)", output)
+        if not sizes:
+            return None
+        # 有 Override size 时以最后一行为准
+        return int(sizes[-1][0]), int(sizes[-1][1])
+
+    def _run(self):
+        size = self.size or self._device_size()
+        command = f"screenrecord --output-format=h264 --bit-rate {self.bit_rate}"
+        if size:
+            command += f" --size {size[0]}x{size[1]}"
+        command += " -"
+        while not self._stop.is_set():
+            decoder = H264Decoder()
+            self._stream = adb_client.exec_stream(self.adb_path, command)
+            try:
+                while not self._stop.is_set():
+                    chunk = self._stream.read(65536)
+                    if not chunk:
+                        break
+                    for pixels in decoder.feed(chunk):
+                        self._push(Frame.from_array(pixels))
+            finally:
+                self._stream.close()
+
+    def _close(self):
+        if self._stream is not None:
+            self._stream.close()
+
+
+class PollingSource(FrameSource):
+    """没有 PyAV 时的退化方案: 后台循环调用 capture_screenshot"""
+
+    def __init__(self, adb_path, capacity=8, interval=0.2, mode=None):
+        super().__init__(capacity)
+        self.adb_path = adb_path
+        self.interval = interval
+        self.mode = mode
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._push(capture_screenshot(self.adb_path, mode=self.mode))
+            self._stop.wait(self.interval)
+
+
+class RecordedStreamSource(FrameSource):
+    """
+    录制好的屏幕流替身，用于无设备测试: path 可以是图片目录 (按文件名排序)
+    或 .h264 / .mp4 文件 (需要 PyAV)，按 fps 回放，loop=True 时循环播放。
+    """
+
+    def __init__(self, path, fps=30, capacity=8, loop=True):
+        super().__init__(capacity)
+        self.path = path
+        self.fps = fps
+        self.loop = loop
+
+    def _load(self):
+        if os.path.isdir(self.path):
+            names = sorted(n for n in os.listdir(self.path)
+                           if n.lower().endswith((".png", ".jpg", ".jpeg", ".webp")))
+            return [np.asarray(Image.open(os.path.join(self.path, n)).convert("RGB")) for n in names]
+        if av is None:
+            raise RuntimeError("PyAV is required to replay video files: pip install av")
+        with av.open(self.path) as container:
+            return [f.to_ndarray(format="rgb24") for f in container.decode(video=0)]
+
+    def _run(self):
+        frames = self._load()
+        if not frames:
+            raise RuntimeError(f"no frames found in {self.path}")
+        interval = 1.0 / self.fps
+        while not self._stop.is_set():
+            for pixels in frames:
+                if self._stop.is_set():
+                    return
+                self._push(Frame.from_array(pixels))
+                self._stop.wait(interval)
+            if not self.loop:
+                return
+
+
+def create_frame_source(kind, adb_path, **kwargs):
+    """kind: "stream" (screenrecord, 无 PyAV 时退化为 poll) / "poll" / 录制目录或文件路径"""
+    if kind == "stream":
+        if av is not None:
+            return ScreenRecordSource(adb_path, **kwargs)
+        print("PyAV not installed, falling back to polling frame source")
+        return PollingSource(adb_path, **kwargs)
+    if kind == "poll":
+        return PollingSource(adb_path, **kwargs)
+    return RecordedStreamSource(kind, **kwargs)
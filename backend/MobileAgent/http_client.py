@@ -0,0 +1,150 @@
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from MobileAgent.retry import CircuitBreaker
+
+DEFAULT_POOL_SIZE = int(os.getenv("INFERENCE_POOL_SIZE", "16"))
+DEFAULT_CONNECT_TIMEOUT = float(os.getenv("INFERENCE_CONNECT_TIMEOUT", "5"))
+DEFAULT_READ_TIMEOUT = float(os.getenv("INFERENCE_READ_TIMEOUT", "60"))
+# 流式拿到 Action 后是否断开连接来取消剩余生成; 只有断开即停止生成的后端 (如 vLLM) 才值得开启
+DEFAULT_CANCEL_ON_DISCONNECT = os.getenv("INFERENCE_CANCEL_ON_DISCONNECT", "0") == "1"
+
+
+def backend_key(url):
+    # 同一 scheme://host:port 的请求共用一个连接池
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _counting_pool_classes(on_connect):
+    """连接池类: 每次真正建立 TCP (及 TLS) 连接时调用 on_connect，包括同一个连接对象断开后的重连"""
+
+    class CountingHTTPConnection(HTTPConnection):
+        def connect(self):
+            on_connect()
+            super().connect()
+
+    class CountingHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            on_connect()
+            super().connect()
+
+    class CountingHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = CountingHTTPConnection
+
+    class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = CountingHTTPSConnection
+
+    return {"http": CountingHTTPConnectionPool, "https": CountingHTTPSConnectionPool}
+
+
+class CountingAdapter(HTTPAdapter):
+    """统计实际建立的 socket 连接数的 HTTPAdapter (含经代理的连接)"""
+
+    def __init__(self, on_connect, **kwargs):
+        self._pool_classes = _counting_pool_classes(on_connect)
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = self._pool_classes
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        manager.pool_classes_by_scheme = self._pool_classes
+        return manager
+
+
+class InferenceClient:
+    """
+    一个模型后端 (Ark / vLLM 等) 对应一个 requests.Session，
+    连接池 + HTTP keep-alive 复用 TCP/TLS 连接，避免每一步重新握手。
+    同一后端的所有 runner 共享一个熔断器 (breaker)。
+    cancel_on_disconnect: 流式拿到 Action 后关闭连接取消剩余生成 (下一步重新建连)，否则读完尾部复用连接。
+    """
+
+    def __init__(self, base_url, pool_size=DEFAULT_POOL_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, cancel_on_disconnect=DEFAULT_CANCEL_ON_DISCONNECT):
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.cancel_on_disconnect = cancel_on_disconnect
+        self.adapter = CountingAdapter(self._on_connect, pool_connections=1, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self.requests = 0
+        self.errors = 0
+        self.connections_opened = 0
+        self.breaker = CircuitBreaker()
+        self._lock = threading.Lock()
+
+    def _on_connect(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def post(self, url, timeout=None, **kwargs):
+        with self._lock:
+            self.requests += 1
+        try:
+            return self.session.post(url, timeout=timeout or (self.connect_timeout, self.read_timeout), **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self.errors += 1
+            raise
+
+    def stats(self):
+        # 按实际的 socket connect 计数; urllib3 的 pool.num_connections 不含同一连接对象上的重连
+        with self._lock:
+            opened, served = self.connections_opened, self.requests
+        return {
+            "backend": self.base_url,
+            "pool_size": self.pool_size,
+            "cancel_on_disconnect": self.cancel_on_disconnect,
+            "requests": self.requests,
+            "errors": self.errors,
+            "connections_opened": opened,
+            # 未新建连接的请求占比; 1.0 表示所有请求都复用了已有连接
+            "connection_reuse": round(1 - opened / served, 4) if served else 0.0,
+            "breaker": self.breaker.stats(),
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_backend_config = {}
+_clients_lock = threading.Lock()
+
+
+def configure_backend(url, pool_size=None, connect_timeout=None, read_timeout=None, cancel_on_disconnect=None):
+    """为某个后端单独设置连接池大小、超时和流式取消方式，需在第一次请求该后端之前调用"""
+    config = {k: v for k, v in (("pool_size", pool_size), ("connect_timeout", connect_timeout),
+                                ("read_timeout", read_timeout), ("cancel_on_disconnect", cancel_on_disconnect))
+              if v is not None}
+    with _clients_lock:
+        _backend_config.setdefault(backend_key(url), {}).update(config)
+
+
+def get_inference_client(url):
+    key = backend_key(url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = InferenceClient(key, **_backend_config.get(key, {}))
+            _clients[key] = client
+    return client
+
+
+def all_stats():
+    with _clients_lock:
+        clients = list(_clients.values())
+    return [client.stats() for client in clients]
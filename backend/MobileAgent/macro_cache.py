@@ -0,0 +1,124 @@
+import collections
+import os
+import sqlite3
+import threading
+import time
+
+from MobileAgent.screen_cache import screen_hash, hamming, normalize_instruction
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "macros.sqlite")
+
+
+class MacroLibrary:
+    """
+    成功完成的轨迹库: (归一化指令, 起始画面哈希) -> 轨迹会话 id。
+    新任务的指令相同、起始画面哈希距离不超过 max_distance 时，把对应轨迹当作宏交给 ReplayEngine 逐步验证执行。
+    每次成功都更新为最新的成功轨迹；累计失败 max_failures 次的宏不再使用 (之后的成功不清零失败次数，
+    不稳定的宏不会因为偶尔成功一次又被反复使用)。
+    """
+
+    def __init__(self, path=None, max_distance=None, max_failures=2, enabled=None):
+        self.path = path or os.getenv("MACRO_CACHE_PATH", DEFAULT_PATH)
+        self.max_distance = max_distance if max_distance is not None else int(os.getenv("SCREEN_CACHE_DISTANCE", "6"))
+        self.max_failures = max_failures
+        self.enabled = enabled if enabled is not None else os.getenv("MACRO_CACHE", "0") == "1"
+        self._lock = threading.Lock()
+        self._db = None
+        self.counters = collections.Counter()
+
+    def _connect(self):
+        if self._db is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS macros (instruction TEXT, start_hash TEXT, session TEXT, "
+                             "steps INTEGER, successes INTEGER DEFAULT 0, failures INTEGER DEFAULT 0, "
+                             "updated REAL, PRIMARY KEY (instruction, start_hash))")
+        return self._db
+
+    def key(self, instruction, frame):
+        if not self.enabled:
+            return None
+        return normalize_instruction(instruction), screen_hash(frame)
+
+    def _find(self, key):
+        instruction, value = key
+        best = None
+        rows = self._connect().execute("SELECT start_hash, session, steps, failures FROM macros WHERE instruction = ?",
+                                       (instruction,)).fetchall()
+        for start_hash, session, steps, failures in rows:
+            distance = hamming(int(start_hash, 16), value)
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, start_hash, session, steps, failures)
+        return best
+
+    def lookup(self, key):
+        """返回可用的宏 (会话 id)，没有时返回 None"""
+        if key is None:
+            return None
+        with self._lock:
+            self.counters["lookups"] += 1
+            found = self._find(key)
+            if found is None or found[4] >= self.max_failures:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            return found[2]
+
+    def record_success(self, key, session, steps, model_calls_saved=0):
+        """任务成功: 记下 (或更新为) 本次的轨迹"""
+        if key is None or session is None:
+            return
+        with self._lock:
+            db = self._connect()
+            found = self._find(key)
+            start_hash = found[1] if found else f"{key[1]:x}"
+            db.execute("INSERT INTO macros (instruction, start_hash, session, steps, successes, failures, updated) "
+                       "VALUES (?, ?, ?, ?, 1, 0, ?) ON CONFLICT (instruction, start_hash) DO UPDATE SET "
+                       "session = excluded.session, steps = excluded.steps, successes = successes + 1, "
+                       "updated = excluded.updated", (key[0], start_hash, session, steps, time.time()))
+            db.commit()
+            self.counters["recorded"] += 1
+            self.counters["model_calls_saved"] += model_calls_saved
+
+    def record_failure(self, key):
+        """按宏执行的任务失败"""
+        if key is None:
+            return
+        with self._lock:
+            found = self._find(key)
+            if found is not None:
+                self._connect().execute("UPDATE macros SET failures = failures + 1 WHERE instruction = ? AND start_hash = ?",
+                                        (key[0], found[1]))
+                self._db.commit()
+            self.counters["failures"] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["lookups"]
+            entries = self._connect().execute("SELECT COUNT(*) FROM macros").fetchone()[0] if self.enabled else 0
+            return {
+                "enabled": self.enabled,
+                "macros": entries,
+                "lookups": lookups,
+                "hits": self.counters["hits"],
+                "misses": self.counters["misses"],
+                "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+                "recorded": self.counters["recorded"],
+                "failures": self.counters["failures"],
+                "model_calls_saved": self.counters["model_calls_saved"],
+            }
+
+
+_libraries = {}
+_libraries_lock = threading.Lock()
+
+
+def get_macro_library(path=None):
+    """同一个宏库文件在进程内只打开一次，所有 runner 共享"""
+    path = path or os.getenv("MACRO_CACHE_PATH", DEFAULT_PATH)
+    with _libraries_lock:
+        library = _libraries.get(path)
+        if library is None:
+            library = _libraries[path] = MacroLibrary(path)
+    return library
@@ -0,0 +1,124 @@
+import bisect
+import os
+import threading
+
+# 各阶段耗时的桶边界 (秒，Prometheus 的基本单位)，从 1 ms 到 60 s 大致按 2~2.5 倍递增
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """固定桶的累计直方图 (Prometheus histogram 语义)，observe 只做一次二分查找"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个是 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total, result = 0, []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+
+
+def _bound(value):
+    return "+Inf" if value == float("inf") else f"{value:g}"
+
+
+class MetricsRegistry:
+    """
+    agent 循环的计时指标: 每一步的各阶段耗时 (runner 的 timings 字典，键为 xxx_ms，换算成秒) 按 (阶段, 设备, 模型后端)
+    记入直方图，另有按来源 (model / cache / replay / error) 计数的步数和完成的任务数。
+    render() 输出 Prometheus 文本格式。METRICS=0 时关闭。
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, enabled=None):
+        self.buckets = tuple(buckets)
+        self.enabled = enabled if enabled is not None else os.getenv("METRICS", "1") != "0"
+        self._histograms = {}  # (stage, device, backend) -> Histogram
+        self._steps = {}  # (device, backend, source) -> count
+        self._tasks = {}  # (device, backend) -> count
+        self._lock = threading.Lock()
+
+    def observe_step(self, timings, device, backend, source="model"):
+        if not self.enabled:
+            return
+        with self._lock:
+            for key, value in timings.items():
+                if value is None:
+                    continue
+                stage = key[:-3] if key.endswith("_ms") else key
+                histogram = self._histograms.get((stage, device, backend))
+                if histogram is None:
+                    histogram = self._histograms[(stage, device, backend)] = Histogram(self.buckets)
+                histogram.observe(value / 1000)
+            self._steps[(device, backend, source)] = self._steps.get((device, backend, source), 0) + 1
+
+    def task_finished(self, device, backend):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._tasks[(device, backend)] = self._tasks.get((device, backend), 0) + 1
+
+    def snapshot(self):
+        """{阶段: {"count", "mean_ms"}}，汇总所有设备和后端"""
+        with self._lock:
+            summary = {}
+            for (stage, _, _), histogram in self._histograms.items():
+                item = summary.setdefault(stage, {"count": 0, "sum": 0.0})
+                item["count"] += histogram.count
+                item["sum"] += histogram.sum
+        return {stage: {"count": v["count"], "mean_ms": round(v["sum"] * 1000 / v["count"], 2) if v["count"] else 0.0}
+                for stage, v in sorted(summary.items())}
+
+    def render(self):
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            steps = sorted(self._steps.items())
+            tasks = sorted(self._tasks.items())
+            lines = ["# HELP uitars_stage_duration_seconds Duration of each agent loop stage in seconds.",
+                     "# TYPE uitars_stage_duration_seconds histogram"]
+            for (stage, device, backend), histogram in histograms:
+                labels = _labels([("stage", stage), ("device", device), ("backend", backend)])
+                for bound, count in histogram.cumulative():
+                    lines.append(f'uitars_stage_duration_seconds_bucket{{{labels},le="{_bound(bound)}"}} {count}')
+                lines.append(f"uitars_stage_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+                lines.append(f"uitars_stage_duration_seconds_count{{{labels}}} {histogram.count}")
+        lines += ["# HELP uitars_steps_total Agent steps by source of the action (model, cache, replay, error).",
+                  "# TYPE uitars_steps_total counter"]
+        for (device, backend, source), count in steps:
+            labels = _labels([("device", device), ("backend", backend), ("source", source)])
+            lines.append(f"uitars_steps_total{{{labels}}} {count}")
+        lines += ["# HELP uitars_tasks_total Tasks finished by the agent.",
+                  "# TYPE uitars_tasks_total counter"]
+        for (device, backend), count in tasks:
+            lines.append(f"uitars_tasks_total{{{_labels([('device', device), ('backend', backend)])}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics():
+    """进程内唯一的指标表，所有 runner 共享"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+    return _registry
@@ -0,0 +1,50 @@
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from MobileAgent.screen import Frame
+from codes.utils import smart_resize, IMAGE_FACTOR, MIN_PIXELS
+
+# 默认的像素预算 (与 run_qwen.py 的 max_pixels 相同)。codes/utils.py 的 MAX_PIXELS (16384*28*28 ≈ 12.8 MP)
+# 比手机截图大，用它作默认值时预处理不起作用；模型服务端的 max_pixels 不同时用 MODEL_MAX_PIXELS 设置。
+DEFAULT_MAX_PIXELS = 1280 * IMAGE_FACTOR * IMAGE_FACTOR
+
+
+class ImagePreprocessor:
+    """
+    上传前在本机把截图缩放到模型 smart_resize 的目标尺寸 (宽高为 factor 的倍数，像素数在
+    [min_pixels, max_pixels] 内)。服务端拿到的就是它最终使用的尺寸，不再缩放；
+    模型输出的坐标仍按同一组 max_pixels / min_pixels 经 parse_action_to_structure_output 换算回原图。
+    """
+
+    def __init__(self, max_pixels=None, min_pixels=None, factor=IMAGE_FACTOR, enabled=None):
+        self.max_pixels = max_pixels or int(os.getenv("MODEL_MAX_PIXELS", DEFAULT_MAX_PIXELS))
+        self.min_pixels = min_pixels or int(os.getenv("MODEL_MIN_PIXELS", MIN_PIXELS))
+        self.factor = factor
+        self.enabled = enabled if enabled is not None else os.getenv("IMAGE_PREPROCESS", "1") != "0"
+
+    def target_size(self, width, height):
+        h_bar, w_bar = smart_resize(height, width, factor=self.factor,
+                                    min_pixels=self.min_pixels, max_pixels=self.max_pixels)
+        return w_bar, h_bar
+
+    def process(self, frame):
+        """返回缩放后的新 Frame (frame_id 不变)，无需缩小时直接返回原帧"""
+        if not self.enabled:
+            return frame
+        size = self.target_size(frame.width, frame.height)
+        # 只缩小不放大: 目标不小于原图时 (只差凑整到 factor 的倍数) 原样上传，服务端得到的尺寸相同
+        if size == frame.size or size[0] * size[1] >= frame.width * frame.height:
+            return frame
+        start = time.perf_counter()
+        image = frame.image()
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        # 与 Qwen-VL 图像处理器一致用 bicubic; reducing_gap 先整数倍缩小再精细缩放，大幅缩小时快得多
+        image = image.resize(size, Image.BICUBIC, reducing_gap=3.0)
+        resized = Frame.from_array(np.asarray(image), frame_id=frame.frame_id, timestamp=frame.timestamp)
+        resized.source_size = frame.size
+        resized.timings = dict(frame.timings, resize_ms=(time.perf_counter() - start) * 1000)
+        return resized
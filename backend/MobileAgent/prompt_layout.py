@@ -0,0 +1,56 @@
+# run_qwen.py 的系统指令（确保模型按指定格式输出Thought和Action）
+QWEN_SYSTEM_PROMPT = """
+你是一个移动端UI交互代理，需要根据截图和指令执行相应操作。
+输出格式必须严格遵循：
+Thought: 你的思考过程
+Action: 具体操作（支持click/type/finished/wait/drag等，格式如click(start_box='(100,200))或drag(start_box='(100,200)', end_box='(300,400)')）。
+注意：坐标必须是整数或浮点数，不能是自然语言描述。
+""".strip()
+
+
+def legacy_messages(system_prompt, chat_action, image_url=None):
+    """run_qwen.py 原来的布局: 指令列表和最新截图放在同一条 user 消息里"""
+    user_content = [{"type": "text", "text": list(chat_action)}]
+    if image_url:
+        user_content.append({"type": "image_url", "image_url": {"url": image_url}})
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_content}]
+
+
+class PrefixPromptLayout:
+    """
+    适配 vLLM 自动前缀缓存 (automatic prefix caching) 的提示词布局:
+    system 提示词 -> MOBILE_USE 指令块 -> 历史各轮 (只追加) -> 当前截图。
+    前面的部分每一步都逐字节相同，只有末尾的当前截图是新的，服务端可以复用上一步的 KV cache。
+    历史超过 history_n 轮时一次丢掉最早的 stride 轮，而不是每步滑动一轮，
+    这样前缀只在淘汰的那一步失效一次。历史截图用文字占位，不重复上传。
+    """
+
+    def __init__(self, system_prompt, instruction_prompt, history_n=7, stride=None):
+        self.system_prompt = system_prompt
+        self.instruction_prompt = instruction_prompt
+        self.history_n = history_n
+        self.stride = stride or max(1, history_n // 2)
+        self.turns = []  # [(步数, 模型回复)]
+        self.step = 0
+        self.evictions = 0
+
+    def add_turn(self, response):
+        self.step += 1
+        self.turns.append((self.step, response))
+        if len(self.turns) > self.history_n:
+            del self.turns[:self.stride]
+            self.evictions += 1
+
+    def messages(self, image_url):
+        messages = [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": [{"type": "text", "text": self.instruction_prompt}]},
+        ]
+        for step, response in self.turns:
+            messages.append({"role": "user", "content": [{"type": "text", "text": f"第{step}步截图（已省略）"}]})
+            messages.append({"role": "assistant", "content": response})
+        messages.append({"role": "user", "content": [
+            {"type": "text", "text": f"第{self.step + 1}步截图（当前）"},
+            {"type": "image_url", "image_url": {"url": image_url}},
+        ]})
+        return messages
@@ -0,0 +1,75 @@
+import os
+
+from MobileAgent.screen import Frame, png_size
+from MobileAgent.settle import thumbnail, frame_diff
+
+
+def frame_from_png(data):
+    width, height = png_size(data)
+    return Frame(data, width, height)
+
+
+class ReplayEngine:
+    """
+    按录制的轨迹重放动作，不调用模型。
+    每一步执行前把当前画面与录制时该步的截图比较 (低分辨率灰度图的平均差)，
+    相似度不低于 threshold 才使用录制的模型输出；否则在之后 lookahead 步内寻找相符的画面重新对齐，
+    仍找不到时返回 None，由调用方回退到模型。
+    """
+
+    def __init__(self, store, session, threshold=None, lookahead=3):
+        self.store = store
+        self.session = session
+        self.threshold = threshold if threshold is not None else float(os.getenv("REPLAY_THRESHOLD", "0.97"))
+        self.lookahead = lookahead
+        # 只保留有截图和动作的步骤 (推理失败的步骤不重放)
+        self.steps = [r for r in store.steps(session) if r.get("screenshot") and r.get("action")]
+        self.position = 0
+        self._thumbnails = {}
+        self.replayed = 0
+        self.fallbacks = 0
+        self.resyncs = 0
+        self.last_similarity = None
+
+    @property
+    def finished(self):
+        return self.position >= len(self.steps)
+
+    def _recorded_thumbnail(self, record):
+        sha = record["screenshot"]
+        if sha not in self._thumbnails:
+            self._thumbnails[sha] = thumbnail(frame_from_png(self.store.blob(sha)))
+        return self._thumbnails[sha]
+
+    def similarity(self, frame, record):
+        """1.0 为完全相同；分辨率不同 (坐标不能复用) 时为 0"""
+        if list(frame.size) != list(record.get("size", frame.size)):
+            return 0.0
+        return 1.0 - frame_diff(thumbnail(frame), self._recorded_thumbnail(record))
+
+    def next_output(self, frame):
+        """当前画面与录制相符时返回录制的模型输出并前进一步，否则返回 None"""
+        for offset in range(min(self.lookahead + 1, len(self.steps) - self.position)):
+            record = self.steps[self.position + offset]
+            similarity = self.similarity(frame, record)
+            if offset == 0:
+                self.last_similarity = similarity
+            if similarity >= self.threshold:
+                self.resyncs += offset > 0
+                self.position += offset + 1
+                self.replayed += 1
+                return record["output"]
+        self.fallbacks += 1
+        return None
+
+    def stats(self):
+        return {
+            "session": self.session,
+            "position": self.position,
+            "recorded_steps": len(self.steps),
+            "replayed": self.replayed,
+            "fallbacks": self.fallbacks,
+            "resyncs": self.resyncs,
+            "last_similarity": round(self.last_similarity, 4) if self.last_similarity is not None else None,
+            "threshold": self.threshold,
+        }
@@ -0,0 +1,117 @@
+import collections
+import gzip
+import json
+import os
+import time
+
+
+def message_fragment(message):
+    """单条消息序列化为 JSON 字节串"""
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def image_fragment(role, url):
+    # base64 data URL 只含 [A-Za-z0-9+/=:;,]，无需转义，直接拼接，省去 json.dumps 扫描几 MB 字符串
+    return (b'{"role":"' + role.encode("ascii") + b'","content":[{"type":"image_url","image_url":{"url":"'
+            + url.encode("ascii") + b'"}}]}')
+
+
+class RequestBuilder:
+    """
+    增量构建 chat/completions 请求体。
+    提示词和历史中每一轮 (截图, 模型回复) 都只序列化一次，保存为 JSON 片段放在滑动窗口里；
+    每步只序列化新截图，再把各片段拼成请求体，不再 deepcopy 消息列表、也不再重新 json.dumps 整个历史。
+    gzip_level > 0 时压缩请求体 (需要服务端支持 Content-Encoding: gzip)。
+    """
+
+    def __init__(self, model, codecs, history_n=5, max_tokens=2048, temperature=0.0, seed=1234, gzip_level=None):
+        self.model = model
+        self.codecs = codecs
+        self.history_n = history_n
+        self.params = {"max_tokens": max_tokens, "temperature": temperature, "seed": seed}
+        self.gzip_level = gzip_level if gzip_level is not None else int(os.getenv("REQUEST_GZIP", "0"))
+        self._prefix = []
+        # 与原 run_loop 一致: 最多保留 history_n - 1 轮历史，加上当前截图共 history_n 张图
+        self._turns = collections.deque(maxlen=max(history_n - 1, 0))
+        self._current = None
+        self._current_fragment = None
+        self._new_bytes = 0
+        self._serialize_ms = 0.0
+        self.last_stats = {}
+
+    def _serialize(self, fn, *args):
+        start = time.perf_counter()
+        fragment = fn(*args)
+        self._serialize_ms += (time.perf_counter() - start) * 1000
+        self._new_bytes += len(fragment)
+        return fragment
+
+    def set_prompt(self, prompt_messages):
+        """设置 system / user 提示词 (如 init_action_chat_uitars 的结果)，历史保留"""
+        self._prefix = [self._serialize(message_fragment, m) for m in prompt_messages]
+
+    def reset(self, prompt_messages=None):
+        """新任务: 清空历史，可同时设置提示词"""
+        self._turns.clear()
+        self._current = self._current_fragment = None
+        if prompt_messages is not None:
+            self.set_prompt(prompt_messages)
+
+    def set_screen(self, frame):
+        """本步的截图"""
+        self._current = frame
+        self._current_fragment = self._serialize(image_fragment, "user", self.codecs.data_url(frame, "current"))
+
+    def add_response(self, text):
+        """模型回复后，当前截图 (改用 history 编码) 和回复一起进入历史窗口"""
+        if self.history_n <= 1 or self._current is None:
+            return
+        image = self._current_fragment
+        if self.codecs.history is not self.codecs.current:
+            image = self._serialize(image_fragment, "user", self.codecs.data_url(self._current, "history"))
+        reply = self._serialize(message_fragment, {"role": "assistant", "content": [{"type": "text", "text": text}]})
+        self._turns.append((image, reply))
+
+    def fragments(self):
+        yield from self._prefix
+        for image, reply in self._turns:
+            yield image
+            yield reply
+        if self._current_fragment is not None:
+            yield self._current_fragment
+
+    def headers(self):
+        return {"Content-Encoding": "gzip"} if self.gzip_level else {}
+
+    def build(self, stream=False):
+        """返回请求体字节串; 除最终拼接外不复制历史片段"""
+        start = time.perf_counter()
+        params = dict(self.params, stream=True) if stream else self.params
+        head = b'{"model":' + json.dumps(self.model).encode("utf-8") + b',"messages":['
+        tail = b"]," + json.dumps(params, separators=(",", ":")).encode("utf-8")[1:]
+        parts = [head]
+        for fragment in self.fragments():
+            if len(parts) > 1:
+                parts.append(b",")
+            parts.append(fragment)
+        parts.append(tail)
+        # 只在这里按最终大小分配一次
+        body = b"".join(parts)
+        assemble_ms = (time.perf_counter() - start) * 1000
+        wire, gzip_ms = body, 0.0
+        if self.gzip_level:
+            start = time.perf_counter()
+            wire = gzip.compress(body, compresslevel=self.gzip_level)
+            gzip_ms = (time.perf_counter() - start) * 1000
+        self.last_stats = {
+            "fragments": (len(parts) - 1) // 2,
+            "body_bytes": len(body),
+            "wire_bytes": len(wire),
+            "serialized_bytes": self._new_bytes,
+            "reused_bytes": len(body) - self._new_bytes,
+            "serialize_ms": round(self._serialize_ms, 3),
+            "assemble_ms": round(assemble_ms, 3),
+            "gzip_ms": round(gzip_ms, 3),
+        }
+        self._new_bytes, self._serialize_ms = 0, 0.0
+        return wire
@@ -0,0 +1,180 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+
+# 这些状态码视为暂时性错误，可以重试；其余 4xx 直接失败
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class InferenceError(Exception):
+    def __init__(self, message, status=None, attempts=0):
+        super().__init__(message)
+        self.status = status
+        self.attempts = attempts
+
+
+class CircuitOpenError(InferenceError):
+    """熔断器打开期间直接失败，不再请求后端"""
+
+    def __init__(self, message, retry_in):
+        super().__init__(message)
+        self.retry_in = retry_in
+
+
+def parse_retry_after(value):
+    """Retry-After 头: 秒数或 HTTP 日期，无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    指数退避 + full jitter: 第 n 次重试前等待 random(0, min(max_delay, base_delay * multiplier^n))。
+    服务端给出 Retry-After 时以它为准 (不超过 max_delay)。
+    熔断器打开时调用方最多等待 max_breaker_wait 秒 (所有等待的总和)，之后按失败处理，避免后端长时间不可用时任务一直挂起。
+    """
+
+    def __init__(self, max_attempts=None, base_delay=0.5, max_delay=30.0, multiplier=2.0,
+                 retry_statuses=RETRY_STATUSES, deadline=None, max_breaker_wait=None):
+        self.max_attempts = max_attempts or int(os.getenv("INFERENCE_MAX_ATTEMPTS", "5"))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.retry_statuses = retry_statuses
+        self.deadline = deadline  # 所有尝试的总时长上限 (秒)
+        self.max_breaker_wait = max_breaker_wait if max_breaker_wait is not None else \
+            float(os.getenv("INFERENCE_BREAKER_MAX_WAIT", "120"))
+
+    def delay(self, retry, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * self.multiplier ** retry))
+
+    def should_retry(self, status):
+        return status is None or status in self.retry_statuses
+
+
+class CircuitBreaker:
+    """
+    每个后端共享一个熔断器: 连续 failure_threshold 次失败后打开，reset_timeout 秒内所有调用直接失败；
+    之后进入 half_open，只放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        self.failure_threshold = failure_threshold or int(os.getenv("INFERENCE_BREAKER_THRESHOLD", "5"))
+        self.reset_timeout = reset_timeout or float(os.getenv("INFERENCE_BREAKER_RESET", "30"))
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def retry_in(self):
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and self.retry_in() == 0.0:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+            "retry_in": round(self.retry_in(), 2),
+        }
+
+
+def post_with_retry(client, url, policy=None, sleep=time.sleep, read=None, **kwargs):
+    """
+    通过 InferenceClient 发送请求并返回解析后的 JSON；给出 read 时 (流式) 返回 read(res) 的结果。
+    暂时性错误按 policy 退避重试，次数用尽抛出 InferenceError；熔断器打开时抛出 CircuitOpenError。
+    read 读取响应时连接中断 (requests.RequestException) 或内容无法解析 (ValueError) 同样计入熔断并重试。
+    """
+    policy = policy or RetryPolicy()
+    breaker = client.breaker
+    start = time.monotonic()
+    error = None
+    for attempt in range(1, policy.max_attempts + 1):
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {client.base_url}", breaker.retry_in())
+        status, retry_after = None, None
+        try:
+            res = client.post(url, **kwargs)
+            status = res.status_code
+            if status == 200 and read is not None:
+                # 流式请求: 响应头正常还不算成功，读到调用方需要的内容之后才算
+                result = read(res)
+                breaker.record_success()
+                return result
+            if status == 200:
+                res_json = res.json()
+                res_json["choices"][0]["message"]["content"]
+                breaker.record_success()
+                return res_json
+            retry_after = parse_retry_after(res.headers.get("Retry-After"))
+            error = InferenceError(f"API Error {status}: {res.text[:500]}", status, attempt)
+        except requests.RequestException as e:
+            error = InferenceError(f"Network Error: {e}", None, attempt)
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            error = InferenceError(f"Unexpected response format: {e}", status, attempt)
+
+        if not policy.should_retry(status if status != 200 else None):
+            # 请求本身有问题 (如 400/401)，后端是健康的，不计入熔断
+            breaker.record_success()
+            raise error
+        breaker.record_failure()
+        if attempt == policy.max_attempts:
+            break
+        delay = policy.delay(attempt - 1, retry_after)
+        if policy.deadline is not None and time.monotonic() - start + delay > policy.deadline:
+            break
+        print(f"{error} - retry {attempt}/{policy.max_attempts - 1} in {delay:.2f} s")
+        sleep(delay)
+    raise error
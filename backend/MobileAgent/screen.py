@@ -0,0 +1,241 @@
+import base64
+import io
+import itertools
+import os
+import re
+import struct
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from MobileAgent import adb_client
+
+_frame_counter = itertools.count(1)
+_frame_lock = threading.Lock()
+
+# screencap 原始输出的像素格式 (android PixelFormat) -> (每像素字节数, PIL 模式)
+RAW_FORMATS = {
+    1: (4, "RGBA"),  # RGBA_8888
+    2: (4, "RGBX"),  # RGBX_8888
+    3: (3, "RGB"),   # RGB_888
+}
+
+
+def next_frame_id():
+    with _frame_lock:
+        return next(_frame_counter)
+
+
+class Frame:
+    """
+    一帧截图，完全保存在内存中。
+    可以由设备端压缩好的 PNG 构造，也可以由原始 framebuffer 构造 (from_raw)；
+    后者只在真正需要时 (data / encode) 才在本机编码为 PNG/JPEG。
+    timings 记录各阶段耗时 (毫秒)，便于对比两种截图方式。
+    """
+
+    def __init__(self, data, width, height, frame_id=None, timestamp=None):
+        self.width = width
+        self.height = height
+        self.frame_id = frame_id if frame_id is not None else next_frame_id()
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.timings = {}
+        self._pixels = None
+        self._mode = None
+        self._encoded = {}
+        self._urls = {}
+        self.is_raw = data is None
+        # (宽, 高, 每像素字节数, 头部字节数)，只有 from_raw 的帧有
+        self.raw_geometry = None
+        # capture_thumbnail 的低分辨率帧只用于比较画面变化，不能作为模型输入
+        self.downsampled = False
+        if data is not None:
+            self._encoded[("PNG", None)] = data
+
+    @classmethod
+    def from_raw(cls, buffer, frame_id=None, timestamp=None):
+        """解析 `screencap` (不带 -p) 的输出: 宽、高、格式 [、色彩空间] + 像素"""
+        if len(buffer) < 12:
+            raise ValueError(f"raw screencap output too short: {len(buffer)} bytes")
+        width, height, pixel_format = struct.unpack_from("<III", buffer, 0)
+        if pixel_format not in RAW_FORMATS:
+            raise ValueError(f"unsupported screencap pixel format: {pixel_format}")
+        bpp, mode = RAW_FORMATS[pixel_format]
+        # Android 9 之后头部多一个 4 字节的 dataspace 字段
+        header = len(buffer) - width * height * bpp
+        if header not in (12, 16):
+            raise ValueError(f"unexpected raw screencap size {len(buffer)} for {width}x{height}x{bpp}")
+        frame = cls(None, width, height, frame_id=frame_id, timestamp=timestamp)
+        # 零拷贝: 数组直接引用 adb 读回的缓冲区
+        frame._pixels = np.frombuffer(buffer, dtype=np.uint8, count=width * height * bpp,
+                                      offset=header).reshape(height, width, bpp)
+        frame._mode = mode
+        frame.raw_geometry = (width, height, bpp, header)
+        return frame
+
+    @classmethod
+    def from_array(cls, pixels, frame_id=None, timestamp=None):
+        height, width = pixels.shape[:2]
+        frame = cls(None, width, height, frame_id=frame_id, timestamp=timestamp)
+        frame._pixels = pixels
+        frame._mode = {3: "RGB", 4: "RGBA"}[pixels.shape[2]]
+        return frame
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    @property
+    def pixels(self):
+        """(height, width, channels) 的 uint8 数组; PNG 帧在第一次访问时解码"""
+        if self._pixels is None:
+            start = time.perf_counter()
+            image = Image.open(io.BytesIO(self._encoded[("PNG", None)]))
+            self._pixels = np.asarray(image)
+            self._mode = image.mode
+            self.timings["decode_ms"] = (time.perf_counter() - start) * 1000
+        return self._pixels
+
+    def image(self):
+        pixels = self.pixels
+        if self._mode == "RGBX":
+            return Image.frombuffer("RGBX", (self.width, self.height), pixels, "raw", "RGBX", 0, 1).convert("RGB")
+        return Image.fromarray(pixels)
+
+    def encode(self, format="PNG", quality=None):
+        format = format.upper()
+        if format == "JPG":
+            format = "JPEG"
+        key = (format, quality)
+        if key not in self._encoded:
+            start = time.perf_counter()
+            image = self.image()
+            if format == "JPEG" and image.mode != "RGB":
+                image = image.convert("RGB")
+            buf = io.BytesIO()
+            params = {"compress_level": 1} if format == "PNG" else {}
+            if format == "WEBP":
+                # method 2 的体积与默认的 4 相近，编码快一倍
+                params["method"] = 2
+            if quality is not None:
+                params["quality"] = quality
+            image.save(buf, format=format, **params)
+            self._encoded[key] = buf.getvalue()
+            self.timings[f"encode_{format.lower()}_ms"] = (time.perf_counter() - start) * 1000
+        return self._encoded[key]
+
+    @property
+    def data(self):
+        return self.encode("PNG")
+
+    def data_url(self, mime, format="PNG", quality=None):
+        """base64 data URL，同样按 (格式, 质量) 缓存; 截图留在历史中的每一步都复用"""
+        key = (format.upper(), quality)
+        if key not in self._urls:
+            self._urls[key] = f"data:{mime};base64," + base64.b64encode(self.encode(format, quality)).decode("utf-8")
+        return self._urls[key]
+
+    def __repr__(self):
+        kind = "raw" if self.is_raw else "png"
+        return f"Frame(id={self.frame_id}, {self.width}x{self.height}, {kind})"
+
+
+def png_size(data):
+    # PNG 签名(8) + IHDR 长度(4) + "IHDR"(4) + 宽(4) + 高(4)，无需解码整张图
+    if len(data) < 24 or data[:8] != b"\x89PNG\r\n\x1a\n" or data[12:16] != b"IHDR":
+        raise ValueError(f"not a PNG screenshot ({len(data)} bytes): {data[:64]!r}")
+    return struct.unpack(">II", data[16:24])
+
+
+def capture_screenshot(adb_path, mode=None):
+    """
+    通过 exec-out 把截图直接读进内存，不经过设备存储和本地磁盘。
+    mode="png": 设备端 `screencap -p` 压缩; mode="raw": 读取原始 framebuffer，
+    省去手机上的 PNG 压缩，编码推迟到使用方。默认取环境变量 SCREENCAP_MODE。
+    """
+    mode = mode or os.getenv("SCREENCAP_MODE", "png")
+    start = time.perf_counter()
+    if mode == "raw":
+        buffer = adb_client.exec_out(adb_path, "screencap")
+        transfer_end = time.perf_counter()
+        frame = Frame.from_raw(buffer)
+    else:
+        data = adb_client.exec_out(adb_path, "screencap -p")
+        transfer_end = time.perf_counter()
+        width, height = png_size(data)
+        frame = Frame(data, width, height)
+    frame.timings["capture_ms"] = (transfer_end - start) * 1000
+    frame.timings["parse_ms"] = (time.perf_counter() - transfer_end) * 1000
+    return frame
+
+
+# 界面稳定检测用的低分辨率截图: 设备端截图后只传回均匀分布的 THUMBNAIL_ROWS 行 (每行一个 dd)，
+# 1080x2340 RGBA 约 135 KB，完整的 raw 截图约 10 MB
+THUMBNAIL_ROWS = 32
+THUMBNAIL_WIDTH = 64
+THUMBNAIL_PATH = "/data/local/tmp/.uitars_thumbnail.raw"
+_THUMBNAIL_COMMAND = re.compile(r"^screencap \| tail -c \+(\d+) > (\S+) && for r in ([\d ]+); "
+                                r"do dd if=\2 bs=(\d+) skip=\$r count=1 2>/dev/null; done$")
+
+_geometry = {}  # adb_path -> Frame.raw_geometry
+_unsupported = set()  # 取不到缩略图的设备 (缺少 tail / dd)，直接用完整 raw 截图
+_geometry_lock = threading.Lock()
+
+
+def thumbnail_rows(height, rows=THUMBNAIL_ROWS):
+    step = max(1, height // rows)
+    return list(range(step // 2, height, step))[:rows]
+
+
+def thumbnail_command(geometry, rows=THUMBNAIL_ROWS):
+    width, height, bpp, header = geometry
+    picks = " ".join(str(r) for r in thumbnail_rows(height, rows))
+    return (f"screencap | tail -c +{header + 1} > {THUMBNAIL_PATH} && for r in {picks}; "
+            f"do dd if={THUMBNAIL_PATH} bs={width * bpp} skip=$r count=1 2>/dev/null; done")
+
+
+def run_thumbnail_command(command, raw):
+    """模拟设备用: 对原始 screencap 输出执行 thumbnail_command 的效果；不是缩略图命令时返回 None"""
+    match = _THUMBNAIL_COMMAND.match(command)
+    if match is None:
+        return None
+    header, row_bytes = int(match.group(1)) - 1, int(match.group(4))
+    return b"".join(raw[header + r * row_bytes:header + (r + 1) * row_bytes] for r in map(int, match.group(3).split()))
+
+
+def capture_thumbnail(adb_path, rows=THUMBNAIL_ROWS, width=THUMBNAIL_WIDTH):
+    """
+    比较画面变化用的低分辨率帧 (downsampled=True): 约 rows 行 x width 列。
+    第一次调用时先取一次完整的 raw 截图得到设备的宽高和像素格式 (返回这张完整截图)；
+    屏幕旋转后尺寸变化时同样重新获取，设备不支持时一直退回完整的 raw 截图。
+    """
+    with _geometry_lock:
+        geometry = _geometry.get(adb_path) if adb_path not in _unsupported else None
+    if geometry is None:
+        return _learn_geometry(adb_path)
+    start = time.perf_counter()
+    picks = thumbnail_rows(geometry[1], rows)
+    data = adb_client.exec_out(adb_path, thumbnail_command(geometry, rows))
+    transfer_end = time.perf_counter()
+    row_bytes = geometry[0] * geometry[2]
+    if len(data) != len(picks) * row_bytes:
+        return _learn_geometry(adb_path, previous=geometry)
+    pixels = np.frombuffer(data, dtype=np.uint8).reshape(len(picks), geometry[0], geometry[2])
+    frame = Frame.from_array(np.ascontiguousarray(pixels[:, ::max(1, geometry[0] // width)]))
+    frame.downsampled = True
+    frame.timings["capture_ms"] = (transfer_end - start) * 1000
+    frame.timings["parse_ms"] = (time.perf_counter() - transfer_end) * 1000
+    return frame
+
+
+def _learn_geometry(adb_path, previous=None):
+    frame = capture_screenshot(adb_path, mode="raw")
+    with _geometry_lock:
+        if previous is not None and frame.raw_geometry == previous:
+            # 尺寸没变却取不到缩略图: 设备端命令不可用
+            print(f"Thumbnail capture not supported on {adb_path}, using full raw screenshots")
+            _unsupported.add(adb_path)
+        _geometry[adb_path] = frame.raw_geometry
+    return frame
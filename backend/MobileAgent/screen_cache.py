@@ -0,0 +1,206 @@
+import collections
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from MobileAgent.settle import thumbnail
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "screen_cache.sqlite")
+_ACTION = re.compile(r"Action:\s*(.*?)(?=\n|$)", re.DOTALL)
+
+
+def screen_hash(frame, size=16, status_bar=0.04, margin=2.0):
+    """
+    差值哈希 (dHash): 灰度小图缩到 (size+1) x size，比较相邻像素得到 size*size 位整数。
+    顶部 status_bar 比例的状态栏 (时间、电量) 不参与计算；
+    相邻差值不超过 margin 的记为 0，避免纯色区域被压缩噪声随机翻转。
+    """
+    gray = thumbnail(frame, 128)
+    gray = gray[int(gray.shape[0] * status_bar):]
+    small = np.asarray(Image.fromarray(gray).resize((size + 1, size), Image.BOX))
+    bits = np.packbits(small[:, 1:] - small[:, :-1] > margin)
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def normalize_instruction(instruction):
+    """忽略大小写、空白和标点的差异"""
+    return re.sub(r"[\s\W_]+", "", instruction or "").lower()
+
+
+def action_line(output):
+    match = _ACTION.search(output or "")
+    return re.sub(r"\s+", "", match.group(1)) if match else ""
+
+
+class ScreenActionCache:
+    """
+    截图 -> 模型输出 的缓存，跳过在相同界面上重复的模型调用 (temperature 0 + 固定 seed，输出是确定的)。
+    键为 (模型, 归一化指令, 最近 history_k 个动作) 加截图的感知哈希，哈希距离不超过 max_distance 视为同一界面。
+    内存 LRU 保存最近 capacity 条，全部条目同时写入 sqlite，重启或内存淘汰后从磁盘读回。
+    一条记录在第一次执行后记下动作之后的界面哈希才会被使用；命中后同样检查动作之后的界面，不一致则删除该记录。
+    动作之后界面不变的记录直接丢弃。
+    """
+
+    def __init__(self, path=None, capacity=None, max_distance=None, history_k=2, enabled=None):
+        self.path = path or os.getenv("SCREEN_CACHE_PATH", DEFAULT_PATH)
+        self.capacity = capacity or int(os.getenv("SCREEN_CACHE_SIZE", "512"))
+        self.max_distance = max_distance if max_distance is not None else int(os.getenv("SCREEN_CACHE_DISTANCE", "6"))
+        self.history_k = history_k
+        self.enabled = enabled if enabled is not None else os.getenv("SCREEN_CACHE", "0") == "1"
+        self._memory = collections.OrderedDict()  # (context, hash) -> entry
+        self._lock = threading.Lock()
+        self._db = None
+        self.counters = collections.Counter()
+
+    def _connect(self):
+        if self._db is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS entries (context TEXT, hash TEXT, output TEXT, "
+                             "next_hash TEXT, hits INTEGER DEFAULT 0, created REAL, PRIMARY KEY (context, hash))")
+        return self._db
+
+    def key(self, model, instruction, history_responses, frame):
+        """history_responses 为之前各步的模型输出，只取最近 history_k 个 Action"""
+        if not self.enabled:
+            return None
+        recent = history_responses[-self.history_k:] if self.history_k else []
+        context = "\x1f".join([model, normalize_instruction(instruction)] + [action_line(r) for r in recent])
+        return context, screen_hash(frame)
+
+    def _find(self, context, value):
+        """内存中找最近的哈希，没有再查磁盘"""
+        best = None
+        for (c, h), entry in self._memory.items():
+            if c == context:
+                distance = hamming(h, value)
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, (c, h), entry)
+        if best is not None:
+            return best[1], best[2], "memory"
+        rows = self._connect().execute("SELECT hash, output, next_hash, hits FROM entries WHERE context = ?",
+                                       (context,)).fetchall()
+        for h, output, next_hash, hits in rows:
+            distance = hamming(int(h, 16), value)
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                entry = {"output": output, "next_hash": int(next_hash, 16) if next_hash else None, "hits": hits}
+                best = (distance, (context, int(h, 16)), entry)
+        if best is not None:
+            self._remember(best[1], best[2])
+            return best[1], best[2], "disk"
+        return None, None, None
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _delete(self, key):
+        self._memory.pop(key, None)
+        self._connect().execute("DELETE FROM entries WHERE context = ? AND hash = ?", (key[0], f"{key[1]:x}"))
+        self._db.commit()
+
+    def lookup(self, key):
+        """返回缓存的模型输出；未命中或记录尚未验证过时返回 None"""
+        if key is None:
+            return None
+        with self._lock:
+            self.counters["lookups"] += 1
+            found, entry, tier = self._find(*key)
+            if entry is None or entry["next_hash"] is None:
+                self.counters["misses"] += 1
+                return None
+            self._memory.move_to_end(found)
+            entry["hits"] += 1
+            self.counters["hits"] += 1
+            self.counters[f"{tier}_hits"] += 1
+            self._connect().execute("UPDATE entries SET hits = ? WHERE context = ? AND hash = ?",
+                                    (entry["hits"], found[0], f"{found[1]:x}"))
+            self._db.commit()
+            return entry["output"]
+
+    def store(self, key, output):
+        """模型调用成功后记录输出，动作之后的界面由 confirm 补上"""
+        if key is None:
+            return
+        with self._lock:
+            self._remember(key, {"output": output, "next_hash": None, "hits": 0})
+            self._connect().execute("INSERT OR REPLACE INTO entries (context, hash, output, next_hash, hits, created) "
+                                    "VALUES (?, ?, ?, NULL, 0, ?)", (key[0], f"{key[1]:x}", output, time.time()))
+            self._db.commit()
+            self.counters["stores"] += 1
+
+    def confirm(self, key, frame):
+        """
+        动作执行后的界面检查。新记录记下该界面的哈希；已有记录与之比较，
+        不一致说明缓存的动作不再适用，删除该记录并返回 False。
+        """
+        if key is None:
+            return True
+        value = screen_hash(frame)
+        with self._lock:
+            found, entry, _ = self._find(*key)
+            if entry is None:
+                return True
+            if entry["next_hash"] is None:
+                if hamming(found[1], value) <= self.max_distance:
+                    # 动作之后界面没有变化，无法验证，也可能让缓存原地重复同一个动作，不保留
+                    self._delete(found)
+                    self.counters["no_effect"] += 1
+                    return True
+                entry["next_hash"] = value
+                self._connect().execute("UPDATE entries SET next_hash = ? WHERE context = ? AND hash = ?",
+                                        (f"{value:x}", found[0], f"{found[1]:x}"))
+                self._db.commit()
+                return True
+            if hamming(entry["next_hash"], value) <= self.max_distance:
+                self.counters["validated"] += 1
+                return True
+            self._delete(found)
+            self.counters["invalidated"] += 1
+            return False
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["lookups"]
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._memory),
+                "lookups": lookups,
+                "hits": self.counters["hits"],
+                "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+                "model_calls_saved": self.counters["hits"],
+                "memory_hits": self.counters["memory_hits"],
+                "disk_hits": self.counters["disk_hits"],
+                "stores": self.counters["stores"],
+                "validated": self.counters["validated"],
+                "invalidated": self.counters["invalidated"],
+                "no_effect": self.counters["no_effect"],
+                "evictions": self.counters["evictions"],
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_screen_cache(path=None):
+    """同一个缓存文件在进程内只打开一次，所有 runner 共享"""
+    path = path or os.getenv("SCREEN_CACHE_PATH", DEFAULT_PATH)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = ScreenActionCache(path)
+    return cache
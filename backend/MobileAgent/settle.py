@@ -0,0 +1,118 @@
+import time
+
+import numpy as np
+
+from MobileAgent import tracing
+from MobileAgent.screen import capture_thumbnail
+
+# 原 execute_action 在每个动作后固定 sleep 的秒数，用于统计节省的时间
+FIXED_SLEEP = 2.0
+
+# 各动作类型的 (最短等待, 最长等待) 秒数
+SETTLE_PROFILES = {
+    "click": (0.3, 3.0),
+    "long_press": (0.3, 3.0),
+    "type": (0.2, 2.0),
+    "scroll": (0.4, 3.0),
+    "drag": (0.4, 3.0),
+    "press_back": (0.3, 3.0),
+    "press_home": (0.5, 4.0),
+    "open_app": (1.0, 8.0),
+    "wait": (0.0, 2.0),
+}
+DEFAULT_PROFILE = (0.3, 3.0)
+
+
+def thumbnail(frame, width=64):
+    """按步长抽样得到约 width 像素宽的灰度小图，不做完整缩放"""
+    pixels = frame.pixels
+    step = max(1, pixels.shape[1] // width)
+    return pixels[::step, ::step, :3].mean(axis=2, dtype=np.float32)
+
+
+def frame_diff(a, b):
+    """两张小图的平均绝对差，归一化到 0~1"""
+    if a.shape != b.shape:
+        return 1.0
+    return float(np.abs(a - b).mean()) / 255.0
+
+
+class SettleResult:
+    def __init__(self, action_type, waited, frames, settled, frame=None):
+        self.action_type = action_type
+        self.waited = waited
+        self.frames = frames
+        self.settled = settled
+        self.frame = frame
+
+    @property
+    def saved_ms(self):
+        return (FIXED_SLEEP - self.waited) * 1000
+
+    def __repr__(self):
+        state = "settled" if self.settled else "timeout"
+        return (f"{self.action_type}: {state} after {self.waited * 1000:.0f} ms "
+                f"({self.frames} frames), saved {self.saved_ms:.0f} ms")
+
+
+class Settler:
+    """
+    自适应等待界面稳定: 动作执行后轮询低分辨率画面，连续 stable_frames 帧
+    与前一帧的差异都低于 threshold 即认为界面已稳定；等待时间限制在
+    该动作类型的 [最短, 最长] 区间内。
+    capture 为返回 screen.Frame 的函数，默认为 screen.capture_thumbnail (设备端只传回几十行像素)。
+    只比较 frame_id 比上一帧新的帧: 帧源还没产出新帧时重复拿到的旧帧不算一次稳定；
+    unchanged_when_stale=True 时 (screenrecord 这种只在画面变化时出帧的源) 没有新帧即说明画面没变。
+    """
+
+    def __init__(self, adb_path=None, capture=None, threshold=0.01, stable_frames=2,
+                 interval=0.1, profiles=None, unchanged_when_stale=False):
+        self.capture = capture or (lambda: capture_thumbnail(adb_path))
+        self.unchanged_when_stale = unchanged_when_stale
+        self.threshold = threshold
+        self.stable_frames = stable_frames
+        self.interval = interval
+        self.profiles = profiles or SETTLE_PROFILES
+        self.last_result = None
+        self.count = 0
+        self.total_saved_ms = 0.0
+
+    def wait(self, action_type):
+        min_wait, max_wait = self.profiles.get(action_type, DEFAULT_PROFILE)
+        start = time.monotonic()
+        trace_start = time.perf_counter()
+        frames, stable, settled, frame = 0, 0, False, None
+        try:
+            frame = self.capture()
+            previous = thumbnail(frame)
+            frames += 1
+            while time.monotonic() - start < max_wait:
+                time.sleep(self.interval)
+                latest = self.capture()
+                if latest.frame_id == frame.frame_id:
+                    # 没有新帧: 只在画面变化时出帧的源说明画面没变，其他情况不能当作稳定
+                    if not self.unchanged_when_stale:
+                        continue
+                    stable += 1
+                else:
+                    frame = latest
+                    current = thumbnail(frame)
+                    frames += 1
+                    stable = stable + 1 if frame_diff(previous, current) < self.threshold else 0
+                    previous = current
+                if stable >= self.stable_frames and time.monotonic() - start >= min_wait:
+                    settled = True
+                    break
+        except Exception as e:
+            # 截图失败时退回固定等待
+            print(f"Settle capture failed ({e}), falling back to fixed sleep")
+            frame = None
+            time.sleep(max(0.0, FIXED_SLEEP - (time.monotonic() - start)))
+        # 低分辨率帧不能作为下一步的截图
+        result = SettleResult(action_type, time.monotonic() - start, frames, settled,
+                              frame if frame is not None and not frame.downsampled else None)
+        tracing.add("settle", trace_start, cat="settle", action=action_type, frames=frames, settled=settled)
+        self.last_result = result
+        self.count += 1
+        self.total_saved_ms += result.saved_ms
+        return result
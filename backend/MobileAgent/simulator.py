@@ -0,0 +1,319 @@
+import io
+import json
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from MobileAgent.device_backend import DeviceBackend
+from MobileAgent.screen import run_thumbnail_command
+
+LAUNCHER = "com.android.launcher3/com.android.launcher3.Launcher"
+# 与 controller 中的按键一致
+KEYCODES = {"3": "home", "4": "back", "66": "enter"}
+
+
+class Screen:
+    """屏幕图中的一个界面: 截图 (PNG) + 所属 Activity + 可以触发跳转的区域"""
+
+    def __init__(self, name, png, app=None, regions=()):
+        self.name = name
+        self.png = png
+        self.app = app or LAUNCHER
+        self.regions = list(regions)
+        self._raw = None
+
+    def raw(self):
+        """与 `screencap` (不带 -p) 相同的输出: 宽 高 格式(RGBA_8888) dataspace + 像素"""
+        if self._raw is None:
+            image = Image.open(io.BytesIO(self.png)).convert("RGBA")
+            self._raw = struct.pack("<IIII", image.width, image.height, 1, 0) + image.tobytes()
+        return self._raw
+
+
+def parse_gesture(command):
+    """把 controller 发出的 shell 命令转成手势: (类型, 参数字典)，不是输入类命令时返回 None"""
+    args = command.split()
+    if args[:2] == ["input", "tap"]:
+        return "tap", {"x": float(args[2]), "y": float(args[3])}
+    if args[:2] == ["input", "swipe"]:
+        x1, y1, x2, y2 = (float(v) for v in args[2:6])
+        if abs(x2 - x1) < 10 and abs(y2 - y1) < 10:
+            return "long_press", {"x": x1, "y": y1}
+        if abs(x2 - x1) > abs(y2 - y1):
+            direction = "left" if x2 < x1 else "right"
+        else:
+            direction = "up" if y2 < y1 else "down"
+        return "swipe", {"x": x1, "y": y1, "direction": direction}
+    if args[:2] == ["input", "keyevent"] and len(args) > 2:
+        return KEYCODES.get(args[2], "key"), {}
+    if args[:2] == ["input", "text"] or (args[:3] == ["am", "broadcast", "-a"] and "ADB_INPUT" in command):
+        return "text", {}
+    if args[:2] == ["am", "start"] and "android.intent.category.HOME" in args:
+        return "home", {}
+    if args[:1] == ["monkey"] and "-p" in args:
+        return "app", {"package": args[args.index("-p") + 1]}
+    return None
+
+
+def _region_matches(region, kind, params):
+    if region.get("action", "tap") != kind:
+        return False
+    box = region.get("box")
+    if box is not None and "x" in params:
+        x1, y1, x2, y2 = box
+        if not (x1 <= params["x"] <= x2 and y1 <= params["y"] <= y2):
+            return False
+    if "direction" in region and region["direction"] != params.get("direction"):
+        return False
+    if "package" in region and region["package"] != params.get("package"):
+        return False
+    return True
+
+
+class ScreenGraph:
+    """
+    录制的屏幕图。JSON 格式:
+        {"start": "home", "home": "home", "transition_ms": 0,
+         "screens": {"home": {"image": "home.png", "app": "com.pkg/.Main",
+                              "regions": [{"action": "tap", "box": [x1, y1, x2, y2], "to": "settings", "delay_ms": 300},
+                                          {"action": "swipe", "direction": "up", "to": "drawer"},
+                                          {"action": "app", "package": "com.pkg", "to": "app_home"}]}}}
+    action 为 tap / long_press / swipe / back / home / enter / text / app；没有匹配区域时
+    back 回到上一个界面，home 回到 home 界面，其余手势停留在当前界面。
+    """
+
+    def __init__(self, screens, start, home=None, transition_ms=0.0):
+        self.screens = screens
+        self.start = start
+        self.home = home or start
+        self.transition_ms = transition_ms
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            spec = json.load(f)
+        base = os.path.dirname(os.path.abspath(path))
+        screens = {}
+        for name, item in spec["screens"].items():
+            with open(os.path.join(base, item["image"]), "rb") as f:
+                png = f.read()
+            screens[name] = Screen(name, png, item.get("app"), item.get("regions", ()))
+        return cls(screens, spec.get("start") or next(iter(screens)), spec.get("home"), spec.get("transition_ms", 0.0))
+
+    @classmethod
+    def from_trajectory(cls, store, session, radius=80):
+        """
+        由 trajectory 记录的会话生成屏幕图: 每张不同的截图是一个界面，
+        每一步执行的输入命令 (tap 点周围 radius 像素) 连到下一步的截图。
+        """
+        steps = [r for r in store.steps(session) if r.get("screenshot")]
+        screens = {}
+        for record in steps:
+            name = record["screenshot"][:12]
+            if name not in screens:
+                screens[name] = Screen(name, store.blob(record["screenshot"]))
+        for record, following in zip(steps, steps[1:]):
+            for command in (c["command"] for c in record.get("commands", []) if c.get("kind") == "shell"):
+                gesture = parse_gesture(command)
+                if gesture is None:
+                    continue
+                kind, params = gesture
+                region = {"action": kind, "to": following["screenshot"][:12]}
+                if "x" in params:
+                    region["box"] = [params["x"] - radius, params["y"] - radius,
+                                     params["x"] + radius, params["y"] + radius]
+                for key in ("direction", "package"):
+                    if key in params:
+                        region[key] = params[key]
+                screens[record["screenshot"][:12]].regions.append(region)
+                break
+        if not screens:
+            raise ValueError(f"session {session} has no screenshots")
+        return cls(screens, steps[0]["screenshot"][:12])
+
+    def transition(self, screen, kind, params):
+        """返回 (下一个界面名, 延迟毫秒)，没有匹配的区域返回 (None, 0)"""
+        for region in self.screens[screen].regions:
+            if _region_matches(region, kind, params):
+                return region["to"], region.get("delay_ms", self.transition_ms)
+        return None, 0
+
+
+class SimulatedDevice(DeviceBackend):
+    """
+    按屏幕图模拟的设备: screencap 返回当前界面的截图，输入命令命中某个区域时跳转到对应界面。
+    capture_ms / input_ms 模拟截图和输入命令的耗时 (环境变量 SIM_CAPTURE_MS / SIM_INPUT_MS)。
+    """
+
+    def __init__(self, graph, serial="sim-0", capture_ms=None, input_ms=None):
+        self.graph = graph
+        self.serial = serial
+        self.capture_ms = capture_ms if capture_ms is not None else float(os.getenv("SIM_CAPTURE_MS", "0"))
+        self.input_ms = input_ms if input_ms is not None else float(os.getenv("SIM_INPUT_MS", "0"))
+        self.files = {}
+        self.commands = []
+        self.stats = {"captures": 0, "thumbnails": 0, "inputs": 0, "transitions": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._current = self.graph.start
+            self._pending = None  # (生效时间, 界面名)
+            self._back_stack = []
+
+    @property
+    def current(self):
+        with self._lock:
+            return self._settle_pending()
+
+    def _settle_pending(self):
+        if self._pending is not None and time.monotonic() >= self._pending[0]:
+            self._back_stack.append(self._current)
+            self._current = self._pending[1]
+            self._pending = None
+        return self._current
+
+    def _input(self, kind, params):
+        with self._lock:
+            current = self._settle_pending()
+            target, delay_ms = self.graph.transition(current, kind, params)
+            if target is None and kind == "back" and self._back_stack:
+                self._current = self._back_stack.pop()
+                self.stats["transitions"] += 1
+                return
+            if target is None and kind == "home":
+                target, delay_ms = self.graph.home, 0
+            if target is None or target == current:
+                self.stats["misses"] += target is None
+                return
+            self.stats["transitions"] += 1
+            self._pending = (time.monotonic() + delay_ms / 1000, target)
+            self._settle_pending()
+
+    def devices(self):
+        return [(self.serial, "device")]
+
+    def shell(self, command, serial=None):
+        self.commands.append(command)
+        args = command.split()
+        gesture = parse_gesture(command)
+        if gesture is not None:
+            if self.input_ms:
+                time.sleep(self.input_ms / 1000)
+            self.stats["inputs"] += 1
+            self._input(*gesture)
+            return ""
+        if "dumpsys" in command:
+            app = self.graph.screens[self.current].app
+            return (f"  mCurrentFocus=Window{{1a2b3c u0 {app}}}\n"
+                    f"  mFocusedApp=ActivityRecord{{4d5e6f u0 {app} t7}}\n"
+                    f"  mAppTransitionState=APP_STATE_IDLE\n"
+                    f"--activity--\n"
+                    f"    mResumedActivity: ActivityRecord{{4d5e6f u0 {app} t7}}\n")
+        if args[:2] == ["wm", "size"]:
+            image = Image.open(io.BytesIO(self.graph.screens[self.current].png))
+            return f"Physical size: {image.width}x{image.height}\n"
+        if args[:1] == ["echo"]:
+            return " ".join(args[1:]) + "\n"
+        if args[:1] == ["screencap"]:
+            self.exec_out(command)
+        return ""
+
+    def exec_out(self, command, serial=None):
+        args = command.split()
+        if args[:1] != ["screencap"]:
+            return self.shell(command, serial).encode("utf-8")
+        if "|" in args:
+            # 界面稳定检测的低分辨率截图 (screen.thumbnail_command)，只传回几十行
+            self.stats["thumbnails"] += 1
+            return run_thumbnail_command(command, self.graph.screens[self.current].raw()) or b""
+        if self.capture_ms:
+            time.sleep(self.capture_ms / 1000)
+        screen = self.graph.screens[self.current]
+        self.stats["captures"] += 1
+        data = screen.png if "-p" in args else screen.raw()
+        paths = [a for a in args[1:] if not a.startswith("-")]
+        if paths:
+            self.files[paths[0]] = data
+            return b""
+        return data
+
+    def pull(self, remote_path, serial=None):
+        return self.files[remote_path]
+
+    def __repr__(self):
+        return f"SimulatedDevice({self.serial}, screen={self.current})"
+
+
+class SimulatedFleet(DeviceBackend):
+    """
+    多台模拟设备注册在同一个名字下，按 serial 分发命令 (adb_path 为 "sim://名字 -s serial")，
+    `devices()` 列出所有 serial，DeviceRegistry 的设备发现和 /api/devices/{serial}/... 接口可以直接使用。
+    """
+
+    def __init__(self, devices):
+        self.members = {device.serial: device for device in devices}
+
+    @classmethod
+    def from_graph(cls, graph, count, prefix="sim", capture_ms=None, input_ms=None):
+        return cls([SimulatedDevice(graph, f"{prefix}-{i}", capture_ms, input_ms) for i in range(count)])
+
+    def _device(self, serial):
+        if serial is None:
+            return next(iter(self.members.values()))
+        return self.members[serial]
+
+    def reset(self):
+        for device in self.members.values():
+            device.reset()
+
+    @property
+    def stats(self):
+        total = {"captures": 0, "inputs": 0, "transitions": 0, "misses": 0}
+        for device in self.members.values():
+            for key in total:
+                total[key] += device.stats[key]
+        return total
+
+    def devices(self):
+        return [(serial, "device") for serial in self.members]
+
+    def shell(self, command, serial=None):
+        return self._device(serial).shell(command)
+
+    def exec_out(self, command, serial=None):
+        return self._device(serial).exec_out(command)
+
+    def pull(self, remote_path, serial=None):
+        return self._device(serial).pull(remote_path)
+
+    def __repr__(self):
+        return f"SimulatedFleet({len(self.members)} devices)"
+
+
+def synthetic_graph(steps=5, width=1080, height=2340, button=(540, 1800, 120), seed=0):
+    """
+    n 个界面串成一条链，每个界面底部中央有一个按钮跳到下一个界面，最后一个界面回到第一个。
+    按钮中心为 button[:2]，半径 button[2]；用于没有录制数据时的吞吐测试。seed 不同的屏幕图截图互不相同。
+    """
+    rng = np.random.default_rng(seed)
+    x, y, r = button
+    screens = {}
+    for i in range(steps):
+        pixels = np.full((height, width, 3), 245, dtype=np.uint8)
+        # 每个界面的色块和文字行不同，截图之间可以区分
+        for row in range(8):
+            top = 200 + row * 180
+            pixels[top:top + 120, 60:width - 60] = rng.integers(40, 220, 3)
+        pixels[y - r:y + r, x - r:x + r] = (30, 120, 240)
+        buf = io.BytesIO()
+        Image.fromarray(pixels).save(buf, format="PNG", compress_level=1)
+        name = f"screen{i}"
+        regions = [{"action": "tap", "box": [x - r, y - r, x + r, y + r], "to": f"screen{(i + 1) % steps}"}]
+        screens[name] = Screen(name, buf.getvalue(), f"com.sim.app/.Page{i}", regions)
+    return ScreenGraph(screens, "screen0")
@@ -0,0 +1,162 @@
+import json
+import re
+import time
+
+import requests
+
+from MobileAgent import tracing
+from MobileAgent.retry import post_with_retry
+
+_ACTION = re.compile(r"(?:^|\n)\s*Action:[ \t]*")
+_THOUGHT = re.compile(r"Thought:\s*(.*?)(?=\n\s*Action:|$)", re.DOTALL)
+
+
+def iter_sse(res):
+    """逐条解析 text/event-stream 中的 data: 事件，遇到 [DONE] 结束"""
+    # text/event-stream 未声明 charset 时 requests 会按 ISO-8859-1 解码，SSE 规定为 UTF-8
+    if "charset" not in res.headers.get("Content-Type", ""):
+        res.encoding = "utf-8"
+    done = False
+    # chunk_size=None: 数据到达即返回，不等凑满缓冲区
+    for line in res.iter_lines(chunk_size=None, decode_unicode=True):
+        # [DONE] 之后继续读到响应结尾 (chunked 的结束块)；中途退出 iter_lines 时 urllib3 会关闭连接而不是放回连接池
+        if done or not line or not line.startswith("data:"):
+            continue
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            done = True
+            continue
+        yield json.loads(payload)
+
+
+def _call_end(text):
+    """text 以 click(...) 这样的调用开头时，返回括号闭合处的下标 (忽略引号内的括号)，未闭合返回 None"""
+    depth, quote, escaped = 0, None, False
+    for i, ch in enumerate(text):
+        if escaped:
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return None
+
+
+class ActionStreamParser:
+    """
+    增量解析模型输出的 Thought: / Action:。
+    Action 行写完 (换行或调用的括号闭合) 即可拿到 action，后面的生成可以取消。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.action = None
+        self.action_end = None
+        self.stopped_early = False
+        self.start = time.monotonic()
+        self.first_token_ms = None
+        self.action_ms = None
+
+    @property
+    def thought(self):
+        match = _THOUGHT.search(self.text)
+        return match.group(1).strip() if match else ""
+
+    def output(self):
+        # 提前停止时只保留到 Action 行末尾，与完整输出的解析结果一致
+        return self.text[:self.action_end] if self.action_end else self.text
+
+    def feed(self, delta):
+        if self.first_token_ms is None:
+            self.first_token_ms = (time.monotonic() - self.start) * 1000
+        self.text += delta
+        if self.action is None:
+            self._find_action()
+        return self.action
+
+    def _find_action(self):
+        match = _ACTION.search(self.text)
+        if not match:
+            return
+        rest = self.text[match.end():]
+        end = _call_end(rest)
+        if end is None:
+            newline = rest.find("\n")
+            # 调用的括号未闭合时 (如 type 的内容里有换行) 继续等待
+            if newline <= 0 or not rest[:newline].strip() or "(" in rest[:newline]:
+                return
+            end = newline
+        self.action = rest[:end].strip()
+        self.action_end = match.end() + end
+        self.action_ms = (time.monotonic() - self.start) * 1000
+
+    def finish(self):
+        # 流结束时最后一行没有换行也算完整
+        if self.action is None:
+            match = _ACTION.search(self.text)
+            if match and self.text[match.end():].strip():
+                self.action = self.text[match.end():].strip()
+                self.action_ms = (time.monotonic() - self.start) * 1000
+        return self
+
+
+def stream_chat(client, url, data, policy=None, on_update=None, early_stop=True, **kwargs):
+    """
+    以 stream=True 请求 chat/completions，边收边解析。data 为请求字典，或 RequestBuilder.build(stream=True) 的字节串。
+    on_update(parser) 在每个增量到达时调用；early_stop 时拿到完整 Action 即停止解析。
+    之后按后端的 client.cancel_on_disconnect: 开启时立即关闭连接，服务端 (vLLM) 检测到断开即取消剩余生成，
+    代价是下一步要重新建立 TCP/TLS 连接；关闭时读完剩余的尾部，连接放回连接池复用 (断开不会停止生成的后端)。
+    请求和读取到 Action 为止都在 policy 的重试范围内: 拿到 Action 之前流中断会计入熔断并重新请求。
+    返回 ActionStreamParser，parser.output() 为模型输出文本。
+    """
+    if isinstance(data, (bytes, bytearray)):
+        # RequestBuilder 预先拼好的请求体 (已带 "stream": true)
+        kwargs["data"] = data
+    else:
+        kwargs["json"] = dict(data, stream=True)
+
+    def read(res):
+        # 每次尝试一个新的 parser；计时从发出本次请求开始 (res.elapsed 为请求到响应头的耗时)，first_token_ms 即 TTFT
+        elapsed = res.elapsed.total_seconds()
+        parser = ActionStreamParser()
+        parser.start = time.monotonic() - elapsed
+        start = time.perf_counter() - elapsed
+        events = iter_sse(res)
+        try:
+            for event in events:
+                choices = event.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content") or ""
+                if not delta:
+                    continue
+                if parser.first_token_ms is None:
+                    tracing.add("time_to_first_token", start, cat="inference")
+                action = parser.feed(delta)
+                if on_update:
+                    on_update(parser)
+                if action is not None and early_stop:
+                    parser.stopped_early = True
+                    break
+            if parser.stopped_early and not client.cancel_on_disconnect:
+                # 读完剩余输出 (不再解析)，响应读到结尾后连接才会放回连接池
+                with tracing.span("drain_stream", cat="inference"):
+                    for _ in events:
+                        pass
+        except (requests.RequestException, ValueError) as e:
+            if parser.action is None:
+                # 由 post_with_retry 计入熔断并重试
+                raise requests.ConnectionError(f"stream interrupted: {e}") from e
+        finally:
+            # 未读完的流关闭后连接不会放回连接池，服务端检测到断开即停止生成
+            res.close()
+        return parser.finish()
+
+    return post_with_retry(client, url, policy=policy, read=read, stream=True, **kwargs)
@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+import time
+
+_local = threading.local()
+
+
+def tracing_enabled():
+    return os.getenv("TRACE", "1") != "0"
+
+
+class TraceRecorder:
+    """
+    一次 agent 运行的时间线，导出为 Chrome Trace Event JSON (chrome://tracing / ui.perfetto.dev 可直接打开)。
+    事件时间用 time.perf_counter()，同一线程内的嵌套调用显示为嵌套的 span，不同线程显示为不同的轨道。
+    超过 max_events 的事件丢弃并计数，内存有上限。
+    """
+
+    def __init__(self, name="agent", max_events=50000, **metadata):
+        self.name = name
+        self.metadata = metadata
+        self.max_events = max_events
+        self.origin = time.perf_counter()
+        self.events = []  # (ph, name, cat, start, end, thread, args)
+        self.dropped = 0
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def _append(self, event):
+        with self._lock:
+            if len(self.events) >= self.max_events:
+                self.dropped += 1
+                return
+            thread = threading.current_thread()
+            if thread.ident not in self._threads:
+                self._threads[thread.ident] = (len(self._threads) + 1, thread.name)
+            self.events.append(event + (thread.ident,))
+
+    def add(self, name, start, end=None, cat="agent", **args):
+        """已经计好时的一段: start / end 为 perf_counter() 的值，end 默认为现在"""
+        self._append(("X", name, cat, start, end if end is not None else time.perf_counter(), args))
+
+    def instant(self, name, cat="agent", **args):
+        now = time.perf_counter()
+        self._append(("i", name, cat, now, now, args))
+
+    def span(self, name, cat="agent", **args):
+        """with recorder.span("encode") as args: ...，args 可在块内补充"""
+        return _Span(self, name, cat, args)
+
+    def to_events(self, pid=1, origin=None):
+        origin = self.origin if origin is None else origin
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self._threads)
+        result = [{"ph": "M", "name": "process_name", "pid": pid, "tid": 0, "args": {"name": self.name}}]
+        for tid, thread_name in threads.values():
+            result.append({"ph": "M", "name": "thread_name", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+        for ph, name, cat, start, end, args, ident in events:
+            event = {"ph": ph, "name": name, "cat": cat, "pid": pid, "tid": threads[ident][0],
+                     "ts": round((start - origin) * 1e6, 1)}
+            if ph == "X":
+                event["dur"] = round((end - start) * 1e6, 1)
+            else:
+                event["s"] = "t"
+            if args:
+                event["args"] = args
+            result.append(event)
+        return result
+
+    def to_json(self):
+        return chrome_trace([self])
+
+
+def chrome_trace(recorders):
+    """多个 TraceRecorder (如多台设备或多次运行) 合并到同一条时间轴，每个一个进程轨道"""
+    recorders = [r for r in recorders if r is not None]
+    origin = min((r.origin for r in recorders), default=0.0)
+    events = []
+    for pid, recorder in enumerate(recorders, 1):
+        events.extend(recorder.to_events(pid, origin))
+    return {
+        "traceEvents": events,
+        "displayTimeUnit": "ms",
+        "otherData": {r.name: dict(r.metadata, dropped_events=r.dropped) for r in recorders},
+    }
+
+
+def save(recorders, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(chrome_trace(recorders), f, ensure_ascii=False, default=str)
+
+
+class _Span:
+    __slots__ = ("recorder", "name", "cat", "args", "start")
+
+    def __init__(self, recorder, name, cat, args):
+        self.recorder = recorder
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self.args
+
+    def __exit__(self, *exc):
+        if self.recorder is not None:
+            self.recorder.add(self.name, self.start, cat=self.cat, **self.args)
+
+
+class activate:
+    """
+    把 recorder 绑定到当前线程，下层代码 (adb 命令、流式推理、界面稳定等待) 通过 current() 记录 span，
+    其他 runner 的线程不受影响；recorder 为 None 时不记录:
+        with tracing.activate(recorder):
+            run()
+    """
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+
+    def __enter__(self):
+        self._previous = getattr(_local, "recorder", None)
+        _local.recorder = self.recorder
+        return self.recorder
+
+    def __exit__(self, *exc):
+        _local.recorder = self._previous
+
+
+def current():
+    return getattr(_local, "recorder", None)
+
+
+def add(name, start, end=None, cat="agent", **args):
+    recorder = current()
+    if recorder is not None:
+        recorder.add(name, start, end, cat, **args)
+
+
+def instant(name, cat="agent", **args):
+    recorder = current()
+    if recorder is not None:
+        recorder.instant(name, cat, **args)
+
+
+def span(name, cat="agent", **args):
+    return _Span(current(), name, cat, args)
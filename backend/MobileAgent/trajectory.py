@@ -0,0 +1,262 @@
+import hashlib
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import uuid
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "trajectories")
+
+# 定长索引记录
+# blobs.idx: sha256(32) + 偏移(8) + 长度(4)
+# steps.idx: 会话 id(16) + 步数(4) + 偏移(8) + 长度(4)，第 0 步为会话信息
+BLOB_RECORD = struct.Struct("<32sQI")
+STEP_RECORD = struct.Struct("<16sIQI")
+
+
+class _Segment:
+    """只追加的数据文件 + 定长记录的索引文件；先写数据再写索引，读取时忽略不完整的尾部"""
+
+    def __init__(self, directory, name, record):
+        self.data_path = os.path.join(directory, f"{name}.seg")
+        self.index_path = os.path.join(directory, f"{name}.idx")
+        self.record = record
+        self._data = open(self.data_path, "ab")
+        self._index = open(self.index_path, "ab")
+
+    def append(self, payload, *key):
+        offset = self._data.tell()
+        self._data.write(payload)
+        self._data.flush()
+        self._index.write(self.record.pack(*key, offset, len(payload)))
+        self._index.flush()
+        return offset
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+
+class _Index:
+    """
+    索引在内存中的映射 {键: (偏移, 长度)}，键为索引记录去掉偏移和长度后的部分。
+    第一次使用时读入整个索引文件，之后只读入新追加的记录 (本进程写入的记录在追加时直接加入)；
+    数据文件保持 mmap，文件变大时重新映射。单条记录的读取与存储中的记录总数无关。
+    """
+
+    def __init__(self, directory, name, record):
+        self.index_path = os.path.join(directory, f"{name}.idx")
+        self.data_path = os.path.join(directory, f"{name}.seg")
+        self.record = record
+        self.entries = {}
+        self.groups = {}  # 键的第一部分 -> 其余部分的列表 (会话 id -> 步数)，按写入顺序
+        self._position = 0
+        self._data = None
+        self._lock = threading.Lock()
+
+    def _add(self, key, offset, length):
+        if key not in self.entries:
+            self.entries[key] = (offset, length)
+            if len(key) > 1:
+                self.groups.setdefault(key[0], []).append(key[1:] if len(key) > 2 else key[1])
+
+    def add(self, key, offset, length):
+        with self._lock:
+            self._add(key, offset, length)
+
+    def refresh(self):
+        """读入索引文件中新追加的完整记录 (包括其他进程写入的)"""
+        with self._lock:
+            try:
+                with open(self.index_path, "rb") as f:
+                    f.seek(self._position)
+                    chunk = f.read()
+            except FileNotFoundError:
+                return
+            usable = len(chunk) // self.record.size * self.record.size
+            for record in self.record.iter_unpack(chunk[:usable]):
+                self._add(record[:-2], record[-2], record[-1])
+            self._position += usable
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.refresh()
+            entry = self.entries.get(key)
+        return entry
+
+    def read(self, offset, length):
+        with self._lock:
+            if self._data is None or offset + length > len(self._data):
+                if self._data is not None:
+                    self._data.close()
+                    self._data = None
+                if not os.path.exists(self.data_path) or os.path.getsize(self.data_path) < offset + length:
+                    return None
+                with open(self.data_path, "rb") as f:
+                    self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return self._data[offset:offset + length]
+
+    def close(self):
+        with self._lock:
+            if self._data is not None:
+                self._data.close()
+                self._data = None
+
+
+class TrajectoryStore:
+    """
+    轨迹的磁盘存储。每一步记录截图、模型原始输出、解析后的动作、执行的 adb 命令和各阶段耗时。
+    截图按内容 sha256 去重写入 blobs.seg，步骤记录 (JSON) 写入 steps.seg，两者都只追加；
+    读取时由内存中的索引映射直接定位单条记录 (数据文件保持 mmap)，不需要加载整个会话。
+    写入在后台线程完成 (PNG 编码、落盘不占用 agent 循环)，同一目录在进程内共享一个 store。
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.getenv("TRAJECTORY_DIR", DEFAULT_DIR)
+        self._lock = threading.Lock()
+        self._writer = None
+        self._queue = queue.Queue()
+        self._blobs = None
+        self._steps = None
+        self._blob_index = _Index(self.directory, "blobs", BLOB_RECORD)
+        self._step_index = _Index(self.directory, "steps", STEP_RECORD)
+        self.counters = {"sessions": 0, "steps": 0, "blobs_written": 0, "blobs_deduped": 0, "bytes_written": 0}
+
+    # ---------------------------------- 写入 ----------------------------------
+
+    def _open(self):
+        if self._blobs is None:
+            os.makedirs(self.directory, exist_ok=True)
+            # 已有的截图用于去重
+            self._blob_index.refresh()
+            self._blobs = _Segment(self.directory, "blobs", BLOB_RECORD)
+            self._steps = _Segment(self.directory, "steps", STEP_RECORD)
+            self._writer = threading.Thread(target=self._write_loop, daemon=True)
+            self._writer.start()
+
+    def new_session(self, **info):
+        """开始一个会话，返回会话 id (hex)"""
+        session = uuid.uuid4().hex
+        with self._lock:
+            self._open()
+            self.counters["sessions"] += 1
+        self._queue.put((session, 0, None, dict(info, started=time.time())))
+        return session
+
+    def record_step(self, session, step, frame=None, **fields):
+        """fields: output / action / commands / timings 等，可 JSON 序列化即可"""
+        with self._lock:
+            self._open()
+        self._queue.put((session, step, frame, dict(fields, time=time.time())))
+
+    def put_blob(self, data):
+        sha = hashlib.sha256(data).hexdigest()
+        key = (bytes.fromhex(sha),)
+        with self._lock:
+            if key in self._blob_index.entries:
+                self.counters["blobs_deduped"] += 1
+                return sha
+            self._blob_index.add(key, self._blobs.append(data, *key), len(data))
+            self.counters["blobs_written"] += 1
+            self.counters["bytes_written"] += len(data)
+        return sha
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                session, step, frame, fields = item
+                if frame is not None:
+                    fields["screenshot"] = self.put_blob(frame.data)
+                    fields["size"] = [frame.width, frame.height]
+                payload = json.dumps(fields, ensure_ascii=False, default=str).encode("utf-8")
+                with self._lock:
+                    key = (bytes.fromhex(session), step)
+                    self._step_index.add(key, self._steps.append(payload, *key), len(payload))
+                    self.counters["steps"] += step > 0
+                    self.counters["bytes_written"] += len(payload)
+            except Exception as e:
+                print(f"trajectory write failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """等待已提交的记录全部落盘"""
+        self._queue.join()
+
+    def close(self):
+        if self._writer is not None:
+            self.flush()
+            self._queue.put(None)
+            self._writer.join()
+            with self._lock:
+                self._blobs.close()
+                self._steps.close()
+                self._blobs = self._steps = self._writer = None
+        self._blob_index.close()
+        self._step_index.close()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, pending=self._queue.unfinished_tasks, directory=self.directory)
+
+    # ---------------------------------- 读取 ----------------------------------
+
+    def _read_step(self, session, step):
+        entry = self._step_index.get((session, step))
+        if entry is None:
+            return None
+        payload = self._step_index.read(*entry)
+        return json.loads(payload) if payload is not None else None
+
+    def sessions(self):
+        """[(会话 id, 会话信息)]，按开始顺序"""
+        self._step_index.refresh()
+        found = []
+        for session, steps in list(self._step_index.groups.items()):
+            if 0 in steps:
+                info = self._read_step(session, 0)
+                if info is not None:
+                    found.append((session.hex(), info))
+        return found
+
+    def step(self, session, step):
+        """读取单步记录，不存在返回 None"""
+        return self._read_step(bytes.fromhex(session), step)
+
+    def steps(self, session):
+        """逐步读取会话中的所有步骤 (不含第 0 步的会话信息)"""
+        key = bytes.fromhex(session)
+        self._step_index.refresh()
+        for n in list(self._step_index.groups.get(key, ())):
+            record = self._read_step(key, n) if n > 0 else None
+            if record is not None:
+                yield dict(record, step=n)
+
+    def blob(self, sha):
+        entry = self._blob_index.get((bytes.fromhex(sha),))
+        return self._blob_index.read(*entry) if entry is not None else None
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def recording_enabled():
+    """默认不记录；TRAJECTORY_RECORD=1 开启，宏库 (MACRO_CACHE=1) 依赖轨迹，开启宏库时默认也记录"""
+    return os.getenv("TRAJECTORY_RECORD", os.getenv("MACRO_CACHE", "0")) == "1"
+
+
+def get_trajectory_store(directory=None):
+    directory = os.path.abspath(directory or os.getenv("TRAJECTORY_DIR", DEFAULT_DIR))
+    with _stores_lock:
+        store = _stores.get(directory)
+        if store is None:
+            store = _stores[directory] = TrajectoryStore(directory)
+    return store
@@ -0,0 +1,155 @@
+import re
+import time
+
+from MobileAgent import adb_client
+
+# 只在设备端 grep 出需要的几行，返回的字符串远小于一张截图
+PROBE_COMMAND = (
+    "dumpsys window | grep -E 'mCurrentFocus|mFocusedApp|mAppTransitionState'; "
+    "echo '--activity--'; "
+    "dumpsys activity activities | grep -E 'mResumedActivity|topResumedActivity|ResumedActivity:'"
+)
+
+# 这些动作会引起 Activity / 窗口切换，可以用系统状态判断切换是否结束
+TRANSITION_ACTIONS = {
+    "open_app": 8.0,
+    "press_home": 4.0,
+    "press_back": 3.0,
+}
+
+_COMPONENT = r"([\w.]+)/([\w.$]+)"
+
+
+class UiState:
+    def __init__(self, focus=None, focused_app=None, resumed_activity=None, transition=None):
+        self.focus = focus                        # 当前焦点窗口, 如 com.pkg/com.pkg.MainActivity
+        self.focused_app = focused_app            # 焦点应用的 Activity
+        self.resumed_activity = resumed_activity  # 前台 resumed Activity
+        self.transition = transition              # mAppTransitionState, 如 APP_STATE_IDLE
+
+    @property
+    def package(self):
+        for component in (self.resumed_activity, self.focused_app, self.focus):
+            if component and "/" in component:
+                return component.split("/", 1)[0]
+        return None
+
+    @property
+    def idle(self):
+        # 没有该字段的系统版本视为空闲
+        return self.transition is None or self.transition.endswith("IDLE")
+
+    def key(self):
+        return self.focus, self.focused_app, self.resumed_activity
+
+    def __eq__(self, other):
+        return isinstance(other, UiState) and self.key() == other.key() and self.transition == other.transition
+
+    def __repr__(self):
+        return (f"UiState(focus={self.focus}, app={self.focused_app}, "
+                f"resumed={self.resumed_activity}, transition={self.transition})")
+
+
+def _component(line):
+    match = re.search(_COMPONENT, line)
+    if not match:
+        return None
+    package, activity = match.groups()
+    # 把 .MainActivity 这样的简写补全为完整类名
+    if activity.startswith("."):
+        activity = package + activity
+    return f"{package}/{activity}"
+
+
+def parse_window_dump(text):
+    """解析 `dumpsys window` 的 mCurrentFocus / mFocusedApp / mAppTransitionState 行"""
+    focus = focused_app = transition = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("mCurrentFocus="):
+            # 例: mCurrentFocus=Window{5e0b3c1 u0 com.android.settings/com.android.settings.Settings}
+            # 无焦点窗口时为 mCurrentFocus=null
+            focus = _component(line) or focus
+            if focus is None and "Window{" in line:
+                # 非 Activity 窗口, 如 Window{... u0 NotificationShade}
+                match = re.search(r"Window\{\S+ u\d+ ([^}]+)\}", line)
+                focus = match.group(1) if match else None
+        elif line.startswith("mFocusedApp="):
+            # 例: mFocusedApp=ActivityRecord{8c1d2f u0 com.android.settings/.Settings t12}
+            focused_app = _component(line) or focused_app
+        elif "mAppTransitionState=" in line:
+            transition = line.split("mAppTransitionState=", 1)[1].split()[0]
+    return focus, focused_app, transition
+
+
+def parse_activity_dump(text):
+    """解析 `dumpsys activity activities` 中的 mResumedActivity / topResumedActivity 行"""
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith(("mResumedActivity", "topResumedActivity", "ResumedActivity")):
+            component = _component(line)
+            if component:
+                return component
+    return None
+
+
+def parse_probe_output(text):
+    window_part, _, activity_part = text.partition("--activity--")
+    focus, focused_app, transition = parse_window_dump(window_part)
+    return UiState(focus, focused_app, parse_activity_dump(activity_part), transition)
+
+
+class TransitionResult:
+    def __init__(self, action_type, before, after, waited, changed, idle):
+        self.action_type = action_type
+        self.before = before
+        self.after = after
+        self.waited = waited
+        self.changed = changed
+        self.idle = idle
+
+    def __repr__(self):
+        state = "idle" if self.idle else "timeout"
+        change = f"{self.before.package} -> {self.after.package}" if self.changed else "no focus change"
+        return f"{self.action_type}: {state} after {self.waited * 1000:.0f} ms ({change})"
+
+
+class UiStateProbe:
+    """
+    通过常驻 shell 通道查询前台 Activity、窗口焦点和切换动画状态，
+    判断 open_app / press_home / press_back 引起的界面切换何时结束，无需截图比对。
+    """
+
+    def __init__(self, adb_path, interval=0.1, stable_polls=2, no_change_grace=0.4):
+        self.adb_path = adb_path
+        self.interval = interval
+        self.stable_polls = stable_polls
+        self.no_change_grace = no_change_grace
+        self.last_result = None
+
+    def snapshot(self):
+        return parse_probe_output(adb_client.shell(self.adb_path, PROBE_COMMAND))
+
+    def wait_for_transition(self, before, action_type, timeout=None):
+        """
+        轮询直到: 焦点已变化 (或超过 no_change_grace 仍未变化)、切换状态空闲，
+        且连续 stable_polls 次结果相同。
+        """
+        timeout = timeout or TRANSITION_ACTIONS.get(action_type, 3.0)
+        start = time.monotonic()
+        previous, stable, state = None, 0, before
+        while True:
+            elapsed = time.monotonic() - start
+            state = self.snapshot()
+            changed = state.key() != before.key()
+            stable = stable + 1 if state == previous else 0
+            previous = state
+            if state.idle and (changed or elapsed >= self.no_change_grace) and stable >= self.stable_polls - 1:
+                result = TransitionResult(action_type, before, state, time.monotonic() - start, changed, True)
+                break
+            if elapsed >= timeout:
+                result = TransitionResult(action_type, before, state, time.monotonic() - start, changed, False)
+                break
+            time.sleep(self.interval)
+        self.last_result = result
+        return result
@@ -0,0 +1,30 @@
+import os
+import shutil
+
+
+class Workspace:
+    """
+    一个 runner 独占的工作目录，显式给出截图和临时文件路径，
+    代替原来依赖进程全局 CWD 的 ./screenshot、./temp 相对路径，多个 runner 可以并行。
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.screenshot_dir = os.path.join(self.root, "screenshot")
+        self.temp_dir = os.path.join(self.root, "temp")
+        self.screenshot_file = os.path.join(self.screenshot_dir, "screenshot.png")
+
+    def prepare(self):
+        os.makedirs(self.screenshot_dir, exist_ok=True)
+        self.reset_temp()
+        return self
+
+    def reset_temp(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        os.makedirs(self.temp_dir, exist_ok=True)
+
+    def temp_path(self, name):
+        return os.path.join(self.temp_dir, name)
+
+    def __repr__(self):
+        return f"Workspace({self.root})"
@@ -3,7 +3,6 @@ import shutil
 import re
 import logging
 import sys
-import requests
 import json
 import base64
 
@@ -11,8 +10,14 @@ from logging.handlers import RotatingFileHandler
 from PIL import Image
 # 移除UITARS相关导入，保留MobileAgent核心功能
 from MobileAgent.controller import get_screenshot, type, execute_action
-from MobileAgent.chat import init_action_chat_uitars, add_response_uitars, add_box_token
+from MobileAgent.chat import ChatHistory, init_action_chat_uitars, add_response_uitars, add_box_token
 from codes.utils import parse_action_to_structure_output,parsing_response_to_pyautogui_code,convert_coordinates
+from MobileAgent.http_client import configure_backend, get_inference_client
+from MobileAgent.retry import post_with_retry
+from MobileAgent.streaming import stream_chat
+from MobileAgent.preprocess import ImagePreprocessor
+from MobileAgent.codec import CodecConfig
+from MobileAgent.prompt_layout import PrefixPromptLayout, legacy_messages, QWEN_SYSTEM_PROMPT
 
 ####################################### 修改后的配置 #########################################
 # Your ADB path（保留原有ADB配置）
@@ -34,15 +39,23 @@ VLLM_API_URL = "http://localhost:8000/v1/chat/completions"  # vllm服务地址+
 VLLM_MODEL_NAME = "Qwen/Qwen3-VL-8B-Instruct-LoRA/"  # 和启动vllm时的模型名一致
 VLLM_MAX_TOKENS = 2048  # 生成最大长度
 VLLM_TEMPERATURE = 0.7  # 采样温度
+VLLM_STREAM = os.getenv("VLLM_STREAM", "1") != "0"  # 流式输出，Action 行生成完即停止
+# vLLM 检测到客户端断开即停止生成: 拿到 Action 后断开连接取消剩余生成 (下一步重新建连)
+configure_backend(VLLM_API_URL, cancel_on_disconnect=True)
 
 #设置可以查看最近的多少步的信息（保留原有逻辑）
 history_n = 7
 
+# 提示词布局: "prefix" 为适配 vLLM 前缀缓存的只追加布局，"legacy" 为原布局
+PROMPT_LAYOUT = os.getenv("QWEN_PROMPT_LAYOUT", "prefix")
+
 ###################################################################################################
 
 # 【新增】替换原UITARS的encode_image函数，适配vLLM
 def encode_image(image_path):
-    """将图片转为Base64编码（vLLM兼容格式）"""
+    """将图片转为Base64编码（vLLM兼容格式），也接受内存中的 screen.Frame"""
+    if hasattr(image_path, "data"):
+        return base64.b64encode(image_path.data).decode("utf-8")
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode("utf-8")
 
@@ -55,31 +68,13 @@ def inference_chat_uitars(chat_action, model_name, api_url, token):
     - model_name/api_url/token: 兼容原有参数名，实际使用VLLM配置
     """
     # 构造vLLM的请求消息（多模态格式）
-    messages = []
-    # 第一步：添加系统指令（确保模型按指定格式输出Thought和Action）
-    system_prompt = """
-    你是一个移动端UI交互代理，需要根据截图和指令执行相应操作。
-    输出格式必须严格遵循：
-    Thought: 你的思考过程
-    Action: 具体操作（支持click/type/finished/wait/drag等，格式如click(start_box='(100,200))或drag(start_box='(100,200)', end_box='(300,400)')）。
-    注意：坐标必须是整数或浮点数，不能是自然语言描述。
-    """.strip()
-    messages.append({"role": "system", "content": system_prompt})
-    
-    # 第二步：解析原有chat_action，提取用户指令和图片信息
-    # 从chat_action中提取核心指令（原有逻辑）
-    user_content = []
-    # 1. 添加文本指令
-    user_content.append({"type": "text", "text": chat_action})
-    # 2. 添加历史截图（如果有）- 从全局history_images中获取最新的
-    if history_images:
-        latest_image_base64 = history_images[-1]
-        user_content.append({
-            "type": "image_url",
-            "image_url": {"url": f"data:image/png;base64,{latest_image_base64}"}
-        })
-    
-    messages.append({"role": "user", "content": user_content})
+    image_url = codecs.data_url(history_images[-1]) if history_images else None
+    if PROMPT_LAYOUT == "prefix":
+        # system 提示词 + 指令块 + 历史回复 作为只追加的稳定前缀，命中 vLLM 前缀缓存
+        messages = prompt_layout.messages(image_url)
+    else:
+        # 原布局: 指令和最新截图放在同一条 user 消息里
+        messages = legacy_messages(QWEN_SYSTEM_PROMPT, chat_action, image_url)
 
     # 构造vLLM请求体
     payload = {
@@ -87,21 +82,34 @@ def inference_chat_uitars(chat_action, model_name, api_url, token):
         "messages": messages,
         "max_tokens": VLLM_MAX_TOKENS,
         "temperature": VLLM_TEMPERATURE,
-        "stream": False  # 非流式输出，便于解析
+        "stream": False  # 流式由 stream_chat 设置
     }
 
     try:
-        # 调用vLLM API
-        response = requests.post(
+        if VLLM_STREAM:
+            # 边生成边解析，拿到完整 Action 后取消剩余生成
+            parser = stream_chat(
+                get_inference_client(VLLM_API_URL),
+                VLLM_API_URL,
+                payload,
+                headers={"Content-Type": "application/json"},
+                timeout=60
+            )
+            output = parser.output().strip()
+            logger.info(f"vLLM推理结果 (首token {parser.first_token_ms or 0:.0f} ms, "
+                        f"Action {parser.action_ms or 0:.0f} ms, 提前停止 {parser.stopped_early})：\n{output}")
+            return output
+
+        # 调用vLLM API，暂时性错误按指数退避重试
+        result = post_with_retry(
+            get_inference_client(VLLM_API_URL),
             VLLM_API_URL,
             headers={"Content-Type": "application/json"},
             data=json.dumps(payload),
             timeout=60  # 超时时间
         )
-        response.raise_for_status()  # 抛出HTTP错误
         
         # 解析响应
-        result = response.json()
         output = result["choices"][0]["message"]["content"].strip()
         logger.info(f"vLLM推理结果：\n{output}")
         return output
@@ -112,8 +120,10 @@ def inference_chat_uitars(chat_action, model_name, api_url, token):
 
 def get_perception_infos(adb_path, screenshot_file):
     """保留原有感知信息获取逻辑"""
-    get_screenshot(adb_path)
-    width, height = Image.open(screenshot_file).size
+    global latest_frame
+    frame = get_screenshot(adb_path, save_to=screenshot_file)
+    latest_frame = frame
+    width, height = frame.width, frame.height
     return width, height
 
 ##配置日志记录器（保留原有配置）
@@ -148,6 +158,14 @@ history_responses = []
 # max_pixels = 16384 * 28 * 28
 max_pixels = 1280 * 28 * 28
 min_pixels = 100 * 28 * 28
+# 上传前在本机缩放到 smart_resize 目标尺寸，解析坐标时使用同一组 max_pixels / min_pixels
+preprocessor = ImagePreprocessor(max_pixels=max_pixels, min_pixels=min_pixels)
+latest_frame = None
+# 截图编码格式，如 "png"、"jpeg:85"、"webp:80" (环境变量 IMAGE_CODEC)
+codecs = CodecConfig()
+# 前缀布局: 指令块取 init_action_chat_uitars 中的 MOBILE_USE 提示词
+prompt_layout = PrefixPromptLayout(QWEN_SYSTEM_PROMPT, init_action_chat_uitars(instruction)[1]["content"][0]["text"],
+                                   history_n=history_n)
 
 action = ""
 temp_file = "temp"
@@ -162,6 +180,10 @@ if not os.path.exists(screenshot):
 error_flag = False
 ######################
 
+# 指令对话在整个任务中不变，只建一次，各步共用同一个 ChatHistory
+# 保留原有消息构造逻辑，但实际推理时会重新构造vLLM格式
+chat_action = add_response_uitars(ChatHistory(init_action_chat_uitars(instruction)), [])
+
 ##程序开始运行（核心逻辑保留，仅适配模型版本）
 iter = 0
 while True:
@@ -173,20 +195,13 @@ while True:
         os.mkdir(temp_file)
 
     ##构建图片历史（保留原有逻辑）
-    base64_image = encode_image(screenshot_file)
-    history_images.append(base64_image)
+    history_images.append(preprocessor.process(latest_frame))
 
     if len(history_images) > history_n:
         history_images = history_images[-history_n:]
 
     #####################
 
-    ##构建模型输入（简化UITARS兼容逻辑）
-    chat_action_init = init_action_chat_uitars(instruction)
-    # 保留原有消息构造逻辑，但实际推理时会重新构造vLLM格式
-    chat_action = add_response_uitars(chat_action_init, [])
-    ##################
-
     ##【核心修改】调用vLLM推理（参数兼容原有格式，实际使用VLLM配置）
     output_action = inference_chat_uitars(
         chat_action, 
@@ -195,6 +210,7 @@ while True:
         ""  # vLLM无需token，传空值兼容原有参数
     )
     history_responses.append(output_action)
+    prompt_layout.add_turn(output_action)
 
     ##解析Thought和Action（保留原有正则逻辑）
     thought_match = re.search(r"Thought:\s*(.*?)(?=\nAction:)", output_action, re.DOTALL)
@@ -216,7 +232,8 @@ while True:
     action_pre = re.sub(r"<\|box_start\|>|<\|box_end\|>", "", action_pre)
 
     ##动作解析和执行（保留原有逻辑）
-    mock_response_dict = parse_action_to_structure_output(action_pre, 1000, height, width, model_type)
+    mock_response_dict = parse_action_to_structure_output(action_pre, 1000, height, width, model_type,
+                                                          max_pixels=max_pixels, min_pixels=min_pixels)
     parsed_pyautogui_code = parsing_response_to_pyautogui_code(mock_response_dict, height, width)
     action = convert_coordinates(mock_response_dict, height, width, model_type=model_type)
     actions.append(action)
@@ -5,11 +5,12 @@ import logging
 import sys
 
 from logging.handlers import RotatingFileHandler
-from PIL import Image
-from MobileAgent.api import encode_image,inference_chat_uitars
+from MobileAgent.api import inference_chat_uitars
+from MobileAgent.retry import InferenceError
 from MobileAgent.controller import get_screenshot, type, execute_action
-from MobileAgent.chat import init_action_chat_uitars, add_response_uitars, add_box_token
+from MobileAgent.chat import ChatHistory, init_action_chat_uitars, add_response_uitars, add_box_token
 from codes.utils import parse_action_to_structure_output,parsing_response_to_pyautogui_code,convert_coordinates
+from MobileAgent.codec import CodecConfig
 
 ####################################### Edit your Setting #########################################
 # Your ADB path
@@ -30,11 +31,16 @@ token_uitars = "ENTER-YOUR-API-HERE"
 #设置UITARS可以查看最近的多少步的信息
 history_n = 5
 
+# 截图编码: 当前截图和历史截图可分别设置，如 "png"、"jpeg:85"、"webp:80"
+codecs = CodecConfig()  # 默认取环境变量 IMAGE_CODEC / IMAGE_CODEC_HISTORY
+
 ###################################################################################################
 
 def get_perception_infos(adb_path, screenshot_file):
-    get_screenshot(adb_path)
-    width, height = Image.open(screenshot_file).size
+    global latest_frame
+    frame = get_screenshot(adb_path, save_to=screenshot_file)
+    latest_frame = frame
+    width, height = frame.width, frame.height
 
     return width, height
 
@@ -83,6 +89,9 @@ if not os.path.exists(screenshot):
 error_flag = False
 ######################
 
+# 系统提示词和指令在整个任务中不变，只建一次，每一步在它后面追加本步的消息 (共享前面的轮次)
+chat_action_init = ChatHistory(init_action_chat_uitars(instruction))
+
 ##程序开始运行
 iter = 0
 while True:
@@ -94,8 +103,7 @@ while True:
         os.mkdir(temp_file)
 
     ##uitars-messages 构建
-    base64_image = encode_image(screenshot_file)
-    history_images.append(base64_image)
+    history_images.append(latest_frame)
 
     messages, images = [], []
     if len(history_images) > history_n:
@@ -106,19 +114,20 @@ while True:
     else:
         raise TypeError(f"Unidentified images type: {type(history_images)}")
 
+    # 每帧按角色只编码一次，最后一张为当前截图
     for turn, image in enumerate(history_images):
-        images.append(image)
+        images.append(codecs.data_url(image, "current" if turn == len(history_images) - 1 else "history"))
 
     image_num = 0
     if len(history_responses) > 0:
         for history_idx, history_response in enumerate(history_responses):
             # send at most history_n images to the model
             if history_idx + history_n > len(history_responses):
-                encoded_string = images[image_num]
+                image_url = images[image_num]
                 messages.append({
                     "role": "user",
                     "content": [
-                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{encoded_string}"}}]
+                        {"type": "image_url", "image_url": {"url": image_url}}]
                 })
                 image_num += 1
 
@@ -129,29 +138,33 @@ while True:
                     ]
                 })
 
-        encoded_string = images[image_num]
+        image_url = images[image_num]
         messages.append({
             "role": "user",
-            "content": [{"type": "image_url", "image_url": {"url": f"data:image/png;base64,{encoded_string}"}}]
+            "content": [{"type": "image_url", "image_url": {"url": image_url}}]
         })
         image_num += 1
 
     else:
-        encoded_string = images[image_num]
+        image_url = images[image_num]
         messages.append({
             "role": "user",
-            "content": [{"type": "image_url", "image_url": {"url": f"data:image/png;base64,{encoded_string}"}}]
+            "content": [{"type": "image_url", "image_url": {"url": image_url}}]
         })
         image_num += 1
     #####################
 
     ##uitars最终输入构建
-    chat_action_init = init_action_chat_uitars(instruction)
     chat_action = add_response_uitars(chat_action_init, messages)
     ##################
 
     ##uitars推理
-    output_action = inference_chat_uitars(chat_action, model_name, API_url_uitars, token_uitars)
+    try:
+        output_action = inference_chat_uitars(chat_action, model_name, API_url_uitars, token_uitars)
+    except InferenceError as e:
+        # 重试用尽、熔断打开或不可重试的错误 (API Error / Network Error / Unexpected response): 记录后结束任务
+        logger.error(f"推理失败，停止运行: {e}")
+        break
     history_responses.append(output_action)
 
     thought_match = re.search(r"Thought:\s*(.*?)(?=\nAction:)", output_action, re.DOTALL)
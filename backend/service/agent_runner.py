@@ -1,34 +1,92 @@
 import os
-import shutil
 import re
 import logging
 import sys
+import collections
 import threading
 import time
-import requests
 from logging.handlers import RotatingFileHandler
-from PIL import Image
 
 # Add parent directory to sys.path to allow imports from MobileAgent and codes
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from MobileAgent.api import encode_image
-from MobileAgent.controller import get_screenshot, execute_action
-from MobileAgent.chat import init_action_chat_uitars, add_response_uitars, add_box_token
+from MobileAgent import adb_client, tracing
+from MobileAgent.http_client import get_inference_client, backend_key
+from MobileAgent.retry import RetryPolicy, InferenceError, CircuitOpenError, post_with_retry
+from MobileAgent.streaming import stream_chat
+from MobileAgent.controller import execute_action
+from MobileAgent.screen import capture_screenshot, capture_thumbnail
+from MobileAgent.frame_source import create_frame_source
+from MobileAgent.settle import Settler
+from MobileAgent.ui_state import UiStateProbe
+from MobileAgent.preprocess import ImagePreprocessor
+from MobileAgent.codec import CodecConfig
+from MobileAgent.request_builder import RequestBuilder
+from MobileAgent.screen_cache import get_screen_cache
+from MobileAgent.trajectory import get_trajectory_store, recording_enabled
+from MobileAgent.replay import ReplayEngine
+from MobileAgent.macro_cache import get_macro_library
+from MobileAgent.metrics import get_metrics
+from MobileAgent.workspace import Workspace
+from MobileAgent.chat import init_action_chat_uitars, add_box_token
 from codes.utils import parse_action_to_structure_output, parsing_response_to_pyautogui_code, convert_coordinates
 
 class UITARSRunner:
-    def __init__(self):
+    def __init__(self, adb_path=None, serial=None):
         self.running = False
         self.instruction = ""
-        self.adb_path = os.getenv("ADB_PATH", "C:\\adb\\platform-tools\\adb")
-        self.adb_path = f'"{self.adb_path}"' if " " in self.adb_path and not self.adb_path.startswith('"') else self.adb_path
+        self.adb_path = adb_path or os.getenv("ADB_PATH", "C:\\adb\\platform-tools\\adb")
+        # Quote executable paths containing spaces; leave "adb -P <port>" style commands alone
+        self.adb_path = adb_client.quote_adb_path(self.adb_path)
+        # With a serial, every adb command of this runner targets that device
+        self.serial = serial
+        if serial:
+            self.adb_path = f"{self.adb_path} -s {serial}"
         
         self.uitars_version = "1.5"
-        self.model_name = 'doubao-1-5-ui-tars-250428'
-        self.API_url_uitars = "https://ark.cn-beijing.volces.com/api/v3/chat/completions"
-        self.token_uitars = "ENTER-YOUR-API-HERE"
+        # Model endpoint; override with env to point at a self-hosted or mock OpenAI-compatible server
+        self.model_name = os.getenv("UITARS_MODEL", 'doubao-1-5-ui-tars-250428')
+        self.API_url_uitars = os.getenv("UITARS_API_URL", "https://ark.cn-beijing.volces.com/api/v3/chat/completions")
+        self.token_uitars = os.getenv("UITARS_API_TOKEN", "ENTER-YOUR-API-HERE")
         self.history_n = 5
+        # "png": screencap -p on the device; "raw": raw framebuffer, encoded on the host only when needed
+        self.capture_mode = os.getenv("SCREENCAP_MODE", "png")
+        # Optional background frame source: "stream", "poll" or a recorded stream path; empty = capture per step
+        self.frame_source_kind = os.getenv("FRAME_SOURCE", "")
+        self.frame_source = None
+        # Adaptive wait after each action instead of a fixed sleep
+        self.settler = Settler(capture=self._settle_capture)
+        # dumpsys-based probe for app/window transitions (open_app, press_home, press_back)
+        self.ui_probe = UiStateProbe(self.adb_path)
+        # Bounded retry with backoff for model calls; the circuit breaker is shared per backend
+        self.retry_policy = RetryPolicy()
+        # Stream the completion (SSE), stop as soon as the Action line is complete
+        self.stream_inference = os.getenv("INFERENCE_STREAM", "1") != "0"
+        # Resize screenshots to the model's smart_resize target before upload (MODEL_MAX_PIXELS budget,
+        # default 1280*28*28 ~ 1 MP, so a 1080x2340 screenshot is sent at 672x1456).
+        # UI-TARS answers in 0-1000 relative coordinates, so the action mapping below is unaffected.
+        self.preprocessor = ImagePreprocessor()
+        # Screenshot encoding per image role (IMAGE_CODEC / IMAGE_CODEC_HISTORY, e.g. png, jpeg:85, webp:80)
+        self.codecs = CodecConfig()
+        # Incremental request body; rebuilt for every run in run_loop
+        self.request_builder = RequestBuilder(self.model_name, self.codecs, history_n=self.history_n)
+        # Screen -> model output cache (SCREEN_CACHE=1); shared by all runners, backed by sqlite
+        self.screen_cache = get_screen_cache()
+        # Every step (screenshot, model output, action, adb commands, timings) goes to the trajectory store
+        self.trajectory = get_trajectory_store() if recording_enabled() else None
+        self.session_id = None
+        # Set by start(replay_session=...): recorded outputs are replayed while the screen matches the recording
+        self.replay = None
+        # Library of successful trajectories (MACRO_CACHE=1): a known instruction + start screen runs as a macro
+        self.macros = get_macro_library()
+        self.macro_key = None
+        self.task_stats = {}
+        # Per-stage timing histograms per device and model backend, served by /api/metrics (METRICS=0 disables)
+        self.metrics = get_metrics()
+        self.last_timings = {}
+        self.last_inference = {}
+        # Chrome trace (span timeline) of the current or last run, served by /api/trace (TRACE=0 disables)
+        self.trace = None
         
         # State
         self.latest_log = ""
@@ -39,77 +97,125 @@ class UITARSRunner:
         self.thoughts = []
         self.actions = []
         self.iter = 0
+        self.latest_frame = None
+        self.capture_ms = 0.0
+        self.capture_start = None
+        self.step_start = None
+
+        # Throughput bookkeeping (monotonic timestamps of finished steps / tasks)
+        self.step_times = collections.deque(maxlen=1000)
+        self.task_times = collections.deque(maxlen=1000)
+        self.total_steps = 0
+        self.tasks_completed = 0
         
         # Paths
         self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.screenshot_dir = os.path.join(self.base_dir, "screenshot")
-        self.temp_dir = os.path.join(self.base_dir, "temp")
-        self.screenshot_file = os.path.join(self.screenshot_dir, "screenshot.png")
+        # Each runner owns its workspace so concurrent runners never share files or depend on the CWD
+        if serial:
+            workspace_root = os.path.join(self.base_dir, "workspaces", re.sub(r"[^\w.-]", "_", serial))
+        else:
+            workspace_root = self.base_dir
+        self.workspace = Workspace(workspace_root)
+        self.screenshot_dir = self.workspace.screenshot_dir
+        self.temp_dir = self.workspace.temp_dir
+        self.screenshot_file = self.workspace.screenshot_file
         
         # Logger setup
-        self.logger = logging.getLogger('UITARS_Backend')
-        self.logger.setLevel(logging.INFO)
+        base_logger = logging.getLogger('UITARS_Backend')
+        base_logger.setLevel(logging.INFO)
         # Avoid adding handlers multiple times if re-instantiated
-        if not self.logger.handlers:
+        if not base_logger.handlers:
             handler = logging.StreamHandler(sys.stdout)
-            formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
             handler.setFormatter(formatter)
-            self.logger.addHandler(handler)
+            base_logger.addHandler(handler)
+        # Per-device child logger so fleet logs can be told apart
+        self.logger = base_logger.getChild(serial) if serial else base_logger
 
     def update_instruction(self, new_instruction):
         self.instruction = new_instruction
         self.logger.info(f"Instruction updated to: {self.instruction}")
 
-    def get_perception_infos(self):
-        get_screenshot(self.adb_path)
-        # Move screenshot to expected location if get_screenshot doesn't put it there directly
-        # get_screenshot implementation in controller.py usually saves to ./screenshot/screenshot.png relative to cwd
-        # We need to ensure it's in self.screenshot_file
-        
-        # Since get_screenshot might rely on CWD, let's check where it saves. 
-        # Assuming it saves to ./screenshot/screenshot.png relative to current working directory.
-        # We will handle CWD in the run loop.
-        
-        if os.path.exists(self.screenshot_file):
-            width, height = Image.open(self.screenshot_file).size
-            return width, height
-        return 0, 0
+    def get_perception_infos(self, frame=None):
+        start = time.perf_counter()
+        if frame is None and self.frame_source is not None:
+            # The newest streamed frame is already decoded; no capture round trip needed
+            frame = self.frame_source.latest() or self.frame_source.wait_for_frame(timeout=5)
+        if frame is None:
+            # Screenshot stays in memory; size comes from the PNG or raw framebuffer header, no file round trip
+            frame = capture_screenshot(self.adb_path, mode=self.capture_mode)
+            timings = ", ".join(f"{k}={v:.1f}" for k, v in frame.timings.items())
+            self.logger.info(f"Captured frame {frame.frame_id} ({self.capture_mode}): {timings}")
+        self.latest_frame = frame
+        self.capture_start = start
+        self.capture_ms = (time.perf_counter() - start) * 1000
+        tracing.add("capture", start, cat="device", frame_id=frame.frame_id, mode=self.capture_mode)
+        return frame.width, frame.height
+
+    def _settle_capture(self):
+        # Streamed frames may repeat between polls; the settler only compares frames with a newer frame_id
+        if self.frame_source is not None and self.frame_source.running:
+            frame = self.frame_source.latest()
+            if frame is not None:
+                return frame
+        # Low-resolution rows sampled on the device; the next step takes a full capture
+        return capture_thumbnail(self.adb_path)
 
-    def _inference_chat_uitars_safe(self, chat, model, api_url, token):
+    def current_frame(self):
+        if self.frame_source is not None and self.frame_source.running:
+            frame = self.frame_source.latest()
+            if frame is not None:
+                return frame
+        return self.latest_frame
+
+    def _on_stream_update(self, parser):
+        # latest_thought in /api/status follows the generation token by token
+        self.latest_thought = parser.thought
+
+    def _inference_chat_uitars_safe(self, body, api_url, token):
+        # body is the serialized request from RequestBuilder.build()
         headers = {
             "Content-Type": "application/json",
             'Accept': 'application/json',
             "Authorization": f"Bearer {token}"
         }
+        headers.update(self.request_builder.headers())
 
-        data = {
-            "model": model,
-            "messages": [],
-            "max_tokens": 2048,
-            'temperature': 0.0,
-            "seed": 1234
-        }
-
-        for message in chat:
-            data["messages"].append({
-                "role": message["role"],
-                "content": message["content"]
-            })
-
-        try:
-            res = requests.post(api_url, headers=headers, json=data, timeout=60)
-            if res.status_code != 200:
-                return f"API Error {res.status_code}: {res.text}"
-            
-            res_json = res.json()
-            if 'choices' in res_json and len(res_json['choices']) > 0:
+        client = get_inference_client(api_url)
+        # Total time this call may spend waiting on an open breaker before the task fails
+        breaker_deadline = time.monotonic() + self.retry_policy.max_breaker_wait
+        while True:
+            try:
+                if self.stream_inference:
+                    parser = stream_chat(client, api_url, body, policy=self.retry_policy, headers=headers,
+                                         on_update=self._on_stream_update)
+                    self.logger.info(f"Streamed: first token {parser.first_token_ms or 0:.0f} ms, "
+                                     f"action {parser.action_ms or 0:.0f} ms, early stop {parser.stopped_early}")
+                    self.last_inference = {"first_token_ms": parser.first_token_ms, "action_ms": parser.action_ms}
+                    return parser.output()
+                res_json = post_with_retry(client, api_url, policy=self.retry_policy, headers=headers, data=body)
                 return res_json['choices'][0]['message']['content']
-            else:
-                return f"Unexpected response format: {res_json}"
-        except Exception as e:
-            return f"Network Error: {str(e)}"
+            except CircuitOpenError as e:
+                # Backend is known to be down: wait for the shared breaker, but not longer than max_breaker_wait
+                remaining = breaker_deadline - time.monotonic()
+                if not self.running or remaining <= 0:
+                    return f"Network Error: {e} (gave up after waiting {self.retry_policy.max_breaker_wait:.0f} s)"
+                self.logger.warning(f"{e}, waiting {e.retry_in:.1f} s")
+                deadline = time.monotonic() + min(max(e.retry_in, 0.5), remaining)
+                while self.running and time.monotonic() < deadline:
+                    time.sleep(0.5)
+            except InferenceError as e:
+                # Retries exhausted or a non-retryable error; message starts with API Error / Network Error / Unexpected response
+                return str(e)
 
     def run_loop(self):
+        # Spans of this run (including adb commands, streaming and settle waits below) go to self.trace
+        self.trace = tracing.TraceRecorder(f"UITARS {self.serial or 'default'}", instruction=self.instruction,
+                                           model=self.model_name) if tracing.tracing_enabled() else None
+        with tracing.activate(self.trace):
+            self._run_loop()
+
+    def _run_loop(self):
         self.running = True
         self.logger.info("Agent loop started")
         
@@ -121,14 +227,13 @@ class UITARSRunner:
         self.actions = []
         
         # Ensure directories exist
-        if not os.path.exists(self.temp_dir):
-            os.mkdir(self.temp_dir)
-        else:
-            shutil.rmtree(self.temp_dir)
-            os.mkdir(self.temp_dir)
-            
-        if not os.path.exists(self.screenshot_dir):
-            os.mkdir(self.screenshot_dir)
+        self.workspace.prepare()
+        self.request_builder = RequestBuilder(self.model_name, self.codecs, history_n=self.history_n)
+        prompt_instruction = None
+        self.macro_key = None
+        self.task_stats = {"macro": None, "model_calls": 0, "cache_hits": 0, "replayed": 0}
+        self.session_id = None
+        finished = False
 
         # Check instruction
         if not self.instruction:
@@ -136,79 +241,119 @@ class UITARSRunner:
             self.running = False
             return
 
-        # Set CWD to base_dir so that relative paths in MobileAgent work as expected
-        original_cwd = os.getcwd()
-        os.chdir(self.base_dir)
+        # Sessions are only created for runs that actually start
+        if self.trajectory is not None:
+            self.session_id = self.trajectory.new_session(instruction=self.instruction, serial=self.serial,
+                                                          model=self.model_name)
+            if self.trace is not None:
+                self.trace.metadata["session"] = self.session_id
 
         try:
             while self.running:
                 self.iter += 1
                 if self.iter == 1:
                     width, height = self.get_perception_infos()
-                    shutil.rmtree(self.temp_dir, ignore_errors=True)
-                    os.mkdir(self.temp_dir)
+                    self.workspace.reset_temp()
+                    if self.replay is None and self.trajectory is not None:
+                        self._start_macro()
                 # else:
                 #    # Refresh screenshot info
                 #     width, height = self.get_perception_infos()
 
+                # Stage timings of this step (ms), recorded with the trajectory
+                timings = {"capture_ms": self.capture_ms}
+                step_frame = self.latest_frame
+                stage = time.perf_counter()
+                # A step runs from the capture of its screen to the end of its action
+                step_start = self.step_start = self.capture_start or stage
+
                 # Build messages
-                base64_image = encode_image(self.screenshot_file)
-                self.history_images.append(base64_image)
+                model_frame = self.preprocessor.process(self.latest_frame)
+                if model_frame is not self.latest_frame:
+                    self.logger.info(f"Resized {self.latest_frame.width}x{self.latest_frame.height} -> "
+                                     f"{model_frame.width}x{model_frame.height} in {model_frame.timings['resize_ms']:.1f} ms")
+                tracing.add("preprocess", stage, cat="host", resized=model_frame is not self.latest_frame)
+                self.history_images.append(model_frame)
                 
                 if len(self.history_images) > self.history_n:
                     self.history_images = self.history_images[-self.history_n:]
 
-                messages, images = [], []
-                for image in self.history_images:
-                    images.append(image)
-
-                image_num = 0
-                if len(self.history_responses) > 0:
-                    for history_idx, history_response in enumerate(self.history_responses):
-                        if history_idx + self.history_n > len(self.history_responses):
-                            encoded_string = images[image_num]
-                            messages.append({
-                                "role": "user",
-                                "content": [{"type": "image_url", "image_url": {"url": f"data:image/png;base64,{encoded_string}"}}]
-                            })
-                            image_num += 1
-                            messages.append({
-                                "role": "assistant",
-                                "content": [{"type": "text", "text": add_box_token(history_response)}]
-                            })
-
-                    encoded_string = images[image_num]
-                    messages.append({
-                        "role": "user",
-                        "content": [{"type": "image_url", "image_url": {"url": f"data:image/png;base64,{encoded_string}"}}]
-                    })
-                    image_num += 1
-                else:
-                    encoded_string = images[image_num]
-                    messages.append({
-                        "role": "user",
-                        "content": [{"type": "image_url", "image_url": {"url": f"data:image/png;base64,{encoded_string}"}}]
-                    })
-                    image_num += 1
-
-                # Inference
-                chat_action_init = init_action_chat_uitars(self.instruction)
-                chat_action = add_response_uitars(chat_action_init, messages)
-                
-                self.logger.info("Sending request to model...")
-                output_action = self._inference_chat_uitars_safe(chat_action, self.model_name, self.API_url_uitars, self.token_uitars)
+                # Only the new screenshot is serialized; the prompt and earlier turns are reused as JSON fragments
+                if self.instruction != prompt_instruction:
+                    prompt_instruction = self.instruction
+                    self.request_builder.set_prompt(init_action_chat_uitars(prompt_instruction))
+                with tracing.span("encode", cat="host", codec=str(self.codecs)):
+                    self.request_builder.set_screen(model_frame)
+                timings["preprocess_ms"] = (time.perf_counter() - stage) * 1000
+
+                # Replay mode: reuse the recorded output while the screen matches the recorded frame
+                output_action = None
+                if self.replay is not None and not self.replay.finished:
+                    stage = time.perf_counter()
+                    output_action = self.replay.next_output(self.latest_frame)
+                    timings["replay_ms"] = (time.perf_counter() - stage) * 1000
+                    tracing.add("replay", stage, cat="host", hit=output_action is not None)
+                    if output_action is not None:
+                        self.task_stats["replayed"] += 1
+                        self.logger.info(f"Replayed step {self.replay.position}/{len(self.replay.steps)} "
+                                         f"(similarity {self.replay.last_similarity:.3f})")
+                    else:
+                        self.logger.warning(f"Screen diverged from the recording (similarity "
+                                            f"{self.replay.last_similarity:.3f}), falling back to the model")
+                replayed = output_action is not None
+
+                # A screen already seen at this point of the same task replays the recorded output
+                cache_key = None
+                if not replayed:
+                    cache_key = self.screen_cache.key(self.model_name, self.instruction, self.history_responses,
+                                                      self.latest_frame)
+                    output_action = self.screen_cache.lookup(cache_key)
+                cache_hit = not replayed and output_action is not None
+                if cache_hit:
+                    self.task_stats["cache_hits"] += 1
+                    self.logger.info(f"Screen cache hit, model call skipped ({self.screen_cache.stats()['hit_rate']:.0%} hit rate)")
+                elif not replayed:
+                    stage = time.perf_counter()
+                    body = self.request_builder.build(stream=self.stream_inference)
+                    timings["build_ms"] = (time.perf_counter() - stage) * 1000
+                    tracing.add("build", stage, cat="host")
+                    stats = self.request_builder.last_stats
+                    # Screenshot encoding + base64 serialization (part of preprocess/build)
+                    timings["encode_ms"] = stats.get("serialize_ms", 0.0)
+                    self.logger.info(f"Request ({self.codecs}): {stats['body_bytes'] / 1024:.0f} KB, "
+                                     f"{stats['serialized_bytes'] / 1024:.0f} KB serialized in {stats['serialize_ms']:.1f} ms, "
+                                     f"assembled in {stats['assemble_ms']:.1f} ms")
+
+                    # Inference
+                    self.logger.info("Sending request to model...")
+                    stage = time.perf_counter()
+                    self.last_inference = {}
+                    output_action = self._inference_chat_uitars_safe(body, self.API_url_uitars, self.token_uitars)
+                    self.task_stats["model_calls"] += 1
+                    timings["inference_ms"] = (time.perf_counter() - stage) * 1000
+                    tracing.add("inference", stage, cat="inference", stream=self.stream_inference,
+                                **{k: v for k, v in self.last_inference.items() if v is not None})
+                    if self.last_inference.get("first_token_ms") is not None:
+                        timings["first_token_ms"] = self.last_inference["first_token_ms"]
+                    if not output_action.startswith(("API Error", "Network Error", "Unexpected response")) \
+                            and "finished(" not in output_action:
+                        self.screen_cache.store(cache_key, output_action)
+                self.request_builder.add_response(add_box_token(output_action))
                 self.history_responses.append(output_action)
                 self.latest_log = output_action
 
                 # Check for error
                 if output_action.startswith("API Error") or output_action.startswith("Network Error") or output_action.startswith("Unexpected response"):
                     self.logger.error(f"Inference failed: {output_action}")
+                    timings["step_ms"] = (time.perf_counter() - step_start) * 1000
+                    self._record_step(step_frame, output_action, None, [], timings)
                     # time.sleep(5)
                     # continue
                     self.running = False
                     break
 
                 # Parse output
+                stage = time.perf_counter()
                 thought_match = re.search(r"Thought:\s*(.*?)(?=\nAction:)", output_action, re.DOTALL)
                 action_match = re.search(r"Action:\s*(.*?)(?=\n|$)", output_action, re.DOTALL)
 
@@ -245,58 +390,152 @@ class UITARSRunner:
                 mock_response_dict = parse_action_to_structure_output(action_pre, 1000, height, width, model_type)
                 action = convert_coordinates(mock_response_dict, height, width, model_type=model_type)
                 self.actions.append(action)
+                timings["parse_ms"] = (time.perf_counter() - stage) * 1000
+                tracing.add("parse", stage, cat="host", action=action_pre)
 
                 self.logger.info(f"Thought: {thought}")
                 self.logger.info(f"Action: {action}")
 
                 # Execute Action
-                stop_flag = execute_action(action, self.adb_path)
+                self.settler.last_result = None
+                self.ui_probe.last_result = None
+                stage = time.perf_counter()
+                with adb_client.record_commands() as commands:
+                    stop_flag = execute_action(action, self.adb_path, settler=self.settler, probe=self.ui_probe)
+                timings["execute_ms"] = (time.perf_counter() - stage) * 1000
+                tracing.add("execute", stage, cat="device", action=action_pre)
+                if self.settler.last_result is not None:
+                    timings["settle_ms"] = self.settler.last_result.waited * 1000
+                timings["step_ms"] = (time.perf_counter() - step_start) * 1000
+                self._record_step(step_frame, output_action, action, commands, timings, cached=cache_hit,
+                                  replayed=replayed)
+                self.step_times.append(time.monotonic())
+                self.total_steps += 1
                 if stop_flag == "STOP":
+                    # The finished trajectory (macro steps included) becomes the macro for this instruction
+                    self.macros.record_success(self.macro_key, self.session_id, self.iter,
+                                               model_calls_saved=self.task_stats["replayed"] if self.task_stats["macro"] else 0)
+                    self.task_times.append(time.monotonic())
+                    self.tasks_completed += 1
+                    self.metrics.task_finished(self.serial or "default", backend_key(self.API_url_uitars))
+                    finished = True
                     self.running = False
                     break
 
-                # Prepare for next iteration
-                last_screenshot_file = os.path.join(self.screenshot_dir, "last_screenshot.png")
-                if os.path.exists(last_screenshot_file):
-                    os.remove(last_screenshot_file)
-                
-                # We rename the current screenshot to last_screenshot, but wait...
-                # The original code renames it, then calls get_perception_infos again which calls get_screenshot
-                # So we lose the 'current' screenshot for a moment.
-                # To keep the frontend happy, maybe we should copy it instead?
-                # But get_screenshot overwrites 'screenshot.png'.
-                # Let's follow original logic for now.
-                if os.path.exists(self.screenshot_file):
-                     os.rename(self.screenshot_file, last_screenshot_file)
-
-                # Re-acquire screenshot happens at start of loop or here?
-                # Original code:
-                # rename to last
-                # get_perception_infos (takes new screenshot)
-                # remove temp
-                # mkdir temp
-                # remove last
-                
-                width, height = self.get_perception_infos()
-                shutil.rmtree(self.temp_dir, ignore_errors=True)
-                os.mkdir(self.temp_dir)
-                
-                if os.path.exists(last_screenshot_file):
-                    os.remove(last_screenshot_file)
-                
-                # Small sleep to prevent tight loop if errors occur
-                time.sleep(0.1)
+                # Prepare for next iteration; a full-resolution settle frame (frame source) is already the current
+                # screen, after low-resolution settle polls the next step takes a fresh capture
+                settle = self.settler.last_result
+                settled_frame = None
+                if self.ui_probe.last_result is not None:
+                    self.logger.info(f"Transition {self.ui_probe.last_result}")
+                if settle is not None:
+                    self.logger.info(f"Settle {settle} (total saved {self.settler.total_saved_ms:.0f} ms "
+                                     f"over {self.settler.count} steps)")
+                    settled_frame = settle.frame
+                width, height = self.get_perception_infos(settled_frame)
+                self.workspace.reset_temp()
+                # Post-action check: the screen after a cached action must match the recorded one
+                if not self.screen_cache.confirm(cache_key, self.latest_frame):
+                    self.logger.warning("Screen after cached action differs from the recording; cache entry dropped")
 
         except Exception as e:
             self.logger.error(f"Error in agent loop: {e}", exc_info=True)
             self.running = False
         finally:
-            os.chdir(original_cwd)
+            # A macro run that ends any other way than finished(...) (inference error, stop, exception) counts against it
+            if self.task_stats["macro"] and not finished:
+                self.macros.record_failure(self.macro_key)
             self.logger.info("Agent loop stopped")
 
-    def start(self):
+    def _start_macro(self):
+        self.macro_key = self.macros.key(self.instruction, self.latest_frame)
+        session = self.macros.lookup(self.macro_key)
+        if session is None:
+            return
+        # Steps of the previous task may still be in the writer queue
+        self.trajectory.flush()
+        self.replay = ReplayEngine(self.trajectory, session)
+        self.task_stats["macro"] = session
+        self.logger.info(f"Running macro {session} ({len(self.replay.steps)} steps) for: {self.instruction}")
+
+    def _record_step(self, frame, output, action, commands, timings, **fields):
+        timings = {k: round(v, 2) for k, v in timings.items()}
+        self.last_timings = timings
+        if action is None:
+            source = "error"
+        elif fields.get("replayed"):
+            source = "replay"
+        elif fields.get("cached"):
+            source = "cache"
+        else:
+            source = "model"
+        self.metrics.observe_step(timings, self.serial or "default", backend_key(self.API_url_uitars), source)
+        if self.step_start is not None:
+            # The step starts with the capture of its screen (end of the previous iteration)
+            tracing.add(f"step {self.iter}", self.step_start, cat="step", source=source)
+        if self.trajectory is None or self.session_id is None:
+            return
+        self.trajectory.record_step(self.session_id, self.iter, frame, output=output, action=action,
+                                    commands=commands, timings=timings, **fields)
+
+    def throughput(self, now=None):
+        """Steps in the last minute and tasks finished in the last hour."""
+        now = now or time.monotonic()
+        return {
+            "steps_per_min": sum(1 for t in self.step_times if now - t <= 60),
+            "tasks_per_hour": sum(1 for t in self.task_times if now - t <= 3600),
+            "total_steps": self.total_steps,
+            "tasks_completed": self.tasks_completed,
+        }
+
+    def get_status(self):
+        return {
+            "serial": self.serial,
+            "running": self.running,
+            "instruction": self.instruction,
+            "latest_thought": self.latest_thought,
+            "latest_action": self.latest_action,
+            "latest_log": self.latest_log,
+            "iter": self.iter,
+            "throughput": self.throughput(),
+            "inference": get_inference_client(self.API_url_uitars).stats(),
+            "request": self.request_builder.last_stats,
+            "timings": self.last_timings,
+            "trace": {"events": len(self.trace.events), "dropped": self.trace.dropped} if self.trace else None,
+            "screen_cache": self.screen_cache.stats(),
+            "replay": self.replay.stats() if self.replay else None,
+            "macro": dict(self.macros.stats(), task=self.task_stats),
+            "trajectory": dict(self.trajectory.stats(), session=self.session_id) if self.trajectory else None,
+        }
+
+    def start_frame_source(self):
+        if self.frame_source_kind and self.frame_source is None:
+            self.frame_source = create_frame_source(self.frame_source_kind, self.adb_path).start()
+            self.settler.unchanged_when_stale = self.frame_source.changes_only
+            self.logger.info(f"Frame source started: {type(self.frame_source).__name__}")
+
+    def stop_frame_source(self):
+        if self.frame_source is not None:
+            self.frame_source.stop()
+            self.frame_source = None
+            self.settler.unchanged_when_stale = False
+
+    def load_replay(self, session):
+        """Replay engine for a recorded session; the recorded instruction is used when none is set"""
+        store = self.trajectory or get_trajectory_store()
+        info = dict(store.sessions()).get(session)
+        if info is None:
+            raise KeyError(session)
+        if not self.instruction:
+            self.instruction = info.get("instruction", "")
+        return ReplayEngine(store, session)
+
+    def start(self, replay_session=None):
         if not self.running:
+            # A normal start clears any previous replay
+            self.replay = self.load_replay(replay_session) if replay_session else None
             self.running = True # Set running flag immediately
+            self.start_frame_source()
             self.thread = threading.Thread(target=self.run_loop)
             self.thread.daemon = True
             self.thread.start()
@@ -305,3 +544,4 @@ class UITARSRunner:
         self.running = False
         if hasattr(self, 'thread'):
             self.thread.join(timeout=2)
+        self.stop_frame_source()
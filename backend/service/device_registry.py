@@ -0,0 +1,76 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MobileAgent import adb_client
+from agent_runner import UITARSRunner
+
+
+class DeviceRegistry:
+    """
+    Discovers connected devices through `adb devices` and keeps one UITARSRunner per serial.
+    Runners are kept when a device disappears so their status stays readable.
+    """
+
+    def __init__(self, adb_path=None):
+        self.adb_path = adb_path or os.getenv("ADB_PATH", "C:\\adb\\platform-tools\\adb")
+        # Quote executable paths containing spaces; leave "adb -P <port>" style commands alone
+        self.adb_path = adb_client.quote_adb_path(self.adb_path)
+        self.runners = {}
+        self.online = set()
+        self._lock = threading.Lock()
+
+    def discover(self):
+        found = adb_client.devices(self.adb_path)
+        with self._lock:
+            self.online = {serial for serial, state in found if state == "device"}
+            for serial in self.online:
+                if serial not in self.runners:
+                    self.runners[serial] = UITARSRunner(adb_path=self.adb_path, serial=serial)
+        return sorted(self.online)
+
+    def get(self, serial):
+        with self._lock:
+            runner = self.runners.get(serial)
+        if runner is None:
+            # Device may have been plugged in after the last discovery
+            self.discover()
+            with self._lock:
+                runner = self.runners.get(serial)
+        if runner is None:
+            raise KeyError(serial)
+        return runner
+
+    def list(self):
+        with self._lock:
+            runners = dict(self.runners)
+            online = set(self.online)
+        return [
+            {"serial": serial, "online": serial in online, "running": r.running,
+             "instruction": r.instruction, "iter": r.iter}
+            for serial, r in sorted(runners.items())
+        ]
+
+    def stop_all(self):
+        with self._lock:
+            runners = list(self.runners.values())
+        for runner in runners:
+            runner.stop()
+
+    def fleet_stats(self):
+        now = time.monotonic()
+        with self._lock:
+            runners = dict(self.runners)
+        per_device = {serial: r.throughput(now) for serial, r in runners.items()}
+        return {
+            "devices": len(runners),
+            "running": sum(1 for r in runners.values() if r.running),
+            "steps_per_min": sum(s["steps_per_min"] for s in per_device.values()),
+            "tasks_per_hour": sum(s["tasks_per_hour"] for s in per_device.values()),
+            "total_steps": sum(s["total_steps"] for s in per_device.values()),
+            "tasks_completed": sum(s["tasks_completed"] for s in per_device.values()),
+            "per_device": per_device,
+        }
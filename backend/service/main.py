@@ -1,16 +1,25 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import Response
 from pydantic import BaseModel
+import json
 import os
 import sys
 
 # Ensure we can import agent_runner
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from agent_runner import UITARSRunner
+from device_registry import DeviceRegistry
+from MobileAgent.http_client import all_stats as inference_stats
+from MobileAgent.trajectory import get_trajectory_store
+from MobileAgent.metrics import get_metrics
+from MobileAgent.tracing import chrome_trace
 
+# Default runner behind the original single-device endpoints (ADB_PATH device)
 runner = UITARSRunner()
+# One runner per discovered device for the /api/devices/{serial}/... endpoints
+registry = DeviceRegistry()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -19,7 +28,11 @@ async def lifespan(app: FastAPI):
     yield
     # Shutdown logic
     runner.stop()
+    registry.stop_all()
 
+# Endpoints that touch a device, the disk or a runner thread (adb devices, PNG encoding of raw frames,
+# sqlite stats, thread joins) are plain `def`: FastAPI runs them in its threadpool instead of the event loop.
+# Only the pure in-memory ones stay `async def`.
 app = FastAPI(lifespan=lifespan)
 
 # CORS
@@ -31,44 +44,130 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def screenshot_response(r):
+    # Serve the newest in-memory frame (streamed if a frame source is running); no file on disk is involved
+    frame = r.current_frame()
+    if frame is not None:
+        # We might want to disable caching so the frontend always gets the new one
+        return Response(frame.data, media_type="image/png",
+                        headers={"Cache-Control": "no-cache", "X-Frame-Id": str(frame.frame_id)})
+    return {"error": "Screenshot not available yet"}
+
+def trace_response(r):
+    # Chrome Trace Event JSON of the current (still growing) or last run; open in ui.perfetto.dev
+    if r.trace is None:
+        raise HTTPException(status_code=404, detail="No trace recorded yet")
+    name = r.trace.metadata.get("session") or "run"
+    return Response(json.dumps(chrome_trace([r.trace]), ensure_ascii=False, default=str),
+                    media_type="application/json",
+                    headers={"Content-Disposition": f'attachment; filename="trace_{r.serial or "default"}_{name}.json"'})
+
+def get_device_runner(serial):
+    try:
+        return registry.get(serial)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Device {serial} not found")
+
 @app.get("/api/status")
-async def get_status():
-    return {
-        "running": runner.running,
-        "instruction": runner.instruction,
-        "latest_thought": runner.latest_thought,
-        "latest_action": runner.latest_action,
-        "latest_log": runner.latest_log,
-        "iter": runner.iter
-    }
+def get_status():
+    return runner.get_status()
 
 @app.get("/api/screenshot")
-async def get_screenshot():
-    # Return the current screenshot
-    # If using runner.screenshot_file directly, make sure it exists
-    if os.path.exists(runner.screenshot_file):
-        # We might want to disable caching so the frontend always gets the new one
-        return FileResponse(runner.screenshot_file, headers={"Cache-Control": "no-cache"})
-    return {"error": "Screenshot not available yet"}
+def get_screenshot():
+    return screenshot_response(runner)
 
 class InstructionRequest(BaseModel):
     instruction: str
 
 @app.post("/api/instruction")
-async def update_instruction(req: InstructionRequest):
+def update_instruction(req: InstructionRequest):
     runner.update_instruction(req.instruction)
     return {"status": "updated", "instruction": runner.instruction}
 
 @app.post("/api/stop")
-async def stop_agent():
+def stop_agent():
     runner.stop()
     return {"status": "stopped"}
 
 @app.post("/api/start")
-async def start_agent():
+def start_agent():
     runner.start()
     return {"status": "started"}
 
+class ReplayRequest(BaseModel):
+    session: str
+
+def start_replay(r, session):
+    try:
+        r.start(replay_session=session)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Trajectory {session} not found")
+    return {"status": "replaying", "session": session, "instruction": r.instruction}
+
+@app.get("/api/trace")
+def get_trace():
+    return trace_response(runner)
+
+@app.get("/api/trajectories")
+def list_trajectories():
+    # Recorded sessions that can be replayed with /api/replay
+    return {"sessions": [dict(info, session=session) for session, info in get_trajectory_store().sessions()]}
+
+@app.post("/api/replay")
+def replay_agent(req: ReplayRequest):
+    return start_replay(runner, req.session)
+
+@app.get("/api/devices")
+def list_devices():
+    registry.discover()
+    return {"devices": registry.list()}
+
+@app.get("/api/devices/{serial}/status")
+def get_device_status(serial: str):
+    return get_device_runner(serial).get_status()
+
+@app.get("/api/devices/{serial}/screenshot")
+def get_device_screenshot(serial: str):
+    return screenshot_response(get_device_runner(serial))
+
+@app.get("/api/devices/{serial}/trace")
+def get_device_trace(serial: str):
+    return trace_response(get_device_runner(serial))
+
+@app.post("/api/devices/{serial}/instruction")
+def update_device_instruction(serial: str, req: InstructionRequest):
+    r = get_device_runner(serial)
+    r.update_instruction(req.instruction)
+    return {"status": "updated", "serial": serial, "instruction": r.instruction}
+
+@app.post("/api/devices/{serial}/start")
+def start_device(serial: str):
+    get_device_runner(serial).start()
+    return {"status": "started", "serial": serial}
+
+@app.post("/api/devices/{serial}/stop")
+def stop_device(serial: str):
+    get_device_runner(serial).stop()
+    return {"status": "stopped", "serial": serial}
+
+@app.post("/api/devices/{serial}/replay")
+def replay_device(serial: str, req: ReplayRequest):
+    return {**start_replay(get_device_runner(serial), req.session), "serial": serial}
+
+@app.get("/api/fleet/stats")
+async def fleet_stats():
+    return registry.fleet_stats()
+
+@app.get("/api/metrics")
+async def metrics():
+    # Prometheus text exposition: per-stage step timing histograms for every device and model backend
+    return Response(get_metrics().render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/inference/stats")
+async def get_inference_stats():
+    # Connection-pool usage per model backend; connection_reuse close to 1.0 means no repeated handshakes
+    return {"backends": inference_stats()}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,55 @@
+"""
+对比 adb 命令的三种执行方式的单次延迟:
+  1. 原生客户端 + 常驻 shell 通道 (controller 默认路径)
+  2. 原生客户端, 每条命令一个 shell: 连接
+  3. adb CLI 子进程 (shell=True, 即改造前的方式, 需要 PATH 中有 adb)
+
+    python tools/bench_adb.py -n 200
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MobileAgent.adb_client import AdbClient
+from tools.fake_adb import FakeAdbServer, FakeDevice
+
+
+def bench(name, fn, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    print(f"{name:<28} mean {statistics.mean(samples):8.3f} ms   "
+          f"p50 {samples[len(samples) // 2]:8.3f} ms   p95 {samples[int(len(samples) * 0.95)]:8.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=200)
+    args = parser.parse_args()
+
+    serial = "emulator-5554"
+    server = FakeAdbServer([FakeDevice(serial)]).start()
+    client = AdbClient(serial=serial, port=server.port)
+
+    bench("native persistent shell", lambda: client.shell("input tap 100 200"), args.n)
+    bench("native one-shot shell:", lambda: client.shell_oneshot("input tap 100 200"), args.n)
+    bench("native exec: screencap -p", lambda: client.exec_out("screencap -p"), max(1, args.n // 10))
+
+    adb = shutil.which("adb")
+    if adb:
+        command = f"{adb} -P {server.port} -s {serial} shell input tap 100 200"
+        bench("adb CLI subprocess", lambda: subprocess.run(command, capture_output=True, text=True, shell=True), args.n)
+    else:
+        print("adb CLI subprocess           skipped (adb not found in PATH)")
+
+    client.close()
+    server.stop()
@@ -0,0 +1,51 @@
+"""
+对比两种截图方式的各阶段耗时:
+  png: 设备端 `screencap -p` 压缩后传输
+  raw: 传输原始 framebuffer，在本机按需编码
+
+    python tools/bench_capture.py -n 10                       # 使用假 adb server
+    python tools/bench_capture.py -n 10 --adb-path "adb -s <serial>"  # 真机
+"""
+import argparse
+import os
+import statistics
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MobileAgent.api import encode_image
+from MobileAgent.screen import capture_screenshot
+from tools.fake_adb import FakeAdbServer, FakeDevice
+
+
+def run(adb_path, mode, n):
+    stages = {}
+    for _ in range(n):
+        frame = capture_screenshot(adb_path, mode=mode)
+        _ = frame.pixels
+        encode_image(frame)
+        frame.encode("JPEG", 85)
+        for name, value in frame.timings.items():
+            stages.setdefault(name, []).append(value)
+    print(f"[{mode}] {frame.width}x{frame.height}")
+    for name, values in stages.items():
+        print(f"  {name:<20} mean {statistics.mean(values):8.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=10)
+    parser.add_argument("--adb-path", default=None)
+    args = parser.parse_args()
+
+    server = None
+    adb_path = args.adb_path
+    if adb_path is None:
+        server = FakeAdbServer([FakeDevice("emulator-5554")]).start()
+        adb_path = server.adb_path("emulator-5554")
+
+    for mode in ("png", "raw"):
+        run(adb_path, mode, args.n)
+
+    if server is not None:
+        server.stop()
@@ -0,0 +1,67 @@
+"""
+对比在不同历史长度下追加一轮对话的耗时和内存分配:
+  deepcopy:    改动前的 add_response，每次 copy.deepcopy 整个历史 (遍历并复制每一轮的 dict/list)
+  ChatHistory: MobileAgent.chat 中的持久化历史，新旧版本共享已有轮次
+
+    python tools/bench_chat.py --lengths 1 3 7 15 31 --image-kb 800
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MobileAgent.chat import ChatHistory, add_response, init_action_chat
+
+
+def image_content(prompt, kb, seed):
+    # 每张截图是独立的 base64 字符串
+    payload = (chr(65 + seed % 26) * 1024) * kb
+    return [{"type": "text", "text": prompt},
+            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{payload}"}}]
+
+
+def legacy_add_response(role, prompt, chat_history, content):
+    new_chat_history = copy.deepcopy(chat_history)
+    new_chat_history.append([role, content])
+    return new_chat_history
+
+
+def measure(fn, repeat):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - start) * 1000 / repeat
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lengths", type=int, nargs="+", default=[1, 3, 7, 15, 31, 63])
+    parser.add_argument("--image-kb", type=int, default=800, help="每张截图 base64 的大小")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'turns':>6} | {'deepcopy ms':>11} {'alloc KB':>9} | {'ChatHistory ms':>14} {'alloc KB':>9}")
+    for length in args.lengths:
+        turns = init_action_chat() + [["user", image_content(f"step {i}", args.image_kb, i)] for i in range(length)]
+        new_turn = image_content("next", args.image_kb, length)
+
+        _, old_ms, old_peak = measure(lambda: legacy_add_response("user", "next", turns, new_turn), args.repeat)
+        history = ChatHistory(turns)
+        result, new_ms, new_peak = measure(lambda: history.append(["user", new_turn]), args.repeat)
+        assert len(result) == len(turns) + 1 and len(history) == len(turns)
+        print(f"{length:>6} | {old_ms:11.3f} {old_peak / 1024:9.1f} | {new_ms:14.4f} {new_peak / 1024:9.2f}")
+
+    # add_response 本身: 截图编码开销与历史长度无关，追加本身不再复制历史
+    history = ChatHistory(init_action_chat())
+    start = time.perf_counter()
+    for i in range(args.lengths[-1]):
+        history = add_response("user", f"step {i}", history)
+    print(f"add_response x{args.lengths[-1]}: {(time.perf_counter() - start) * 1000:.2f} ms total")
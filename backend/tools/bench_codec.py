@@ -0,0 +1,128 @@
+"""
+离线对比各截图编码 (PNG / JPEG / WebP 与质量) 的请求体大小、编码耗时和点击坐标漂移。
+
+回放录制的截图和模型输出: 目录中放截图，以及 outputs.jsonl，每行
+    {"image": "0001.png", "output": "Thought: ...\\nAction: click(start_box='(500,300)')"}
+坐标默认为 UI-TARS 的 0~1000 相对坐标 (--absolute 表示原图像素坐标)。
+漂移: 以原图中点击点周围的小块为模板，在解码后的图像上 ±radius 范围内搜索最佳匹配的位移；
+位移为 0 说明压缩没有改变点击目标的外观位置。
+
+    python tools/bench_codec.py                              # 合成界面 + 图标中心作为点击点
+    python tools/bench_codec.py --recordings recordings/run1 --codecs png jpeg:85 webp:80
+"""
+import argparse
+import io
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from MobileAgent.codec import ImageCodec
+from MobileAgent.screen import Frame
+from tools.bench_preprocess import synthetic_screen
+
+DEFAULT_CODECS = ["png", "jpeg:95", "jpeg:85", "jpeg:70", "webp:90", "webp:80", "webp:60"]
+_POINT = re.compile(r"start_box='[^0-9]*(\d+(?:\.\d+)?)\s*,\s*(\d+(?:\.\d+)?)")
+
+
+def load_recordings(path, absolute):
+    samples = []
+    with open(os.path.join(path, "outputs.jsonl"), encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            pixels = np.asarray(Image.open(os.path.join(path, record["image"])).convert("RGB"))
+            height, width = pixels.shape[:2]
+            match = _POINT.search(record.get("output", ""))
+            points = []
+            if match:
+                x, y = float(match.group(1)), float(match.group(2))
+                if not absolute:
+                    x, y = x * width / 1000, y * height / 1000
+                points.append((int(x), int(y)))
+            samples.append((pixels, points))
+    return samples
+
+
+def synthetic_samples(n):
+    samples = []
+    for seed in range(n):
+        pixels = synthetic_screen(seed=seed)
+        # 合成界面中每个列表项左侧圆形图标的中心，以及第一行文字的开头
+        points = [(130, 120 + 250 * k + 110) for k in range(8)]
+        points += [(260, 120 + 250 * k + 64) for k in range(8)]
+        samples.append((pixels, points))
+    return samples
+
+
+def match_offset(original, decoded, point, patch=24, radius=6):
+    """在 decoded 中搜索与 original 上 point 附近小块最相似的位置，返回 (位移像素, 小块 PSNR)"""
+    height, width = original.shape[:2]
+    x, y = point
+    x = min(max(x, patch + radius), width - patch - radius - 1)
+    y = min(max(y, patch + radius), height - patch - radius - 1)
+    template = original[y - patch:y + patch, x - patch:x + patch].astype(np.float32)
+    # 按离原点的距离遍历位移，分数相同时保留更近的位移
+    offsets = sorted(((dx, dy) for dy in range(-radius, radius + 1) for dx in range(-radius, radius + 1)),
+                     key=lambda o: o[0] * o[0] + o[1] * o[1])
+    best, best_offset = None, (0, 0)
+    for dx, dy in offsets:
+        window = decoded[y + dy - patch:y + dy + patch, x + dx - patch:x + dx + patch].astype(np.float32)
+        score = np.abs(window - template).mean()
+        if best is None or score < best - 1e-6:
+            best, best_offset = score, (dx, dy)
+    same = decoded[y - patch:y + patch, x - patch:x + patch].astype(np.float32)
+    mse = float(((same - template) ** 2).mean())
+    psnr = 99.0 if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+    return float(np.hypot(*best_offset)), psnr
+
+
+def run(codec, samples):
+    sizes, encode_ms, drifts, psnrs = [], [], [], []
+    for pixels, points in samples:
+        frame = Frame.from_array(pixels)
+        start = time.perf_counter()
+        data = codec.encode(frame)
+        encode_ms.append((time.perf_counter() - start) * 1000)
+        sizes.append(len(data))
+        decoded = np.asarray(Image.open(io.BytesIO(data)).convert("RGB"))
+        for point in points:
+            drift, psnr = match_offset(pixels, decoded, point)
+            drifts.append(drift)
+            psnrs.append(psnr)
+    return {
+        "codec": repr(codec),
+        "kb": statistics.mean(sizes) / 1024,
+        "encode_ms": statistics.mean(encode_ms),
+        "drift_mean": statistics.mean(drifts) if drifts else 0.0,
+        "drift_max": max(drifts) if drifts else 0.0,
+        "psnr": statistics.mean(psnrs) if psnrs else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recordings", default=None, help="截图 + outputs.jsonl 所在目录")
+    parser.add_argument("--absolute", action="store_true", help="录制的坐标是原图像素坐标")
+    parser.add_argument("--codecs", nargs="+", default=DEFAULT_CODECS)
+    parser.add_argument("-n", type=int, default=3, help="合成截图数量")
+    args = parser.parse_args()
+
+    if args.recordings:
+        samples = load_recordings(args.recordings, args.absolute)
+    else:
+        samples = synthetic_samples(args.n)
+    print(f"{len(samples)} screens, {sum(len(p) for _, p in samples)} click points")
+    print(f"{'codec':<10} {'size KB':>9} {'encode ms':>10} {'drift px':>9} {'max px':>7} {'patch PSNR':>11}")
+    for spec in args.codecs:
+        r = run(ImageCodec.parse(spec), samples)
+        print(f"{r['codec']:<10} {r['kb']:9.1f} {r['encode_ms']:10.2f} {r['drift_mean']:9.2f} "
+              f"{r['drift_max']:7.1f} {r['psnr']:11.1f}")
@@ -0,0 +1,133 @@
+"""
+不接手机、不调用真实模型，端到端测量 agent 循环 (UITARSRunner.run_loop) 的吞吐和各阶段耗时:
+每台设备是一个 MobileAgent.simulator.SimulatedDevice (按屏幕图返回截图、点击命中按钮时跳转)，
+模型是 tools/mock_model_server.py (每台设备一个)。默认使用合成的屏幕链，也可以用 --graph 指定录制的屏幕图 JSON
+(此时模型输出用 --outputs 文件给出，每行一个)，或用 --trajectory 由录制的会话生成屏幕图。
+--trace 把每个任务的时间线 (截图、编码、推理、adb 命令、界面稳定等待) 写成 Chrome Trace JSON。
+流式拿到 Action 后默认读完剩余的尾部、连接复用；--cancel-on-disconnect 改为断开连接取消剩余生成 (vLLM 的做法)，
+每一步都要重新建连。两种方式的差别用 --tail-chars (Action 之后模型还会生成的字符数) 比较，输出里的 model 一行
+给出新建的连接数和被取消的流数: 尾部很短时读完尾部几乎不增加耗时且省掉每步的 TCP/TLS 握手，尾部很长时才值得断开。
+
+    python tools/bench_loop.py --devices 4 --tasks 3 --screens 5 --capture-ms 80 --input-ms 30
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "service"))
+
+from MobileAgent.device_backend import register_backend
+from MobileAgent.http_client import configure_backend, get_inference_client
+from MobileAgent.simulator import SimulatedDevice, ScreenGraph, synthetic_graph
+from MobileAgent.trajectory import TrajectoryStore, DEFAULT_DIR
+from MobileAgent.tracing import save as save_trace
+from MobileAgent.workspace import Workspace
+from tools.mock_model_server import MockModelServer
+
+STAGES = ["capture_ms", "preprocess_ms", "build_ms", "encode_ms", "inference_ms", "first_token_ms", "parse_ms",
+          "execute_ms", "settle_ms", "step_ms"]
+
+
+def chain_outputs(screens):
+    # 合成屏幕链的按钮在 (540, 1800) / (1080, 2340)，即 UI-TARS 的 0~1000 相对坐标 (500, 769)
+    click = "Thought: 点击下一步按钮\nAction: click(start_box='<|box_start|>(500,769)<|box_end|>')"
+    return [click] * (screens - 1) + ["Thought: 已到最后一页\nAction: finished(content='done')"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=2)
+    parser.add_argument("--tasks", type=int, default=3, help="每台设备执行的任务数")
+    parser.add_argument("--screens", type=int, default=5, help="合成屏幕链的长度 (每个任务的步数)")
+    parser.add_argument("--graph", default=None, help="屏幕图 JSON")
+    parser.add_argument("--outputs", default=None, help="--graph 对应的模型输出，每行一个 (\\n 写作 \\\\n)")
+    parser.add_argument("--trajectory", default=None, help="由录制的会话生成屏幕图，模型输出取录制的输出")
+    parser.add_argument("--trajectory-dir", default=os.getenv("TRAJECTORY_DIR", DEFAULT_DIR))
+    parser.add_argument("--capture-ms", type=float, default=50.0)
+    parser.add_argument("--input-ms", type=float, default=20.0)
+    parser.add_argument("--model-latency", type=float, default=0.2, help="模型首 token 前的延迟 (秒)")
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--tail-chars", type=int, default=0, help="模型输出在 Action 行之后还有多少字符")
+    parser.add_argument("--cancel-on-disconnect", action="store_true", help="拿到 Action 后断开连接取消剩余生成")
+    parser.add_argument("--trace", default=None, help="所有任务的时间线写到该文件 (Chrome Trace JSON，可用 Perfetto 打开)")
+    args = parser.parse_args()
+
+    # 本次运行的轨迹写到临时目录，不混进正式记录
+    os.environ["TRAJECTORY_DIR"] = tempfile.mkdtemp(prefix="bench_loop_")
+    os.environ["TRAJECTORY_RECORD"] = "1"
+    from agent_runner import UITARSRunner
+
+    if args.trajectory:
+        store = TrajectoryStore(args.trajectory_dir)
+        graph = ScreenGraph.from_trajectory(store, args.trajectory)
+        outputs = [r["output"] for r in store.steps(args.trajectory) if r.get("action")]
+    elif args.graph:
+        graph = ScreenGraph.load(args.graph)
+        with open(args.outputs, encoding="utf-8") as f:
+            outputs = [line.rstrip("\n").replace("\\n", "\n") for line in f if line.strip()]
+    else:
+        graph = synthetic_graph(args.screens)
+        outputs = chain_outputs(args.screens)
+    if args.tail_chars:
+        outputs = [output + "\n" + "." * args.tail_chars for output in outputs]
+
+    workdir = tempfile.mkdtemp(prefix="bench_loop_ws_")
+    runners, devices, servers = [], [], []
+    for i in range(args.devices):
+        # 每台设备一个假模型服务，模型输出按各自的任务顺序返回
+        server = MockModelServer(outputs=outputs, latency=args.model_latency, token_delay=args.token_delay).start()
+        servers.append(server)
+        configure_backend(server.url, cancel_on_disconnect=args.cancel_on_disconnect)
+        device = SimulatedDevice(graph, serial=f"sim-{i}", capture_ms=args.capture_ms, input_ms=args.input_ms)
+        name = register_backend(f"bench-{i}", device)
+        runner = UITARSRunner(adb_path=name)
+        runner.API_url_uitars = server.url
+        runner.instruction = "依次点击下一步直到最后一页"
+        runner.workspace = Workspace(os.path.join(workdir, device.serial))
+        runners.append(runner)
+        devices.append(device)
+
+    start = time.perf_counter()
+    traces = []
+    for _ in range(args.tasks):
+        for device, runner in zip(devices, runners):
+            device.reset()
+            runner.start()
+        for runner in runners:
+            runner.thread.join()
+            traces.append(runner.trace)
+    elapsed = time.perf_counter() - start
+    for server in servers:
+        server.stop()
+    if args.trace:
+        save_trace(traces, args.trace)
+        print(f"trace: {args.trace} ({sum(len(t.events) for t in traces if t)} events)")
+
+    steps = sum(r.total_steps for r in runners)
+    tasks = sum(r.tasks_completed for r in runners)
+    print(f"{args.devices} devices x {args.tasks} tasks: {tasks} tasks / {steps} steps in {elapsed:.1f} s "
+          f"-> {steps / elapsed:.2f} steps/s, {tasks / elapsed * 3600:.0f} tasks/h")
+    print(f"device: {sum(d.stats['captures'] for d in devices)} captures, "
+          f"{sum(d.stats['transitions'] for d in devices)} transitions, {sum(d.stats['misses'] for d in devices)} missed inputs")
+    clients = [get_inference_client(server.url).stats() for server in servers]
+    print(f"model: {sum(c['requests'] for c in clients)} requests, {sum(c['connections_opened'] for c in clients)} "
+          f"connections opened, {sum(s.streams_cancelled for s in servers)} streams cancelled "
+          f"({'cancel on disconnect' if args.cancel_on_disconnect else 'drain tail'})")
+
+    store = runners[0].trajectory
+    if store is not None:
+        store.flush()
+        records = [r for session, _ in store.sessions() for r in store.steps(session)]
+        print(f"{'stage':<14} {'mean ms':>8} {'p95 ms':>8}")
+        for stage in STAGES:
+            values = sorted(r["timings"][stage] for r in records if stage in r.get("timings", {}))
+            if values:
+                print(f"{stage:<14} {statistics.mean(values):8.1f} {values[int(0.95 * (len(values) - 1))]:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
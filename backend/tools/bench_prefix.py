@@ -0,0 +1,80 @@
+"""
+对比 run_qwen.py 各提示词布局在模拟前缀缓存下的 prefill token 数和首 token 延迟 (TTFT):
+  legacy:  原布局，指令列表 (json 化) 和当前截图在同一条 user 消息里，不带历史
+  sliding: 只追加布局但历史每步滑动一轮 (stride=1)，窗口满后每步前缀都会变
+  prefix:  PrefixPromptLayout，历史超出 history_n 时一次淘汰 stride 轮
+本地启动 tools/mock_model_server.py，它按块哈希模拟 vLLM 的前缀缓存，并按未命中 token 数延迟首 token。
+
+    python tools/bench_prefix.py --steps 20 --prefill-ms 0.2
+"""
+import argparse
+import os
+import statistics
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MobileAgent.chat import ChatHistory, init_action_chat_uitars, add_response_uitars
+from MobileAgent.codec import CodecConfig
+from MobileAgent.http_client import InferenceClient
+from MobileAgent.preprocess import ImagePreprocessor
+from MobileAgent.prompt_layout import PrefixPromptLayout, legacy_messages, QWEN_SYSTEM_PROMPT
+from MobileAgent.screen import Frame
+from MobileAgent.streaming import stream_chat
+from tools.bench_preprocess import synthetic_screen
+from tools.mock_model_server import MockModelServer
+
+REPLIES = [
+    "Thought: 打开设置\nAction: click(start_box='(540,1200)')",
+    "Thought: 向下滑动找到显示选项\nAction: scroll(start_box='(540,1600)', direction='down')",
+    "Thought: 点击亮度\nAction: click(start_box='(300,820)')",
+]
+
+
+def run(layout_name, frames, instruction, args):
+    server = MockModelServer(outputs=REPLIES, token_delay=0.0, prefill_ms_per_token=args.prefill_ms).start()
+    client = InferenceClient(server.url)
+    codecs = CodecConfig("jpeg:85")
+    instruction_prompt = init_action_chat_uitars(instruction)[1]["content"][0]["text"]
+    stride = 1 if layout_name == "sliding" else None
+    layout = PrefixPromptLayout(QWEN_SYSTEM_PROMPT, instruction_prompt, history_n=args.history_n, stride=stride)
+    # 原布局的指令对话各步相同，只建一次
+    chat_action = add_response_uitars(ChatHistory(init_action_chat_uitars(instruction)), [])
+    rows = []
+    try:
+        for frame in frames:
+            image_url = codecs.data_url(frame)
+            if layout_name == "legacy":
+                messages = legacy_messages(QWEN_SYSTEM_PROMPT, chat_action, image_url)
+            else:
+                messages = layout.messages(image_url)
+            parser = stream_chat(client, server.url, {"model": "mock", "messages": messages, "max_tokens": 512})
+            layout.add_turn(parser.output())
+            usage = server.usage_log[-1]
+            cached = usage["prompt_tokens_details"]["cached_tokens"]
+            rows.append((usage["prompt_tokens"], cached, usage["prompt_tokens"] - cached, parser.first_token_ms))
+    finally:
+        client.close()
+        server.stop()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--history-n", type=int, default=7)
+    parser.add_argument("--prefill-ms", type=float, default=0.2, help="每个未命中 token 的模拟 prefill 耗时")
+    parser.add_argument("--layouts", nargs="+", default=["legacy", "sliding", "prefix"])
+    args = parser.parse_args()
+
+    preprocessor = ImagePreprocessor(max_pixels=1280 * 28 * 28, min_pixels=100 * 28 * 28)
+    frames = [preprocessor.process(Frame.from_array(synthetic_screen(seed=i))) for i in range(args.steps)]
+    instruction = "打开设置，把屏幕亮度调到最大"
+
+    print(f"{'layout':<8} | {'prompt':>7} {'cached':>7} {'prefill':>8} | {'TTFT ms':>8} {'p95 ms':>7} | per-step prefill")
+    for name in args.layouts:
+        rows = run(name, frames, instruction, args)
+        ttft = sorted(r[3] for r in rows)
+        print(f"{name:<8} | {statistics.mean(r[0] for r in rows):7.0f} {statistics.mean(r[1] for r in rows):7.0f}"
+              f" {statistics.mean(r[2] for r in rows):8.0f} | {statistics.mean(ttft):8.1f}"
+              f" {ttft[int(0.95 * (len(ttft) - 1))]:7.1f} | {' '.join(str(r[2]) for r in rows)}")
@@ -0,0 +1,95 @@
+"""
+对比上传原图与本机 smart_resize 预处理后的请求体大小和端到端耗时
+(缩放 + PNG 编码 + base64 + 发送到假模型服务并拿到响应)，并按上行带宽估算上传时间。
+
+    python tools/bench_preprocess.py -n 10                          # 合成的 1080x2340 界面截图
+    python tools/bench_preprocess.py --image screenshot/screenshot.png --max-pixels 1003520
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from MobileAgent.api import encode_image
+from MobileAgent.http_client import get_inference_client
+from MobileAgent.preprocess import ImagePreprocessor
+from MobileAgent.retry import post_with_retry
+from MobileAgent.screen import Frame
+from tools.mock_model_server import MockModelServer
+
+
+def synthetic_screen(width=1080, height=2340, seed=0):
+    """状态栏、列表项、图标和文字行组成的近似 App 界面，压缩率接近真实截图"""
+    rng = np.random.default_rng(seed)
+    image = Image.new("RGB", (width, height), (245, 245, 245))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, width, 90), fill=(30, 30, 30))
+    y = 120
+    while y < height - 200:
+        draw.rectangle((30, y, width - 30, y + 220), fill=(255, 255, 255), outline=(220, 220, 220))
+        draw.ellipse((60, y + 40, 200, y + 180), fill=tuple(int(c) for c in rng.integers(0, 255, 3)))
+        for line in range(3):
+            length = int(rng.integers(300, width - 300))
+            for x in range(240, 240 + length, 22):
+                draw.rectangle((x, y + 50 + line * 50, x + 16, y + 78 + line * 50),
+                               fill=(int(rng.integers(20, 90)),) * 3)
+        y += 250
+    pixels = np.asarray(image).copy()
+    # 少量噪声模拟图片内容和抗锯齿
+    noise_rows = slice(height // 3, height // 3 + 300)
+    pixels[noise_rows] = rng.integers(0, 255, pixels[noise_rows].shape, dtype=np.uint8)
+    return pixels
+
+
+def run(name, source, preprocessor, server, n, uplink_mbps):
+    client = get_inference_client(server.url)
+    sizes, prep_ms, e2e_ms = [], [], []
+    for _ in range(n):
+        # 每轮用新的 Frame，避免命中编码缓存
+        frame = Frame.from_array(source)
+        start = time.perf_counter()
+        model_frame = preprocessor.process(frame)
+        b64 = encode_image(model_frame)
+        prepared = time.perf_counter()
+        body = {"model": "mock", "messages": [{"role": "user", "content": [
+            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{b64}"}}]}]}
+        post_with_retry(client, server.url, json=body)
+        done = time.perf_counter()
+        sizes.append(len(b64))
+        prep_ms.append((prepared - start) * 1000)
+        e2e_ms.append((done - start) * 1000)
+    size_kb = statistics.mean(sizes) / 1024
+    upload_ms = statistics.mean(sizes) * 8 / (uplink_mbps * 1e6) * 1000
+    print(f"[{name}] {model_frame.width}x{model_frame.height}")
+    print(f"  payload           {size_kb:10.1f} KB (base64)")
+    print(f"  resize+encode     {statistics.mean(prep_ms):10.2f} ms")
+    print(f"  local round trip  {statistics.mean(e2e_ms):10.2f} ms")
+    print(f"  upload @{uplink_mbps:g} Mbps  {upload_ms:10.2f} ms (estimated)")
+    return statistics.mean(e2e_ms) + upload_ms
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=10)
+    parser.add_argument("--image", default=None, help="真实截图路径，默认使用合成界面")
+    parser.add_argument("--max-pixels", type=int, default=1280 * 28 * 28, help="默认与 run_qwen.py 一致")
+    parser.add_argument("--uplink-mbps", type=float, default=20.0)
+    args = parser.parse_args()
+
+    if args.image:
+        source = np.asarray(Image.open(args.image).convert("RGB"))
+    else:
+        source = synthetic_screen()
+    server = MockModelServer().start()
+
+    before = run("original", source, ImagePreprocessor(enabled=False), server, args.n, args.uplink_mbps)
+    after = run(f"smart_resize max_pixels={args.max_pixels}", source,
+                ImagePreprocessor(max_pixels=args.max_pixels), server, args.n, args.uplink_mbps)
+    print(f"end-to-end incl. upload: {before:.1f} ms -> {after:.1f} ms ({before / after:.1f}x)")
+    server.stop()
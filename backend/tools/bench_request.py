@@ -0,0 +1,116 @@
+"""
+对比每步构建请求体的开销:
+  legacy:  原 run_loop 的做法，重建 messages + add_response_uitars (deepcopy) + json 序列化整个历史
+  builder: MobileAgent.request_builder 增量拼接预序列化的 JSON 片段
+输出每步耗时和 tracemalloc 统计的内存分配峰值，并检查两者生成的请求体内容一致。
+
+    python tools/bench_request.py --steps 10 --history-n 5
+"""
+import argparse
+import copy
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from MobileAgent.chat import init_action_chat_uitars, add_box_token
+from MobileAgent.codec import CodecConfig
+from MobileAgent.request_builder import RequestBuilder
+from MobileAgent.screen import Frame
+
+MODEL = "doubao-1-5-ui-tars-250428"
+REPLY = "Thought: 点击搜索框输入关键词\nAction: click(start_box='(512,88)')"
+
+
+def make_frames(steps, width, height):
+    rng = np.random.default_rng(0)
+    # 随机噪声几乎不可压缩，PNG 大小接近真实高分辨率截图
+    return [Frame.from_array(rng.integers(0, 255, (height, width, 3), dtype=np.uint8)) for _ in range(steps)]
+
+
+def legacy_body(instruction, frames, responses, codecs, history_n):
+    """与改动前 run_loop 相同的消息构建方式"""
+    images = [codecs.data_url(f, "current" if i == len(frames) - 1 else "history") for i, f in enumerate(frames)]
+    messages, image_num = [], 0
+    for history_idx, history_response in enumerate(responses):
+        if history_idx + history_n > len(responses):
+            messages.append({"role": "user", "content": [{"type": "image_url", "image_url": {"url": images[image_num]}}]})
+            image_num += 1
+            messages.append({"role": "assistant", "content": [{"type": "text", "text": add_box_token(history_response)}]})
+    messages.append({"role": "user", "content": [{"type": "image_url", "image_url": {"url": images[image_num]}}]})
+    # 改动前的 add_response_uitars: deepcopy 后逐条追加
+    chat = copy.deepcopy(init_action_chat_uitars(instruction))
+    chat.extend(messages)
+    data = {"model": MODEL, "messages": [], "max_tokens": 2048, "temperature": 0.0, "seed": 1234}
+    for message in chat:
+        data["messages"].append({"role": message["role"], "content": message["content"]})
+    return json.dumps(data).encode("utf-8")
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--history-n", type=int, default=5)
+    parser.add_argument("--size", default="720x1560", help="截图尺寸 宽x高")
+    parser.add_argument("--gzip", type=int, default=0, help="builder 的 gzip 压缩级别，0 为不压缩")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split("x"))
+    frames = make_frames(args.steps, width, height)
+    codecs = CodecConfig("png")
+    for frame in frames:
+        codecs.data_url(frame)  # 预先编码，只比较请求体构建
+    instruction = "打开设置，把屏幕亮度调到最大"
+
+    builder = RequestBuilder(MODEL, codecs, history_n=args.history_n, gzip_level=0)
+    builder.set_prompt(init_action_chat_uitars(instruction))
+    zipped = RequestBuilder(MODEL, codecs, history_n=args.history_n, gzip_level=args.gzip) if args.gzip else None
+    if zipped:
+        zipped.set_prompt(init_action_chat_uitars(instruction))
+
+    history, responses, rows = [], [], []
+    for step, frame in enumerate(frames):
+        history = (history + [frame])[-args.history_n:]
+        old, old_ms, old_peak = measure(lambda: legacy_body(instruction, history, responses, codecs, args.history_n))
+
+        def build():
+            builder.set_screen(frame)
+            return builder.build()
+        new, new_ms, new_peak = measure(build)
+        if json.loads(old) != json.loads(new):
+            print(f"FAILED: request bodies differ at step {step + 1}")
+            sys.exit(1)
+        stats = dict(builder.last_stats)
+        if zipped:
+            zipped.set_screen(frame)
+            zipped.build()
+            stats["wire_bytes"], stats["gzip_ms"] = zipped.last_stats["wire_bytes"], zipped.last_stats["gzip_ms"]
+            zipped.add_response(add_box_token(REPLY))
+        rows.append((old_ms, old_peak, new_ms, new_peak, stats))
+        print(f"step {step + 1:2d}: body {len(new) / 1024:7.0f} KB | legacy {old_ms:7.2f} ms peak {old_peak / 2**20:6.1f} MB"
+              f" | builder {new_ms:6.2f} ms peak {new_peak / 2**20:6.1f} MB,"
+              f" serialized {stats['serialized_bytes'] / 1024:6.0f} KB"
+              + (f", gzip {stats['wire_bytes'] / 1024:.0f} KB in {stats['gzip_ms']:.1f} ms" if zipped else ""))
+        responses.append(REPLY)
+        builder.add_response(add_box_token(REPLY))
+
+    steady = rows[args.history_n:] or rows
+    print(f"steady state: legacy {statistics.mean(r[0] for r in steady):.2f} ms / {statistics.mean(r[1] for r in steady) / 2**20:.1f} MB"
+          f" -> builder {statistics.mean(r[2] for r in steady):.2f} ms / {statistics.mean(r[3] for r in steady) / 2**20:.1f} MB per step")
+    print("OK: request bodies identical")
@@ -0,0 +1,65 @@
+"""
+对比逐字符输入 (改造前的 controller.type) 与批量输入的单个字符串延迟。
+假设备每条命令额外耗时 --latency 秒，用来模拟设备端 input / am 进程启动开销。
+
+    python tools/bench_type.py --latency 0.03
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MobileAgent import adb_client
+from MobileAgent.controller import type as bulk_type
+from tools.fake_adb import FakeAdbServer, FakeDevice
+
+SAMPLES = [
+    "hello world",
+    "打开网易BUFF搜索爪子刀",
+    "今天北京天气怎么样？适合出门跑步吗，帮我查一下明天的预报以及空气质量指数\\n",
+    "user@example.com: Pa$$w0rd (test) & more",
+]
+
+
+def type_per_char(adb_path, text):
+    # 改造前的实现: 每个字符一条 adb 命令
+    text = text.replace("\\n", "_").replace("\n", "_")
+    for char in text:
+        if char == ' ':
+            adb_client.shell(adb_path, "input text %s")
+        elif char == '_':
+            adb_client.shell(adb_path, "input keyevent 66")
+        elif 'a' <= char <= 'z' or 'A' <= char <= 'Z' or char.isdigit():
+            adb_client.shell(adb_path, f"input text {char}")
+        elif char in '-.,!?@\'°/:;()':
+            adb_client.shell(adb_path, f"input text \"{char}\"")
+        else:
+            adb_client.shell(adb_path, f"am broadcast -a ADB_INPUT_TEXT --es msg \"{char}\"")
+
+
+def measure(device, adb_path, fn, text):
+    device.commands.clear()
+    start = time.perf_counter()
+    fn(adb_path, text)
+    return (time.perf_counter() - start) * 1000, len(device.commands)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.03, help="simulated per-command device latency (s)")
+    args = parser.parse_args()
+
+    device = FakeDevice("emulator-5554", command_latency=args.latency)
+    server = FakeAdbServer([device]).start()
+    adb_path = server.adb_path(device.serial)
+
+    print(f"{'chars':>5}  {'per-char ms':>12} {'cmds':>5}  {'bulk ms':>9} {'cmds':>5}  text")
+    for text in SAMPLES:
+        old_ms, old_cmds = measure(device, adb_path, type_per_char, text)
+        new_ms, new_cmds = measure(device, adb_path, bulk_type, text)
+        print(f"{len(text):>5}  {old_ms:>12.1f} {old_cmds:>5}  {new_ms:>9.1f} {new_cmds:>5}  {text[:24]}")
+
+    adb_client.close_all()
+    server.stop()
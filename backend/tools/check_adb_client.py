@@ -0,0 +1,66 @@
+"""
+用本地假 adb server 检查常驻 shell 通道的重连规则:
+通道在写命令之前已经断开时重建通道，命令只执行一次；命令送达之后连接断开时抛出 CommandSentError，
+不重试、也不回退到 adb CLI 再执行一遍 (input tap 等命令不会在设备上重复执行)，下一条命令使用新通道。
+
+    python tools/check_adb_client.py
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MobileAgent import adb_client
+from MobileAgent.adb_client import CommandSentError
+from tools.fake_adb import FakeAdbServer, FakeDevice
+
+
+def expect(name, condition, errors, detail=""):
+    print(f"{'ok  ' if condition else 'FAIL'} {name} {detail}")
+    if not condition:
+        errors.append(name)
+
+
+def main():
+    errors = []
+    device = FakeDevice("emulator-5554")
+    server = FakeAdbServer([device]).start()
+    adb_path = server.adb_path(device.serial)
+
+    expect("command runs", adb_client.shell(adb_path, "echo hello").strip() == "hello", errors)
+
+    # 1. 通道在写入之前已经断开: 重建后执行一次
+    server.close_shells()
+    time.sleep(0.05)
+    before = len(device.commands)
+    output = adb_client.shell(adb_path, "input tap 100 200")
+    ran = device.commands[before:].count("input tap 100 200")
+    expect("dead channel reconnects before sending", ran == 1, errors, f"(ran {ran} times)")
+    expect("native client still used", adb_client.get_client(adb_path) is not None, errors)
+
+    # 2. 命令送达之后断开: 抛出异常，命令只执行一次
+    server.drop_after_run = 1
+    before = len(device.commands)
+    try:
+        adb_client.shell(adb_path, "input tap 300 400")
+        expect("failure after send raises", False, errors, f"(returned {output!r})")
+    except CommandSentError as e:
+        expect("failure after send raises", True, errors, f"({e})")
+    ran = device.commands[before:].count("input tap 300 400")
+    expect("sent command is not retried", ran == 1, errors, f"(ran {ran} times)")
+    expect("no CLI fallback after send", adb_client.get_client(adb_path) is not None, errors)
+
+    # 3. 之后的命令使用新通道
+    expect("next command uses a new channel", adb_client.shell(adb_path, "echo again").strip() == "again", errors)
+
+    adb_client.close_all()
+    server.stop()
+    if errors:
+        print(f"FAILED: {len(errors)} checks")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+并发检查，分两部分:
+1. controller / crop 层: N 个线程对 N 台假 adb 设备 (tools/fake_adb.py) 同时截图、裁剪，
+   确认每个 workspace 中的文件只来自自己的设备 (旧的 os.chdir 方案下会互相覆盖)。
+2. runner 层: N 个 UITARSRunner 在同一进程中同时跑完整的 run_loop，每个 runner 一个独立的临时 workspace，
+   设备是同一个 SimulatedFleet 里屏幕互不相同的模拟设备 (sim://名字 -s serial)，模型是共用的假模型服务
+   (script="history"，与 tools/load_test.py 相同)。确认每个 runner 完成了自己的任务、点击只落在自己的设备上、
+   记录的截图和最后一帧都来自自己的设备、workspace 互不重叠。
+
+    python tools/check_concurrency.py -n 8 --iters 20 --tasks 2 --screens 4
+"""
+import argparse
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "service"))
+
+import numpy as np
+from PIL import Image
+
+from MobileAgent.controller import get_screenshot
+from MobileAgent.device_backend import register_backend, unregister_backend
+from MobileAgent.simulator import SimulatedDevice, SimulatedFleet, synthetic_graph
+from MobileAgent.workspace import Workspace
+from tools.bench_loop import chain_outputs
+from tools.fake_adb import FakeAdbServer, FakeDevice
+from tools.mock_model_server import MockModelServer
+
+
+def close(a, b, tol=8):
+    return all(abs(x - y) <= tol for x, y in zip(a, b))
+
+
+def pixel_hash(png):
+    return hashlib.sha256(np.asarray(Image.open(io.BytesIO(png)).convert("RGB")).tobytes()).hexdigest()
+
+
+def worker(device, adb_path, root, iters, errors):
+    try:
+        check(device, adb_path, root, iters, errors)
+    except Exception as e:
+        errors.append(f"{device.serial}: {type(e).__name__}: {e}")
+
+
+def check(device, adb_path, root, iters, errors):
+    # crop 依赖 cv2 / clip，只在这一部分需要
+    from MobileAgent.crop import crop
+    from agent_runner import UITARSRunner
+
+    workspace = Workspace(os.path.join(root, device.serial)).prepare()
+    runner = UITARSRunner(adb_path=adb_path)
+    for i in range(iters):
+        # controller / crop 层: 显式路径
+        frame = get_screenshot(adb_path, save_to=workspace.screenshot_file)
+        crop(frame, (0, 0, 16, 16), i, out_dir=workspace.temp_dir)
+        on_disk = Image.open(workspace.screenshot_file).convert("RGB").getpixel((0, 0))
+        cropped = Image.open(workspace.temp_path(f"{i}.jpg")).convert("RGB").getpixel((0, 0))
+        # runner 层: 内存中的帧
+        runner.get_perception_infos()
+        in_memory = tuple(int(v) for v in runner.latest_frame.pixels[0, 0, :3])
+        for name, color in (("screenshot", on_disk), ("crop", cropped), ("runner frame", in_memory)):
+            if not close(color, device.color):
+                errors.append(f"{device.serial} iter {i}: {name} color {color} != {device.color}")
+
+
+def check_files(args, root, errors):
+    devices = []
+    for k in range(args.n):
+        device = FakeDevice(f"emulator-{5554 + 2 * k}", width=360, height=780)
+        device.color = ((k * 37) % 256, (k * 91) % 256, (k * 151) % 256)
+        devices.append(device)
+    server = FakeAdbServer(devices).start()
+    threads = [threading.Thread(target=worker, args=(d, server.adb_path(d.serial), root, args.iters, errors))
+               for d in devices]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    server.stop()
+    print(f"files: {args.n} workers x {args.iters} iterations in {time.perf_counter() - start:.2f} s")
+
+
+def check_runners(args, root, errors):
+    """N 个 run_loop 同时运行，每个 runner 的设备、workspace、轨迹都只属于自己"""
+    from agent_runner import UITARSRunner
+
+    # 每台设备的屏幕链 seed 不同，截图互不相同，串到别的设备上一定能发现
+    devices = [SimulatedDevice(synthetic_graph(args.screens, seed=k + 1), serial=f"sim-{k}",
+                               capture_ms=args.capture_ms, input_ms=args.input_ms) for k in range(args.n)]
+    adb_path = register_backend("check-concurrency", SimulatedFleet(devices))
+    model = MockModelServer(outputs=chain_outputs(args.screens), latency=args.model_latency, token_delay=0.0,
+                            script="history").start()
+    runners = []
+    for device in devices:
+        runner = UITARSRunner(adb_path=adb_path, serial=device.serial)
+        runner.API_url_uitars = model.url
+        runner.instruction = "依次点击下一步直到最后一页"
+        runner.workspace = Workspace(os.path.join(root, "runners", device.serial))
+        runners.append(runner)
+
+    start = time.perf_counter()
+    for _ in range(args.tasks):
+        for device, runner in zip(devices, runners):
+            device.reset()
+            runner.start()
+        for runner in runners:
+            runner.thread.join(timeout=120)
+            if runner.thread.is_alive():
+                runner.stop()
+                errors.append(f"{runner.serial}: run_loop did not finish")
+    elapsed = time.perf_counter() - start
+    model.stop()
+    unregister_backend(adb_path)
+    print(f"runners: {args.n} run_loops x {args.tasks} tasks in {elapsed:.2f} s")
+
+    store = runners[0].trajectory
+    store.flush()
+    sessions = {}
+    for session, info in store.sessions():
+        sessions.setdefault(info.get("serial"), []).append(session)
+    # 界面稳定后的帧是 raw 截图在主机上编码的，文件字节和设备的 PNG 不同，按像素比较
+    own_screens = {d.serial: {pixel_hash(s.png) for s in d.graph.screens.values()} for d in devices}
+    roots = {os.path.realpath(r.workspace.root) for r in runners}
+    if len(roots) != len(runners):
+        errors.append(f"workspaces overlap: {len(roots)} roots for {len(runners)} runners")
+
+    for device, runner in zip(devices, runners):
+        serial = device.serial
+        if not runner.adb_path.endswith(f"-s {serial}"):
+            errors.append(f"{serial}: adb_path {runner.adb_path!r} does not target the device")
+        if (runner.tasks_completed, runner.total_steps) != (args.tasks, args.tasks * args.screens):
+            errors.append(f"{serial}: {runner.tasks_completed} tasks / {runner.total_steps} steps, "
+                          f"expected {args.tasks} / {args.tasks * args.screens}")
+        # 别的 runner 的点击落到这台设备上会多出跳转，这台设备的点击落到别处会少
+        expected = {"transitions": args.tasks * (args.screens - 1), "misses": 0}
+        got = {key: device.stats[key] for key in expected}
+        if got != expected:
+            errors.append(f"{serial}: device stats {got} != {expected}")
+        last = np.asarray(Image.open(io.BytesIO(device.graph.screens[f"screen{args.screens - 1}"].png)).convert("RGB"))
+        if runner.latest_frame is None or not np.array_equal(runner.latest_frame.pixels[..., :3], last):
+            errors.append(f"{serial}: latest frame is not the last screen of its own device")
+        if len(sessions.get(serial, [])) != args.tasks:
+            errors.append(f"{serial}: {len(sessions.get(serial, []))} recorded sessions, expected {args.tasks}")
+        for session in sessions.get(serial, []):
+            foreign = [r["step"] for r in store.steps(session)
+                       if r.get("screenshot") and pixel_hash(store.blob(r["screenshot"])) not in own_screens[serial]]
+            if foreign:
+                errors.append(f"{serial}: session {session[:8]} steps {foreign} recorded another device's screen")
+        if not os.path.isdir(runner.workspace.screenshot_dir) or not os.path.isdir(runner.workspace.temp_dir):
+            errors.append(f"{serial}: workspace {runner.workspace.root} was not prepared")
+    print(f"devices: {sum(d.stats['captures'] for d in devices)} captures, "
+          f"{sum(d.stats['transitions'] for d in devices)} transitions, {sum(d.stats['misses'] for d in devices)} missed inputs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=8, help="并发的设备 / runner 数")
+    parser.add_argument("--iters", type=int, default=20, help="controller 层每个线程的截图次数")
+    parser.add_argument("--tasks", type=int, default=2, help="runner 层每个 runner 的任务数")
+    parser.add_argument("--screens", type=int, default=4, help="每个任务的步数 (不超过 history_n + 1)")
+    parser.add_argument("--capture-ms", type=float, default=20.0)
+    parser.add_argument("--input-ms", type=float, default=10.0)
+    parser.add_argument("--model-latency", type=float, default=0.05, help="模型首 token 前的延迟 (秒)")
+    args = parser.parse_args()
+
+    errors = []
+    with tempfile.TemporaryDirectory() as root:
+        # 本次运行的轨迹写到临时目录，runner 层按轨迹检查每一步的截图来源
+        os.environ["TRAJECTORY_DIR"] = os.path.join(root, "trajectories")
+        os.environ["TRAJECTORY_RECORD"] = "1"
+        check_files(args, root, errors)
+        check_runners(args, root, errors)
+
+    if errors:
+        print(f"FAILED: {len(errors)} cross-device mix-ups")
+        for e in errors[:20]:
+            print("  " + e)
+        sys.exit(1)
+    print("OK: every workspace only saw its own device")
@@ -0,0 +1,77 @@
+"""
+检查推理客户端的连接统计 (MobileAgent.http_client): connections_opened 按实际的 socket connect 计数，
+与假模型服务端接受的 TCP 连接数一致 (包括连接被服务端断开后的重连)；keep-alive 时多个请求只建一个连接。
+流式提前拿到 Action 时默认读完尾部复用连接，cancel_on_disconnect 的后端断开连接取消剩余生成。
+
+    python tools/check_http_client.py
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MobileAgent.http_client import InferenceClient
+from MobileAgent.retry import RetryPolicy, post_with_retry
+from MobileAgent.streaming import stream_chat
+from tools.mock_model_server import MockModelServer
+
+BODY = {"model": "mock", "messages": [{"role": "user", "content": "hi"}]}
+
+
+def expect(name, condition, errors, detail=""):
+    print(f"{'ok  ' if condition else 'FAIL'} {name} {detail}")
+    if not condition:
+        errors.append(name)
+
+
+def main():
+    errors = []
+    policy = RetryPolicy(max_attempts=3, base_delay=0.01, max_delay=0.02)
+
+    server = MockModelServer().start()
+    client = InferenceClient(server.url)
+    for _ in range(10):
+        post_with_retry(client, server.url, policy=policy, json=BODY)
+    stats = client.stats()
+    expect("keep-alive: 10 requests over one connection", stats["connections_opened"] == 1 == server.connections,
+           errors, f"(client {stats['connections_opened']}, server {server.connections}, reuse {stats['connection_reuse']})")
+
+    # 服务端断开连接后，同一个连接对象重连也要计入
+    for _ in range(3):
+        server.drop_next(1)
+        post_with_retry(client, server.url, policy=policy, sleep=lambda _: None, json=BODY)
+    time.sleep(0.05)
+    stats = client.stats()
+    expect("reconnects are counted", stats["connections_opened"] == server.connections == 4, errors,
+           f"(client {stats['connections_opened']}, server {server.connections})")
+    expect("reuse ratio from real connects", stats["connection_reuse"] == round(1 - 4 / stats["requests"], 4), errors,
+           str(stats))
+    server.stop()
+
+    # 流式: Action 之后还有输出
+    output = "Thought: 点击\nAction: click(start_box='(1,2)')\n" + "." * 40
+    for cancel in (False, True):
+        server = MockModelServer(outputs=[output], token_delay=0.001).start()
+        client = InferenceClient(server.url, cancel_on_disconnect=cancel)
+        parsers = [stream_chat(client, server.url, BODY, policy=policy) for _ in range(5)]
+        time.sleep(0.05)
+        stats = server.stats()
+        expect(f"stream early stop, cancel_on_disconnect={cancel}",
+               all(p.stopped_early and p.action == "click(start_box='(1,2)')" for p in parsers), errors)
+        if cancel:
+            expect("cancel: one connection per stream, generation cancelled",
+                   client.connections_opened == 5 and stats["streams_cancelled"] == 5, errors, str(stats))
+        else:
+            expect("drain: streams share one connection", client.connections_opened == 1 == stats["connections"]
+                   and stats["streams_cancelled"] == 0, errors, str(stats))
+        server.stop()
+
+    if errors:
+        print(f"FAILED: {len(errors)} checks")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
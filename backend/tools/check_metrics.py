@@ -0,0 +1,73 @@
+"""
+检查计时指标: 直方图的桶计数是累计的、+Inf 等于总数；按设备 / 后端 / 来源分开统计；
+Prometheus 文本格式每一行都是合法的样本或注释、耗时以秒为单位；METRICS=0 时不记录；每步记录的开销在微秒级。
+
+    python tools/check_metrics.py
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MobileAgent.metrics import MetricsRegistry
+
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="([^"\\]|\\.)*",?)*\})? -?[0-9.e+]+$')
+TIMINGS = {"capture_ms": 45.0, "preprocess_ms": 12.0, "build_ms": 3.0, "encode_ms": 2.5, "inference_ms": 820.0,
+           "first_token_ms": 300.0, "parse_ms": 0.4, "execute_ms": 640.0, "settle_ms": 520.0, "step_ms": 1521.0}
+
+
+def expect(name, condition, errors, detail=""):
+    print(f"{'ok  ' if condition else 'FAIL'} {name} {detail}")
+    if not condition:
+        errors.append(name)
+
+
+def main():
+    errors = []
+    metrics = MetricsRegistry(enabled=True)
+    for _ in range(3):
+        metrics.observe_step(TIMINGS, "sim-0", "http://127.0.0.1:8001")
+    metrics.observe_step(dict(TIMINGS, inference_ms=70000.0), "sim-1", "http://127.0.0.1:8001", source="cache")
+    metrics.observe_step({"capture_ms": 40.0}, "sim-1", "http://127.0.0.1:8001", source="error")
+    metrics.task_finished("sim-0", "http://127.0.0.1:8001")
+    text = metrics.render()
+
+    bad = [line for line in text.splitlines() if not line.startswith("#") and not SAMPLE.match(line)]
+    expect("every line is a valid sample", not bad, errors, str(bad[:3]))
+    buckets = re.findall(r'uitars_stage_duration_seconds_bucket\{stage="inference",device="sim-0".*?le="([^"]+)"\} (\d+)', text)
+    counts = [int(c) for _, c in buckets]
+    expect("buckets are cumulative", counts == sorted(counts) and buckets[-1] == ("+Inf", "3"), errors, str(buckets[-3:]))
+    expect("820 ms lands in le=1 (seconds)", ('1', '3') in buckets and ('0.5', '0') in buckets, errors)
+    expect("over the largest bucket only counts in +Inf",
+           'uitars_stage_duration_seconds_bucket{stage="inference",device="sim-1",backend="http://127.0.0.1:8001",le="60"} 0' in text,
+           errors)
+    expect("sum per label set", 'uitars_stage_duration_seconds_sum{stage="inference",device="sim-0",backend="http://127.0.0.1:8001"} 2.460000' in text,
+           errors)
+    expect("steps by source", 'source="cache"} 1' in text and 'source="error"} 1' in text and 'source="model"} 3' in text, errors)
+    expect("tasks counted", 'uitars_tasks_total{device="sim-0",backend="http://127.0.0.1:8001"} 1' in text, errors)
+    expect("snapshot", metrics.snapshot()["capture"] == {"count": 5, "mean_ms": 44.0}, errors, str(metrics.snapshot()["capture"]))
+
+    disabled = MetricsRegistry(enabled=False)
+    disabled.observe_step(TIMINGS, "sim-0", "x")
+    expect("disabled registry records nothing", "uitars_stage_duration_seconds_bucket" not in disabled.render(), errors)
+
+    n = 20000
+    start = time.perf_counter()
+    for i in range(n):
+        metrics.observe_step(TIMINGS, f"sim-{i % 8}", "http://127.0.0.1:8001")
+    per_step_us = (time.perf_counter() - start) / n * 1e6
+    expect("overhead per step", per_step_us < 200, errors, f"{per_step_us:.1f} us for {len(TIMINGS)} stages")
+    start = time.perf_counter()
+    text = metrics.render()
+    print(f"render: {len(text.splitlines())} lines in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    if errors:
+        print(f"FAILED: {len(errors)} checks")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+用本地假模型服务检查重试策略和熔断器:
+暂时性 503 / 断连会被重试恢复，429 遵守 Retry-After，400 不重试，
+持续故障时熔断器打开并快速失败，reset 之后 half_open 探测成功即恢复；
+后端一直不可用时 runner 等待熔断器的总时长有上限，之后返回 Network Error 让任务失败；
+流式输出在 Action 之前中断时整个请求重试，中断计入熔断。
+
+    python tools/check_retry.py
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "service"))
+
+from MobileAgent.http_client import InferenceClient, get_inference_client
+from MobileAgent.retry import RetryPolicy, CircuitBreaker, InferenceError, CircuitOpenError, post_with_retry
+from MobileAgent.streaming import stream_chat
+from tools.mock_model_server import MockModelServer
+
+BODY = {"model": "mock", "messages": [{"role": "user", "content": "hi"}]}
+
+
+def new_client(server, threshold=3, reset=0.5):
+    client = InferenceClient(server.url, connect_timeout=1, read_timeout=2)
+    client.breaker = CircuitBreaker(failure_threshold=threshold, reset_timeout=reset)
+    return client
+
+
+def call(client, server, policy, sleeps=None):
+    sleep = sleeps.append if sleeps is not None else time.sleep
+    return post_with_retry(client, server.url, policy=policy, sleep=sleep, json=BODY)
+
+
+def expect(name, condition, errors, detail=""):
+    print(f"{'ok  ' if condition else 'FAIL'} {name} {detail}")
+    if not condition:
+        errors.append(name)
+
+
+def main():
+    server = MockModelServer().start()
+    policy = RetryPolicy(max_attempts=4, base_delay=0.01, max_delay=0.05)
+    errors = []
+
+    # 1. 暂时性错误被重试恢复
+    client = new_client(server, threshold=10)
+    server.fail_next(2, 503)
+    before = server.requests
+    call(client, server, policy)
+    expect("503 x2 then success", server.requests - before == 3, errors, f"({server.requests - before} requests)")
+
+    server.drop_next(1)
+    before = server.requests
+    call(client, server, policy)
+    expect("dropped connection retried", server.requests - before == 2, errors, f"({server.requests - before} requests)")
+
+    # 2. Retry-After 优先于指数退避
+    sleeps = []
+    server.fail_next(1, 429, retry_after=0.04)
+    call(client, server, policy, sleeps)
+    expect("429 honours Retry-After", sleeps == [0.04], errors, f"(slept {sleeps})")
+
+    # 3. 退避时间有上限且带随机抖动
+    delays = [policy.delay(n) for n in range(10)]
+    expect("backoff capped at max_delay", max(delays) <= policy.max_delay, errors)
+
+    # 4. 不可重试的错误立即失败，不计入熔断
+    server.fail_next(1, 400)
+    before = server.requests
+    try:
+        call(client, server, policy)
+        expect("400 raises", False, errors)
+    except InferenceError as e:
+        expect("400 not retried", server.requests - before == 1 and e.status == 400, errors)
+    expect("400 does not trip breaker", client.breaker.state == CircuitBreaker.CLOSED, errors)
+
+    # 5. 重试次数有上限
+    server.fail_next(100, 503)
+    before = server.requests
+    try:
+        call(client, server, policy)
+        expect("exhausted retries raise", False, errors)
+    except InferenceError:
+        expect("bounded attempts", server.requests - before == policy.max_attempts, errors,
+               f"({server.requests - before} requests)")
+    server.clear_faults()
+
+    # 6. 持续故障: 熔断器打开后快速失败，不再请求后端
+    client = new_client(server, threshold=3, reset=0.5)
+    server.fail_next(100, 503)
+    try:
+        call(client, server, policy)
+    except InferenceError:
+        pass
+    expect("breaker opened", client.breaker.state == CircuitBreaker.OPEN, errors, str(client.breaker.stats()))
+    before = server.requests
+    start = time.perf_counter()
+    try:
+        call(client, server, policy)
+        expect("open breaker raises", False, errors)
+    except CircuitOpenError as e:
+        elapsed = (time.perf_counter() - start) * 1000
+        expect("open breaker fails fast", server.requests == before and elapsed < 5, errors,
+               f"({elapsed:.2f} ms, retry in {e.retry_in:.2f} s)")
+
+    # 7. reset_timeout 之后 half_open 探测，成功即关闭
+    server.clear_faults()
+    time.sleep(0.55)
+    call(client, server, policy)
+    expect("half-open probe closes breaker", client.breaker.state == CircuitBreaker.CLOSED, errors)
+
+    server.fail_next(1, 503)
+    client.breaker.state, client.breaker.opened_at = CircuitBreaker.OPEN, time.monotonic() - 1
+    try:
+        call(client, server, policy)
+    except CircuitOpenError:
+        pass
+    expect("failed probe reopens breaker", client.breaker.state == CircuitBreaker.OPEN, errors)
+
+    # 8. 持续故障时 runner 不会无限等待熔断器: 超过 max_breaker_wait 后返回 Network Error
+    from agent_runner import UITARSRunner
+    runner = UITARSRunner(adb_path="sim://unused")
+    runner.running, runner.stream_inference = True, False
+    runner.retry_policy = RetryPolicy(max_attempts=2, base_delay=0.01, max_delay=0.02, max_breaker_wait=1.0)
+    get_inference_client(server.url).breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.2)
+    server.fail_next(1000, 503)
+    start = time.perf_counter()
+    output = runner._inference_chat_uitars_safe(json.dumps(BODY).encode("utf-8"), server.url, "token")
+    elapsed = time.perf_counter() - start
+    expect("sustained outage fails the call", output.startswith("Network Error"), errors, output[:80])
+    expect("breaker wait is bounded", elapsed < 2.5, errors, f"({elapsed:.2f} s)")
+    server.clear_faults()
+
+    # 9. 流式: 拿到 Action 之前流中断 (已收到 200 响应头)，重新请求而不是直接失败
+    client = new_client(server, threshold=10)
+    server.truncate_next(1, after=2)
+    before = server.requests
+    parser = stream_chat(client, server.url, BODY, policy=policy)
+    expect("truncated stream retried", server.requests - before == 2 and parser.action is not None, errors,
+           f"({server.requests - before} requests, action {parser.action!r})")
+
+    server.truncate_next(2, after=2)
+    try:
+        stream_chat(client, server.url, BODY, policy=RetryPolicy(max_attempts=2, base_delay=0.01, max_delay=0.02))
+        expect("interrupted streams raise", False, errors)
+    except InferenceError as e:
+        expect("interrupted streams raise", "stream interrupted" in str(e), errors, str(e)[:80])
+    expect("interruptions count as breaker failures", client.breaker.failures == 2, errors, str(client.breaker.stats()))
+
+    runner.stream_inference = True
+    get_inference_client(server.url).breaker = CircuitBreaker(failure_threshold=10)
+    server.truncate_next(1, after=2)
+    output = runner._inference_chat_uitars_safe(json.dumps(dict(BODY, stream=True)).encode("utf-8"), server.url, "token")
+    expect("runner recovers from a truncated stream", "Action:" in output and not output.startswith("Network Error"),
+           errors, output[:80])
+
+    server.stop()
+    if errors:
+        print(f"FAILED: {len(errors)} checks")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
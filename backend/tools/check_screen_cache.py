@@ -0,0 +1,95 @@
+"""
+检查截图 -> 动作缓存:
+感知哈希对状态栏变化和轻微噪声不敏感、对不同界面敏感；记录要等动作之后的界面确认后才会命中；
+动作之后的界面不一致时删除记录，动作之后界面不变的记录不保留；内存 LRU 淘汰后仍能从 sqlite 读回；指令或动作历史不同则不命中。
+
+    python tools/check_screen_cache.py
+"""
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from MobileAgent.screen import Frame
+from MobileAgent.screen_cache import ScreenActionCache, screen_hash, hamming
+from tools.bench_preprocess import synthetic_screen
+
+MODEL = "mock"
+OUTPUT = "Thought: 打开设置\nAction: click(start_box='(540,1200)')"
+
+
+def expect(name, condition, errors, detail=""):
+    print(f"{'ok  ' if condition else 'FAIL'} {name} {detail}")
+    if not condition:
+        errors.append(name)
+
+
+def screen(seed, noise=0, status_bar=False):
+    pixels = synthetic_screen(seed=seed).copy()
+    if status_bar:
+        pixels[:60, 40:300] = 20  # 状态栏时间变化
+    if noise:
+        rng = np.random.default_rng(seed + 100)
+        pixels = np.clip(pixels.astype(np.int16) + rng.integers(-noise, noise + 1, pixels.shape), 0, 255).astype(np.uint8)
+    return Frame.from_array(pixels)
+
+
+def main():
+    errors = []
+    home, home_again, other, after = screen(0), screen(0, noise=6, status_bar=True), screen(1), screen(2)
+
+    near = hamming(screen_hash(home), screen_hash(home_again))
+    far = hamming(screen_hash(home), screen_hash(other))
+    expect("same screen hashes close", near <= 6, errors, f"(distance {near})")
+    expect("different screens hash far", far > 20, errors, f"(distance {far})")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.sqlite")
+        cache = ScreenActionCache(path, capacity=1, enabled=True)
+        key = cache.key(MODEL, "打开设置", [], home)
+        expect("empty cache misses", cache.lookup(key) is None, errors)
+        cache.store(key, OUTPUT)
+        expect("unconfirmed entry is not served", cache.lookup(key) is None, errors)
+        cache.confirm(key, after)
+
+        again = cache.key(MODEL, " 打开设置。", [], home_again)
+        expect("revisited screen hits", cache.lookup(again) == OUTPUT, errors)
+        expect("post-action screen validates", cache.confirm(again, after), errors)
+        expect("other instruction misses", cache.lookup(cache.key(MODEL, "打开相机", [], home)) is None, errors)
+        expect("other history misses", cache.lookup(cache.key(MODEL, "打开设置", [OUTPUT], home)) is None, errors)
+
+        # capacity=1: 另一条记录把 home 挤出内存，之后从磁盘读回
+        other_key = cache.key(MODEL, "打开设置", [], other)
+        cache.store(other_key, OUTPUT)
+        cache.confirm(other_key, after)
+        expect("evicted entry comes back from disk", cache.lookup(key) == OUTPUT, errors)
+        restarted = ScreenActionCache(path, enabled=True)
+        expect("entry survives restart", restarted.lookup(restarted.key(MODEL, "打开设置", [], home)) == OUTPUT, errors)
+        stats = cache.stats()
+        expect("disk tier counted", stats["disk_hits"] == 1 and stats["memory_hits"] == 1, errors, str(stats))
+
+        expect("changed post-action screen invalidates", not cache.confirm(key, other), errors)
+        expect("invalidated entry is gone", cache.lookup(key) is None, errors)
+        expect("invalidated entry gone from disk",
+               ScreenActionCache(path, enabled=True).lookup(key) is None, errors)
+
+        static = cache.key(MODEL, "打开设置", [], other)
+        cache.store(static, OUTPUT)
+        cache.confirm(static, screen(1, noise=6))
+        expect("action without visible effect is not cached", cache.lookup(static) is None, errors)
+
+        disabled = ScreenActionCache(path, enabled=False)
+        expect("disabled cache never hits", disabled.lookup(disabled.key(MODEL, "打开设置", [], other)) is None, errors)
+        print(cache.stats())
+
+    if errors:
+        print(f"FAILED: {len(errors)} checks")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+检查界面稳定等待 (MobileAgent.settle):
+低分辨率截图只传回设备端抽样的几十行、像素与完整截图对应的行一致，设备不支持时退回完整 raw 截图；
+帧源重复返回同一帧时不算稳定 (只在画面变化时出帧的 screenrecord 除外)；点击跳转后能等到新界面稳定。
+
+    python tools/check_settle.py
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from MobileAgent import adb_client
+from MobileAgent.device_backend import DeviceBackend, register_backend, unregister_backend
+from MobileAgent.screen import Frame, THUMBNAIL_ROWS, capture_screenshot, capture_thumbnail
+from MobileAgent.settle import Settler
+from MobileAgent.simulator import SimulatedDevice, synthetic_graph
+from tools.fake_adb import FakeAdbServer, FakeDevice
+
+
+def expect(name, condition, errors, detail=""):
+    print(f"{'ok  ' if condition else 'FAIL'} {name} {detail}")
+    if not condition:
+        errors.append(name)
+
+
+class NoPipeDevice(DeviceBackend):
+    """不支持 tail / dd 的设备: 管道命令没有输出"""
+
+    def __init__(self, device):
+        self.device = device
+
+    def devices(self):
+        return self.device.devices()
+
+    def shell(self, command, serial=None):
+        return self.device.shell(command)
+
+    def exec_out(self, command, serial=None):
+        return b"" if "|" in command else self.device.exec_out(command)
+
+    def pull(self, remote_path, serial=None):
+        return self.device.pull(remote_path)
+
+
+def main():
+    errors = []
+
+    # 1. 模拟设备: 第一次取完整截图得到尺寸，之后只传回抽样的行
+    device = SimulatedDevice(synthetic_graph(3))
+    adb_path = register_backend("check-settle", device)
+    first = capture_thumbnail(adb_path)
+    expect("first call learns the geometry with a full frame", not first.downsampled and first.raw_geometry is not None,
+           errors, str(first))
+    thumb = capture_thumbnail(adb_path)
+    full = capture_screenshot(adb_path, mode="raw").pixels
+    rows = list(range(full.shape[0] // THUMBNAIL_ROWS // 2, full.shape[0], full.shape[0] // THUMBNAIL_ROWS))[:THUMBNAIL_ROWS]
+    step = full.shape[1] // 64
+    expect("thumbnail is downsampled", thumb.downsampled and thumb.pixels.shape[:2] == (len(rows), len(range(0, full.shape[1], step))),
+           errors, str(thumb.pixels.shape))
+    expect("thumbnail rows match the full frame", np.array_equal(thumb.pixels, full[rows][:, ::step]), errors)
+    raw_bytes = len(device.graph.screens[device.current].raw())
+    thumb_bytes = len(rows) * full.shape[1] * full.shape[2]
+    expect("thumbnail transfers a fraction of the raw frame", thumb_bytes * 50 < raw_bytes, errors,
+           f"({thumb_bytes / 1024:.0f} KB vs {raw_bytes / 1024 / 1024:.1f} MB)")
+    unregister_backend(adb_path)
+
+    # 2. 通过 adb 协议 (假 adb server) 同样可用
+    server = FakeAdbServer([FakeDevice("emulator-5554", width=360, height=780)]).start()
+    adb_path = server.adb_path("emulator-5554")
+    capture_thumbnail(adb_path)
+    thumb = capture_thumbnail(adb_path)
+    expect("thumbnail over the adb protocol", thumb.downsampled and thumb.pixels.shape[0] == THUMBNAIL_ROWS, errors,
+           str(thumb.pixels.shape))
+    server.stop()
+    adb_client.close_all()
+
+    # 3. 设备端命令不可用时一直退回完整 raw 截图
+    adb_path = register_backend("check-settle-nopipe", NoPipeDevice(SimulatedDevice(synthetic_graph(2))))
+    frames = [capture_thumbnail(adb_path) for _ in range(3)]
+    expect("unsupported device falls back to raw frames", not any(f.downsampled for f in frames), errors)
+    unregister_backend(adb_path)
+
+    # 4. 帧源没有新帧时重复返回的旧帧不算稳定
+    old = Frame.from_array(np.zeros((64, 64, 3), dtype=np.uint8))
+    settler = Settler(capture=lambda: old, interval=0.01, profiles={"click": (0.0, 0.3)})
+    result = settler.wait("click")
+    expect("repeated stale frame never settles", not result.settled and result.frames == 1, errors, str(result))
+    settler = Settler(capture=lambda: old, interval=0.01, profiles={"click": (0.0, 0.3)}, unchanged_when_stale=True)
+    result = settler.wait("click")
+    expect("change-only source settles without new frames", result.settled and result.waited < 0.1, errors, str(result))
+
+    # 5. 点击跳转 (界面切换耗时 300 ms) 后等到新界面稳定，结果不带低分辨率帧
+    graph = synthetic_graph(2)
+    for screen in graph.screens.values():
+        for region in screen.regions:
+            region["delay_ms"] = 300
+    device = SimulatedDevice(graph)
+    adb_path = register_backend("check-settle-tap", device)
+    settler = Settler(adb_path, interval=0.05)
+    capture_thumbnail(adb_path)
+    adb_client.shell(adb_path, "input tap 540 1800")
+    start = time.monotonic()
+    result = settler.wait("click")
+    expect("settles after the transition", result.settled and result.waited >= 0.3 and device.current == "screen1",
+           errors, str(result))
+    expect("no downsampled frame handed to the next step", result.frame is None, errors)
+    expect("settle polls use thumbnails", device.stats["thumbnails"] >= result.frames, errors, str(device.stats))
+    unregister_backend(adb_path)
+
+    if errors:
+        print(f"FAILED: {len(errors)} checks")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+用录制的 dumpsys 输出检查 MobileAgent.ui_state 的解析:
+Android 10 及以前 (mCurrentFocus / mFocusedApp=AppWindowToken / mResumedActivity)、
+Android 11+ (mFocusedApp=ActivityRecord / topResumedActivity / ResumedActivity:)、
+锁屏 (NotificationShade / StatusBar 获得焦点)、输入法弹出 (InputMethod 获得焦点)、切换动画进行中、无焦点窗口；
+以及 execute_action 在焦点没有变化时 (应用内返回) 退回画面比对等待。
+
+    python tools/check_ui_state.py
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MobileAgent.controller import execute_action
+from MobileAgent.device_backend import register_backend, unregister_backend
+from MobileAgent.simulator import SimulatedDevice, synthetic_graph
+from MobileAgent.ui_state import TransitionResult, UiState, parse_activity_dump, parse_probe_output, parse_window_dump
+
+# 设备端 PROBE_COMMAND (grep 之后) 的实际输出
+ANDROID_9 = """\
+  mCurrentFocus=Window{3f2a1b0 u0 com.android.settings/com.android.settings.Settings}
+  mFocusedApp=AppWindowToken{8e7c6d5 token=Token{1a2b3c4 ActivityRecord{5d6e7f8 u0 com.android.settings/.Settings t42}}}
+    mAppTransitionState=APP_STATE_IDLE
+--activity--
+    mResumedActivity: ActivityRecord{5d6e7f8 u0 com.android.settings/.Settings t42}
+"""
+
+ANDROID_10_TRANSITION = """\
+  mCurrentFocus=null
+  mFocusedApp=AppWindowToken{9a8b7c6 token=Token{2b3c4d5 ActivityRecord{6e7f8a9 u0 com.tencent.mm/.ui.LauncherUI t7}}}
+    mAppTransitionState=APP_STATE_RUNNING
+--activity--
+    mResumedActivity: ActivityRecord{6e7f8a9 u0 com.tencent.mm/.ui.LauncherUI t7}
+"""
+
+ANDROID_12 = """\
+  mCurrentFocus=Window{c0ffee1 u0 com.android.chrome/com.google.android.apps.chrome.Main}
+  mFocusedApp=ActivityRecord{a1b2c3d u0 com.android.chrome/com.google.android.apps.chrome.Main t105}
+    mAppTransitionState=APP_STATE_IDLE
+--activity--
+    topResumedActivity=ActivityRecord{a1b2c3d u0 com.android.chrome/com.google.android.apps.chrome.Main t105}
+      ResumedActivity: ActivityRecord{a1b2c3d u0 com.android.chrome/com.google.android.apps.chrome.Main t105}
+"""
+
+ANDROID_14_SPLIT_RESUMED = """\
+  mCurrentFocus=Window{4d3c2b1 u0 com.example.notes/com.example.notes.EditActivity}
+  mFocusedApp=ActivityRecord{7f6e5d4 u0 com.example.notes/.EditActivity t212}
+--activity--
+      ResumedActivity: ActivityRecord{7f6e5d4 u0 com.example.notes/.EditActivity t212}
+"""
+
+KEYGUARD_ANDROID_12 = """\
+  mCurrentFocus=Window{b16b00b u0 NotificationShade}
+  mFocusedApp=ActivityRecord{e5d4c3b u0 com.google.android.apps.nexuslauncher/.NexusLauncherActivity t3}
+    mAppTransitionState=APP_STATE_IDLE
+--activity--
+    topResumedActivity=ActivityRecord{e5d4c3b u0 com.google.android.apps.nexuslauncher/.NexusLauncherActivity t3}
+"""
+
+KEYGUARD_ANDROID_9 = """\
+  mCurrentFocus=Window{2c3d4e5 u0 StatusBar}
+  mFocusedApp=null
+    mAppTransitionState=APP_STATE_IDLE
+--activity--
+"""
+
+IME_VISIBLE = """\
+  mCurrentFocus=Window{8899aab u0 InputMethod}
+  mFocusedApp=ActivityRecord{1122334 u0 com.tencent.mm/.plugin.webview.ui.tools.WebViewUI t19}
+    mAppTransitionState=APP_STATE_IDLE
+--activity--
+    topResumedActivity=ActivityRecord{1122334 u0 com.tencent.mm/.plugin.webview.ui.tools.WebViewUI t19}
+"""
+
+CASES = [
+    ("android 9", ANDROID_9, {
+        "focus": "com.android.settings/com.android.settings.Settings",
+        "focused_app": "com.android.settings/com.android.settings.Settings",
+        "resumed_activity": "com.android.settings/com.android.settings.Settings",
+        "transition": "APP_STATE_IDLE", "package": "com.android.settings", "idle": True}),
+    ("android 10 transition running", ANDROID_10_TRANSITION, {
+        "focus": None,
+        "focused_app": "com.tencent.mm/com.tencent.mm.ui.LauncherUI",
+        "resumed_activity": "com.tencent.mm/com.tencent.mm.ui.LauncherUI",
+        "transition": "APP_STATE_RUNNING", "package": "com.tencent.mm", "idle": False}),
+    ("android 12", ANDROID_12, {
+        "focus": "com.android.chrome/com.google.android.apps.chrome.Main",
+        "focused_app": "com.android.chrome/com.google.android.apps.chrome.Main",
+        "resumed_activity": "com.android.chrome/com.google.android.apps.chrome.Main",
+        "transition": "APP_STATE_IDLE", "package": "com.android.chrome", "idle": True}),
+    ("android 14 without transition state", ANDROID_14_SPLIT_RESUMED, {
+        "focus": "com.example.notes/com.example.notes.EditActivity",
+        "focused_app": "com.example.notes/com.example.notes.EditActivity",
+        "resumed_activity": "com.example.notes/com.example.notes.EditActivity",
+        "transition": None, "package": "com.example.notes", "idle": True}),
+    ("keyguard android 12", KEYGUARD_ANDROID_12, {
+        "focus": "NotificationShade",
+        "focused_app": "com.google.android.apps.nexuslauncher/com.google.android.apps.nexuslauncher.NexusLauncherActivity",
+        "resumed_activity": "com.google.android.apps.nexuslauncher/com.google.android.apps.nexuslauncher.NexusLauncherActivity",
+        "transition": "APP_STATE_IDLE", "package": "com.google.android.apps.nexuslauncher", "idle": True}),
+    ("keyguard android 9", KEYGUARD_ANDROID_9, {
+        "focus": "StatusBar", "focused_app": None, "resumed_activity": None,
+        "transition": "APP_STATE_IDLE", "package": None, "idle": True}),
+    ("ime visible", IME_VISIBLE, {
+        "focus": "InputMethod",
+        "focused_app": "com.tencent.mm/com.tencent.mm.plugin.webview.ui.tools.WebViewUI",
+        "resumed_activity": "com.tencent.mm/com.tencent.mm.plugin.webview.ui.tools.WebViewUI",
+        "transition": "APP_STATE_IDLE", "package": "com.tencent.mm", "idle": True}),
+]
+
+
+def expect(name, condition, errors, detail=""):
+    print(f"{'ok  ' if condition else 'FAIL'} {name} {detail}")
+    if not condition:
+        errors.append(name)
+
+
+class FakeProbe:
+    """wait_for_transition 返回给定的结果，不访问设备"""
+
+    def __init__(self, changed):
+        self.changed = changed
+
+    def snapshot(self):
+        return UiState("com.pkg/com.pkg.Main", "com.pkg/com.pkg.Main", "com.pkg/com.pkg.Main", "APP_STATE_IDLE")
+
+    def wait_for_transition(self, before, action_type):
+        after = before if not self.changed else UiState("com.other/com.other.Main")
+        return TransitionResult(action_type, before, after, 0.4, self.changed, True)
+
+
+class FakeSettler:
+    def __init__(self):
+        self.waits = []
+
+    def wait(self, action_type):
+        self.waits.append(action_type)
+        return f"settled after {action_type}"
+
+
+def main():
+    errors = []
+    for name, text, fields in CASES:
+        state = parse_probe_output(text)
+        got = {key: getattr(state, key) for key in fields}
+        expect(name, got == fields, errors, "" if got == fields else f"got {got}")
+
+    focus, focused_app, transition = parse_window_dump(ANDROID_9.split("--activity--")[0])
+    expect("window dump alone", (focus, transition) == ("com.android.settings/com.android.settings.Settings",
+                                                         "APP_STATE_IDLE"), errors)
+    expect("activity dump without resumed activity", parse_activity_dump("") is None, errors)
+    expect("same screen compares equal", parse_probe_output(ANDROID_12) == parse_probe_output(ANDROID_12), errors)
+    expect("keyguard differs from unlocked launcher",
+           parse_probe_output(KEYGUARD_ANDROID_12).key() != parse_probe_output(ANDROID_12).key(), errors)
+
+    # press_back 没有引起焦点变化 (应用内返回): 仍要等画面稳定；焦点变化并空闲时不需要
+    adb_path = register_backend("check-ui-state", SimulatedDevice(synthetic_graph(2)))
+    for changed, expected in ((False, ["press_back"]), (True, [])):
+        settler = FakeSettler()
+        execute_action("press_back()", adb_path, settler=settler, probe=FakeProbe(changed))
+        expect(f"press_back with focus change={changed} settles by image: {bool(expected)}",
+               settler.waits == expected, errors, str(settler.waits))
+    unregister_backend(adb_path)
+
+    if errors:
+        print(f"FAILED: {len(errors)} checks")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
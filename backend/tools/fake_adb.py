@@ -0,0 +1,270 @@
+"""
+本地假 adb server，实现 adb 客户端协议中本项目用到的部分
+(host:version / host:devices / host:transport / shell: / exec: / sync:)，
+用于在没有手机的情况下测试和压测 MobileAgent.adb_client。
+
+    python tools/fake_adb.py --port 5038 --serial emulator-5554
+"""
+import argparse
+import os
+import re
+import socket
+import struct
+import sys
+import threading
+import time
+import zlib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MobileAgent.screen import run_thumbnail_command
+
+ADB_SERVER_VERSION = 41
+
+
+def make_png(width, height, rgb=(255, 255, 255)):
+    """不依赖 PIL 生成纯色 PNG"""
+    def chunk(tag, data):
+        body = tag + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xFFFFFFFF)
+
+    row = b"\x00" + bytes(rgb) * width
+    raw = row * height
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr)
+            + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b""))
+
+
+class FakeDevice:
+    """
+    假设备: 记录收到的命令，对 screencap 返回纯色截图 (-p 为 PNG，否则为原始 framebuffer)，
+    input / am 等命令只记录不执行。
+    """
+
+    def __init__(self, serial, width=1080, height=2340, command_latency=0.0):
+        self.serial = serial
+        self.width = width
+        self.height = height
+        self.command_latency = command_latency
+        self.color = (255, 255, 255)
+        self.launcher = "com.android.launcher3/com.android.launcher3.Launcher"
+        self.focus = self.launcher
+        self.files = {}
+        self.commands = []
+        self._lock = threading.Lock()
+
+    def screen_png(self):
+        return make_png(self.width, self.height, self.color)
+
+    def screen_raw(self):
+        # 与 Android 9+ 一致: 宽 高 格式(RGBA_8888) dataspace + RGBA 像素
+        header = struct.pack("<IIII", self.width, self.height, 1, 0)
+        return header + (bytes(self.color) + b"\xff") * (self.width * self.height)
+
+    def dumpsys(self):
+        # 与 ui_state.PROBE_COMMAND 在设备端 grep 后的输出格式一致
+        return (f"  mCurrentFocus=Window{{1a2b3c u0 {self.focus}}}\n"
+                f"  mFocusedApp=ActivityRecord{{4d5e6f u0 {self.focus} t7}}\n"
+                f"  mAppTransitionState=APP_STATE_IDLE\n"
+                f"--activity--\n"
+                f"    mResumedActivity: ActivityRecord{{4d5e6f u0 {self.focus} t7}}\n")
+
+    def run(self, command):
+        with self._lock:
+            self.commands.append(command)
+        if self.command_latency:
+            time.sleep(self.command_latency)
+        args = command.split()
+        if not args:
+            return b""
+        if args[0] == "screencap" and "|" in args:
+            # 界面稳定检测的低分辨率截图 (screen.thumbnail_command)
+            return run_thumbnail_command(command, self.screen_raw()) or b""
+        if args[0] == "screencap":
+            data = self.screen_png() if "-p" in args else self.screen_raw()
+            paths = [a for a in args[1:] if not a.startswith("-")]
+            if paths:
+                self.files[paths[0]] = data
+                return b""
+            return data
+        if args[0] == "am" and "android.intent.category.HOME" in args:
+            self.focus = self.launcher
+        elif args[0] == "monkey" and "-p" in args:
+            package = args[args.index("-p") + 1]
+            self.focus = f"{package}/{package}.MainActivity"
+        if args[0] == "dumpsys":
+            return self.dumpsys().encode()
+        if args[0] == "wm" and args[1:2] == ["size"]:
+            return f"Physical size: {self.width}x{self.height}\n".encode()
+        if args[0] == "echo":
+            return (" ".join(args[1:]) + "\n").encode()
+        return b""
+
+
+_SHELL_LINE = re.compile(r'^\( (.*) \) </dev/null 2>&1; echo "(\S+?)\$\?"$')
+
+
+class FakeAdbServer:
+    def __init__(self, devices, host="127.0.0.1", port=0):
+        self.devices = {d.serial: d for d in devices}
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(64)
+        self.host, self.port = self.sock.getsockname()
+        self.connections = 0
+        # 故障注入: 执行完接下来的 drop_after_run 条 shell 命令后不回复直接断开 (模拟命令已送达后的连接重置)
+        self.drop_after_run = 0
+        self._shells = []
+        self._thread = None
+        self._closed = False
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._closed = True
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    def close_shells(self):
+        """断开所有常驻 shell 通道 (模拟设备重连 / adb server 重启后通道失效)"""
+        shells, self._shells = self._shells, []
+        for conn in shells:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def adb_path(self, serial):
+        return f"adb -P {self.port} -s {serial}"
+
+    def _serve(self):
+        while not self._closed:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    @staticmethod
+    def _recv_exact(conn, n):
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = conn.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("client closed")
+            buf += chunk
+        return bytes(buf)
+
+    def _read_request(self, conn):
+        length = int(self._recv_exact(conn, 4), 16)
+        return self._recv_exact(conn, length).decode("utf-8")
+
+    @staticmethod
+    def _fail(conn, message):
+        data = message.encode("utf-8")
+        conn.sendall(b"FAIL" + b"%04x" % len(data) + data)
+
+    @staticmethod
+    def _okay_payload(conn, text):
+        data = text.encode("utf-8")
+        conn.sendall(b"OKAY" + b"%04x" % len(data) + data)
+
+    def _handle(self, conn):
+        try:
+            device = None
+            while True:
+                request = self._read_request(conn)
+                if request == "host:version":
+                    self._okay_payload(conn, "%04x" % ADB_SERVER_VERSION)
+                    return
+                if request == "host:devices":
+                    self._okay_payload(conn, "".join(f"{s}\tdevice\n" for s in self.devices))
+                    return
+                if request.startswith("host:transport"):
+                    if request == "host:transport-any":
+                        device = next(iter(self.devices.values()), None)
+                    else:
+                        device = self.devices.get(request.split(":", 2)[2])
+                    if device is None:
+                        self._fail(conn, "device not found")
+                        return
+                    conn.sendall(b"OKAY")
+                    continue
+                if device is None:
+                    self._fail(conn, "no transport selected")
+                    return
+                conn.sendall(b"OKAY")
+                if request == "shell:sh":
+                    self._interactive_shell(conn, device)
+                elif request.startswith("shell:") or request.startswith("exec:"):
+                    conn.sendall(device.run(request.split(":", 1)[1]))
+                elif request == "sync:":
+                    self._sync(conn, device)
+                return
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            conn.close()
+
+    def _interactive_shell(self, conn, device):
+        self._shells.append(conn)
+        buf = b""
+        while True:
+            chunk = conn.recv(65536)
+            if not chunk:
+                return
+            buf += chunk
+            while b"\n" in buf:
+                line, buf = buf.split(b"\n", 1)
+                match = _SHELL_LINE.match(line.decode("utf-8"))
+                if match is None:
+                    continue
+                output = device.run(match.group(1))
+                if self.drop_after_run > 0:
+                    self.drop_after_run -= 1
+                    return
+                conn.sendall(output + match.group(2).encode("utf-8") + b"0\n")
+
+    def _sync(self, conn, device):
+        while True:
+            header = self._recv_exact(conn, 8)
+            tag, length = header[:4], struct.unpack("<I", header[4:])[0]
+            if tag == b"QUIT":
+                return
+            path = self._recv_exact(conn, length).decode("utf-8")
+            if tag != b"RECV":
+                msg = f"unsupported sync command {tag!r}".encode()
+                conn.sendall(b"FAIL" + struct.pack("<I", len(msg)) + msg)
+                return
+            data = device.files.get(path)
+            if data is None:
+                msg = f"remote object '{path}' does not exist".encode()
+                conn.sendall(b"FAIL" + struct.pack("<I", len(msg)) + msg)
+                return
+            for i in range(0, len(data), 65536):
+                part = data[i:i + 65536]
+                conn.sendall(b"DATA" + struct.pack("<I", len(part)) + part)
+            conn.sendall(b"DONE" + struct.pack("<I", 0))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=5038)
+    parser.add_argument("--serial", action="append", default=None)
+    args = parser.parse_args()
+    serials = args.serial or ["emulator-5554"]
+    server = FakeAdbServer([FakeDevice(s) for s in serials], port=args.port).start()
+    print(f"fake adb server listening on {server.host}:{server.port}, devices: {', '.join(serials)}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+        sys.exit(0)
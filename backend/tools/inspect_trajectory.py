@@ -0,0 +1,69 @@
+"""
+查看 MobileAgent/trajectory.py 记录的轨迹:
+
+    python tools/inspect_trajectory.py list                        # 所有会话
+    python tools/inspect_trajectory.py show <会话id> [步数]        # 会话各步摘要 / 单步完整记录
+    python tools/inspect_trajectory.py export <会话id> <步数> out.png
+    python tools/inspect_trajectory.py stats                       # 存储大小与截图去重情况
+
+会话 id 可以只写前几位。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MobileAgent.trajectory import TrajectoryStore, DEFAULT_DIR
+
+
+def resolve(store, prefix):
+    matches = [s for s, _ in store.sessions() if s.startswith(prefix)]
+    if len(matches) != 1:
+        sys.exit(f"{len(matches)} sessions match {prefix!r}")
+    return matches[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", default=os.getenv("TRAJECTORY_DIR", DEFAULT_DIR))
+    parser.add_argument("command", choices=["list", "show", "export", "stats"])
+    parser.add_argument("args", nargs="*")
+    args = parser.parse_args()
+    store = TrajectoryStore(args.dir)
+
+    if args.command == "list":
+        for session, info in store.sessions():
+            started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(info.get("started", 0)))
+            steps = sum(1 for _ in store.steps(session))
+            print(f"{session}  {started}  {info.get('serial') or '-':<16} {steps:3d} steps  {info.get('instruction', '')}")
+
+    elif args.command == "show":
+        session = resolve(store, args.args[0])
+        if len(args.args) > 1:
+            print(json.dumps(store.step(session, int(args.args[1])), ensure_ascii=False, indent=2))
+        else:
+            for record in store.steps(session):
+                total = sum(v for k, v in record.get("timings", {}).items())
+                print(f"step {record['step']:3d}  {record.get('screenshot', '')[:12]}  {len(record.get('commands', [])):2d} adb"
+                      f"  {total:8.0f} ms  {'cached ' if record.get('cached') else ''}{record.get('action')}")
+
+    elif args.command == "export":
+        session = resolve(store, args.args[0])
+        record = store.step(session, int(args.args[1]))
+        if record is None or "screenshot" not in record:
+            sys.exit("no screenshot for this step")
+        with open(args.args[2], "wb") as f:
+            f.write(store.blob(record["screenshot"]))
+        print(f"wrote {args.args[2]}")
+
+    elif args.command == "stats":
+        for name in ("blobs", "steps"):
+            for ext in ("seg", "idx"):
+                path = os.path.join(args.dir, f"{name}.{ext}")
+                size = os.path.getsize(path) if os.path.exists(path) else 0
+                print(f"{name}.{ext:<4} {size / 1024:10.1f} KB")
+        shots = [r.get("screenshot") for s, _ in store.sessions() for r in store.steps(s) if r.get("screenshot")]
+        print(f"{len(shots)} steps with screenshots, {len(set(shots))} unique")
@@ -0,0 +1,232 @@
+"""
+服务压测: 并发驱动 FastAPI 服务 (service/main.py) 的多个会话，统计步延迟和接口延迟的 p50/p95/p99 以及吞吐。
+默认在进程内启动整套环境: 模拟设备 (MobileAgent.simulator.SimulatedFleet，每个会话一台)、
+脚本化的假模型服务 (tools/mock_model_server.py，script="history"，每个会话按自己的步数拿到输出) 和 uvicorn 服务，
+不需要手机和模型 api。会话 0 走原来的单设备接口 (/api/start、/api/status、/api/screenshot)，
+其余会话走 /api/devices/{serial}/...；每个会话另有一个线程按 --screenshot-interval 拉取截图，模拟前端。
+也可以用 --url 压测已经在运行的服务 (此时设备和模型由该服务的配置决定)。
+
+    python tools/load_test.py --sessions 8 --tasks 3 --screens 5 --model-latency 0.3 --tokens-per-sec 50
+    python tools/load_test.py --url http://127.0.0.1:8000 --sessions 4 --duration 120
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "service"))
+
+from tools.bench_loop import chain_outputs
+from tools.mock_model_server import MockModelServer
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class Recorder:
+    """按名字收集延迟样本 (毫秒) 和错误数，多线程共用"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, ms):
+        with self._lock:
+            self.samples.setdefault(name, []).append(ms)
+
+    def error(self, name):
+        with self._lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def report(self):
+        print(f"{'metric':<18} {'count':>6} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for name in sorted(set(self.samples) | set(self.errors)):
+            values = self.samples.get(name, [])
+            print(f"{name:<18} {len(values):6d} {self.errors.get(name, 0):4d} {percentile(values, 0.5):8.1f} "
+                  f"{percentile(values, 0.95):8.1f} {percentile(values, 0.99):8.1f} {max(values, default=0):8.1f}")
+
+
+class Session:
+    """一个会话: 设置指令、启动、轮询状态直到任务结束；步数每增加一次记一个步延迟样本"""
+
+    def __init__(self, base_url, serial, recorder, instruction, poll_interval):
+        self.base_url = base_url
+        self.serial = serial
+        # serial 为 None 时使用原来的单设备接口
+        self.prefix = f"/api/devices/{serial}" if serial else "/api"
+        self.recorder = recorder
+        self.instruction = instruction
+        self.poll_interval = poll_interval
+        self.steps = 0
+        self.tasks = 0
+
+    def call(self, name, method, path, body=None, timeout=30):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(self.base_url + self.prefix + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                payload = response.read()
+                content_type = response.headers.get("Content-Type", "")
+        except (urllib.error.URLError, OSError):
+            self.recorder.error(name)
+            return None
+        self.recorder.add(name, (time.perf_counter() - start) * 1000)
+        return json.loads(payload) if content_type.startswith("application/json") else payload
+
+    def run_task(self, deadline):
+        self.call("instruction", "POST", "/instruction", {"instruction": self.instruction})
+        status = self.call("status", "GET", "/status") or {}
+        last_steps = status.get("throughput", {}).get("total_steps", 0)
+        started = last_step = time.perf_counter()
+        self.call("start", "POST", "/start")
+        while time.perf_counter() < deadline:
+            time.sleep(self.poll_interval)
+            status = self.call("status", "GET", "/status")
+            if status is None:
+                continue
+            total = status["throughput"]["total_steps"]
+            if total > last_steps:
+                now = time.perf_counter()
+                # 一次轮询间隔内完成多步时平均分摊
+                for _ in range(total - last_steps):
+                    self.recorder.add("step", (now - last_step) * 1000 / (total - last_steps))
+                self.steps += total - last_steps
+                last_steps, last_step = total, now
+            if not status["running"]:
+                self.recorder.add("task", (time.perf_counter() - started) * 1000)
+                self.tasks += 1
+                return True
+        self.call("stop", "POST", "/stop")
+        return False
+
+    def poll_screenshots(self, stop, interval):
+        while not stop.is_set():
+            self.call("screenshot", "GET", "/screenshot")
+            stop.wait(interval)
+
+
+def start_local_service(args):
+    """进程内启动模拟设备、假模型服务和 uvicorn，返回 (服务地址, serial 列表, 清理函数)"""
+    from MobileAgent.device_backend import register_backend
+    from MobileAgent.simulator import SimulatedFleet, synthetic_graph
+
+    fleet = SimulatedFleet.from_graph(synthetic_graph(args.screens), args.sessions,
+                                      capture_ms=args.capture_ms, input_ms=args.input_ms)
+    token_delay = 1.0 / args.tokens_per_sec if args.tokens_per_sec else 0.0
+    model = MockModelServer(outputs=chain_outputs(args.screens), latency=args.model_latency, token_delay=token_delay,
+                            script="history", error_rate=args.error_rate).start()
+    # service 在 import 时按环境变量创建 runner，必须先设置好
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    os.environ["ADB_PATH"] = register_backend("load-test", fleet)
+    os.environ["UITARS_API_URL"] = model.url
+    os.environ["TRAJECTORY_DIR"] = os.path.join(workdir, "trajectories")
+
+    import uvicorn
+    import main as service
+
+    # 每个 runner 的截图等文件放到临时目录
+    from MobileAgent.workspace import Workspace
+    service.runner.workspace = Workspace(os.path.join(workdir, "default"))
+    service.registry.discover()
+    for serial, runner in service.registry.runners.items():
+        runner.workspace = Workspace(os.path.join(workdir, serial))
+
+    server = uvicorn.Server(uvicorn.Config(service.app, host="127.0.0.1", port=args.port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    # 会话 0 使用默认 runner (未指定 serial，即第一台设备)，其余会话各用一台设备
+    serials = [None] + sorted(fleet.members)[1:]
+
+    def cleanup():
+        print(f"mock model: {model.stats()}")
+        print(f"devices: {fleet.stats}")
+        server.should_exit = True
+        thread.join()
+        model.stop()
+
+    return f"http://127.0.0.1:{port}", serials, cleanup
+
+
+def remote_serials(base_url, sessions):
+    with urllib.request.urlopen(base_url + "/api/devices", timeout=30) as response:
+        devices = [d["serial"] for d in json.loads(response.read())["devices"] if d["online"]]
+    return [None] + devices[:sessions - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None, help="压测已在运行的服务；不指定时在进程内启动")
+    parser.add_argument("--sessions", type=int, default=4, help="并发会话数")
+    parser.add_argument("--tasks", type=int, default=2, help="每个会话执行的任务数")
+    parser.add_argument("--duration", type=float, default=300.0, help="最长运行时间 (秒)")
+    parser.add_argument("--instruction", default="依次点击下一步直到最后一页")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="状态轮询间隔 (秒)")
+    parser.add_argument("--screenshot-interval", type=float, default=0.5, help="截图拉取间隔 (秒)，0 为不拉取")
+    parser.add_argument("--port", type=int, default=0)
+    # 以下只用于进程内模式
+    parser.add_argument("--screens", type=int, default=5, help="每个任务的步数 (不超过 history_n + 1 时脚本输出严格对应)")
+    parser.add_argument("--capture-ms", type=float, default=50.0)
+    parser.add_argument("--input-ms", type=float, default=20.0)
+    parser.add_argument("--model-latency", type=float, default=0.2, help="模型首 token 前的延迟 (秒)")
+    parser.add_argument("--tokens-per-sec", type=float, default=100.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="假模型随机返回 503 的概率")
+    args = parser.parse_args()
+
+    if args.url:
+        base_url, serials, cleanup = args.url.rstrip("/"), remote_serials(args.url.rstrip("/"), args.sessions), None
+    else:
+        base_url, serials, cleanup = start_local_service(args)
+
+    recorder = Recorder()
+    sessions = [Session(base_url, serial, recorder, args.instruction, args.poll_interval) for serial in serials]
+    stop = threading.Event()
+    deadline = time.perf_counter() + args.duration
+
+    def drive(session):
+        for _ in range(args.tasks):
+            if not session.run_task(deadline):
+                break
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=drive, args=(s,)) for s in sessions]
+    if args.screenshot_interval > 0:
+        pollers = [threading.Thread(target=s.poll_screenshots, args=(stop, args.screenshot_interval), daemon=True)
+                   for s in sessions]
+    else:
+        pollers = []
+    for thread in workers + pollers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for thread in pollers:
+        thread.join()
+
+    steps = sum(s.steps for s in sessions)
+    tasks = sum(s.tasks for s in sessions)
+    print(f"{len(sessions)} sessions: {tasks} tasks / {steps} steps in {elapsed:.1f} s "
+          f"-> {steps / elapsed:.2f} steps/s, {tasks / elapsed * 3600:.0f} tasks/h")
+    recorder.report()
+    if cleanup is not None:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""
+本地假模型服务，兼容 OpenAI 风格的 /v1/chat/completions，
+可以注入错误 (指定状态码、Retry-After、直接断开连接)，用于测试重试和熔断逻辑；
+请求带 "stream": true 时按 token_delay 逐块返回 SSE，并统计客户端提前断开 (取消生成) 的次数。
+模拟 vLLM 的自动前缀缓存: 按 block_size 个 token 一块计算链式哈希，与之前请求相同的前缀块视为命中，
+首 token 前等待 latency + 未命中 token 数 * prefill_ms_per_token，usage 中返回 prompt_tokens_details.cached_tokens。
+脚本化输出: script="cycle" 时所有请求按顺序轮流返回 outputs；script="history" 时按请求中 assistant 消息的数量
+(即该会话已经进行的步数) 选择输出，多个会话并发时各自按自己的步数拿到输出。
+error_rate 按概率随机返回 503。GET /v1/models 和 /health 用于客户端探活。
+
+    python tools/mock_model_server.py --port 8001
+    python tools/mock_model_server.py --outputs script.jsonl --script history --tokens-per-sec 40 --error-rate 0.05
+"""
+import argparse
+import base64
+import collections
+import hashlib
+import io
+import json
+import random
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_OUTPUT = "Thought: 等待页面加载\nAction: wait()"
+IMAGE_PATCH = 28  # Qwen2.5-VL: 每 28x28 像素对应一个视觉 token
+
+
+def _image_tokens(url):
+    """按解码后的图片尺寸估算视觉 token 数"""
+    try:
+        from PIL import Image
+        data = base64.b64decode(url.split(",", 1)[1])
+        width, height = Image.open(io.BytesIO(data)).size
+        return max(1, (width // IMAGE_PATCH) * (height // IMAGE_PATCH))
+    except Exception:
+        return max(1, len(url) // 1024)
+
+
+class PrefixCache:
+    """近似的 token 化 + vLLM 风格的链式块哈希，LRU 保留最近 capacity 个块"""
+
+    def __init__(self, block_size=16, capacity=200000):
+        self.block_size = block_size
+        self.capacity = capacity
+        self._blocks = collections.OrderedDict()
+        self._image_sizes = {}
+
+    def tokenize(self, messages):
+        tokens = []
+        for message in messages:
+            tokens.append(("role", message.get("role")))
+            content = message.get("content")
+            parts = content if isinstance(content, list) else [{"type": "text", "text": content}]
+            for part in parts:
+                if part.get("type") == "image_url":
+                    url = part["image_url"]["url"]
+                    digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+                    if digest not in self._image_sizes:
+                        self._image_sizes[digest] = _image_tokens(url)
+                    tokens.extend((digest, i) for i in range(self._image_sizes[digest]))
+                else:
+                    text = part.get("text")
+                    if not isinstance(text, str):
+                        text = json.dumps(text, ensure_ascii=False)
+                    # 约 3 个字符一个 token
+                    tokens.extend(text[i:i + 3] for i in range(0, len(text), 3))
+        return tokens
+
+    def lookup(self, messages):
+        """返回 (prompt_tokens, cached_tokens)，并把本次请求的完整块放入缓存"""
+        tokens = self.tokenize(messages)
+        cached, parent, hit = 0, None, True
+        for i in range(0, len(tokens) - self.block_size + 1, self.block_size):
+            parent = hash((parent, tuple(tokens[i:i + self.block_size])))
+            if hit and parent in self._blocks:
+                cached += self.block_size
+            else:
+                hit = False
+            self._blocks[parent] = None
+            self._blocks.move_to_end(parent)
+        while len(self._blocks) > self.capacity:
+            self._blocks.popitem(last=False)
+        return len(tokens), cached
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # 每个 TCP 连接一个 handler 实例，keep-alive 的后续请求不再经过这里
+        with self.server.owner._lock:
+            self.server.owner.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_stream(self, server, output, truncate_after=None):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        sent = 0
+        try:
+            for i in range(0, len(output), server.chunk_chars):
+                if sent == truncate_after:
+                    # 发出几个增量后不发结束块直接断开，客户端读到一半得到 ChunkedEncodingError
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    server.on_stream_end(sent, cancelled=False)
+                    return
+                time.sleep(server.token_delay)
+                event = {"id": f"mock-{server.requests}", "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": {"content": output[i:i + server.chunk_chars]},
+                                      "finish_reason": None}]}
+                self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                sent += 1
+            usage = {"id": f"mock-{server.requests}", "object": "chat.completion.chunk", "choices": [],
+                     "usage": self.usage}
+            self._write_chunk(f"data: {json.dumps(usage)}\n\n".encode("utf-8"))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+            server.on_stream_end(sent, cancelled=False)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端拿到 Action 后关闭了连接，相当于取消剩余生成
+            self.close_connection = True
+            server.on_stream_end(sent, cancelled=True)
+
+    def do_GET(self):
+        server = self.server.owner
+        if self.path.rstrip("/") == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": server.model, "object": "model"}]})
+        elif self.path.rstrip("/") == "/health":
+            self._send_json(200, dict(server.stats(), status="ok"))
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def do_POST(self):
+        server = self.server.owner
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        fault = server.on_request(request)
+        output = server.next_output(request)
+        truncate_after = None
+        if isinstance(fault, tuple) and fault[0] == "truncate":
+            # 只对流式请求生效
+            truncate_after, fault = (fault[1] if request.get("stream") else None), None
+        if fault is None:
+            self.usage = server.on_prefill(request, output)
+        elif server.latency:
+            time.sleep(server.latency)
+        if fault == "drop":
+            # 不返回任何响应直接断开，客户端会得到 ConnectionError
+            self.close_connection = True
+            self.connection.close()
+            return
+        if fault is not None:
+            status, retry_after = fault
+            headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+            self._send_json(status, {"error": {"message": f"injected {status}"}}, headers)
+            return
+        if request.get("stream"):
+            self._send_stream(server, output, truncate_after)
+            return
+        self._send_json(200, {
+            "id": f"mock-{server.requests}",
+            "object": "chat.completion",
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": output},
+                         "finish_reason": "stop"}],
+            "usage": self.usage,
+        })
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端提前关闭流式连接属于正常情况，不打印堆栈
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class MockModelServer:
+    def __init__(self, outputs=None, host="127.0.0.1", port=0, latency=0.0, token_delay=0.02, chunk_chars=4,
+                 prefill_ms_per_token=0.0, prefix_caching=True, block_size=16, script="cycle", error_rate=0.0,
+                 model="mock", seed=0):
+        self.outputs = list(outputs or [DEFAULT_OUTPUT])
+        self.script = script
+        self.error_rate = error_rate  # 随机返回 503 的概率
+        self.model = model
+        self.errors_injected = 0
+        self._random = random.Random(seed)
+        self.latency = latency
+        self.prefill_ms_per_token = prefill_ms_per_token  # 每个未命中缓存的 prompt token 的 prefill 耗时
+        self.prefix_cache = PrefixCache(block_size) if prefix_caching else None
+        self.usage_log = []  # 每个请求的 usage
+        self.token_delay = token_delay  # 流式输出每个增量之间的间隔 (秒)
+        self.chunk_chars = chunk_chars  # 每个增量的字符数
+        self.streams = 0
+        self.streams_cancelled = 0
+        self.chunks_sent = 0
+        self.requests = 0
+        self.connections = 0
+        self.request_log = []
+        self._faults = []
+        self._lock = threading.Lock()
+        self.httpd = _Server((host, port), _Handler)
+        self.httpd.owner = self
+        self.host, self.port = self.httpd.server_address
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/v1/chat/completions"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def fail_next(self, count, status=503, retry_after=None):
+        """接下来 count 个请求返回 status 错误"""
+        with self._lock:
+            self._faults.extend([(status, retry_after)] * count)
+
+    def drop_next(self, count):
+        """接下来 count 个请求直接断开连接"""
+        with self._lock:
+            self._faults.extend(["drop"] * count)
+
+    def truncate_next(self, count, after=2):
+        """接下来 count 个流式请求发出 after 个增量后中断 (非流式请求正常返回)"""
+        with self._lock:
+            self._faults.extend([("truncate", after)] * count)
+
+    def clear_faults(self):
+        with self._lock:
+            self._faults.clear()
+
+    def on_request(self, request):
+        with self._lock:
+            self.requests += 1
+            self.request_log.append((time.monotonic(), request))
+            if self._faults:
+                fault = self._faults.pop(0)
+            elif self.error_rate and self._random.random() < self.error_rate:
+                fault = (503, None)
+            else:
+                return None
+            self.errors_injected += 1
+            return fault
+
+    def on_prefill(self, request, output):
+        """模拟 prefill: 计算前缀缓存命中并按未命中的 token 数等待，返回 usage"""
+        with self._lock:
+            if self.prefix_cache is not None:
+                prompt, cached = self.prefix_cache.lookup(request.get("messages", []))
+            else:
+                prompt, cached = len(PrefixCache().tokenize(request.get("messages", []))), 0
+        delay = self.latency + (prompt - cached) * self.prefill_ms_per_token / 1000
+        if delay:
+            time.sleep(delay)
+        completion = len(output) // 3
+        usage = {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion,
+                 "prompt_tokens_details": {"cached_tokens": cached}}
+        with self._lock:
+            self.usage_log.append(usage)
+        return usage
+
+    def on_stream_end(self, sent, cancelled):
+        with self._lock:
+            self.streams += 1
+            self.chunks_sent += sent
+            self.streams_cancelled += int(cancelled)
+
+    def next_output(self, request=None):
+        if self.script == "history" and request is not None:
+            # 会话已经进行的步数 = 请求里模型回复 (assistant) 的条数
+            turns = sum(1 for m in request.get("messages", []) if m.get("role") == "assistant")
+            return self.outputs[min(turns, len(self.outputs) - 1)]
+        with self._lock:
+            return self.outputs[(self.requests - 1) % len(self.outputs)]
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "connections": self.connections, "streams": self.streams,
+                    "streams_cancelled": self.streams_cancelled, "errors_injected": self.errors_injected}
+
+
+def load_outputs(path):
+    """.jsonl 每行一个 JSON 字符串；其他文件每行一个输出，\\n 表示换行"""
+    with open(path, encoding="utf-8") as f:
+        lines = [line.rstrip("\n") for line in f if line.strip()]
+    if path.endswith(".jsonl"):
+        return [json.loads(line) for line in lines]
+    return [line.replace("\\n", "\n") for line in lines]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--tokens-per-sec", type=float, default=None, help="流式输出速度，覆盖 --token-delay")
+    parser.add_argument("--outputs", default=None, help="脚本化的模型输出文件 (.jsonl 或每行一个)")
+    parser.add_argument("--script", choices=["cycle", "history"], default="cycle")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--prefill-ms", type=float, default=0.0, help="每个未命中缓存的 prompt token 的 prefill 耗时")
+    parser.add_argument("--no-prefix-caching", action="store_true")
+    parser.add_argument("--fail", type=int, default=0, help="前 N 个请求返回 --status")
+    parser.add_argument("--status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, default=None)
+    args = parser.parse_args()
+
+    token_delay = 1.0 / args.tokens_per_sec if args.tokens_per_sec else args.token_delay
+    outputs = load_outputs(args.outputs) if args.outputs else None
+    server = MockModelServer(outputs=outputs, host=args.host, port=args.port, latency=args.latency,
+                             token_delay=token_delay, prefill_ms_per_token=args.prefill_ms,
+                             prefix_caching=not args.no_prefix_caching, script=args.script, error_rate=args.error_rate)
+    if args.fail:
+        server.fail_next(args.fail, args.status, args.retry_after)
+    print(f"Mock model server on {server.url}")
+    try:
+        server.start()._thread.join()
+    except KeyboardInterrupt:
+        server.stop()